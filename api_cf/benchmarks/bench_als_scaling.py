@@ -0,0 +1,71 @@
+"""
+Benchmark: parallel ALS trainer scaling with the number of worker processes.
+
+Runs a fixed number of ALS iterations (no early stopping) on synthetic
+ratings for each worker count and reports seconds per iteration and speedup
+over one worker. It also checks that folding a training user's ratings in
+with the recommender's fold_in.compute_user_profiles reproduces that user's
+trained bias and vector.
+
+    python bench_als_scaling.py --workers 1 4 16 --users 100000 --items 10000 --ratings 5000000
+
+Speedups need as many free cores as workers; the CPU count is printed.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "offline-training"))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "recommender"))
+from als import fit_als  # noqa: E402
+from bench_training import synthetic_ratings  # noqa: E402
+from fold_in import ItemIdIndex, compute_user_profiles  # noqa: E402
+
+
+def fold_in_error(model, train_df, n_users=200, seed=42):
+    """Max abs difference between fold-in profiles and the trained user rows."""
+    rng = np.random.default_rng(seed)
+    sample = rng.choice(len(model.user_ids), size=min(n_users, len(model.user_ids)), replace=False)
+    by_user = train_df.groupby("user_id")
+    ratings_batch = [list(zip(g["game_id"], g["rating"])) for g in
+                     (by_user.get_group(model.user_ids[u]) for u in sample)]
+    b_u, U = compute_user_profiles(ratings_batch, ItemIdIndex(model.item_ids.tolist()), model.Q, model.bi,
+                                   model.global_mean, model.reg_all, model.Q.shape[1])
+    return float(max(np.abs(b_u - model.bu[sample]).max(), np.abs(U - model.P[sample]).max()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--items", type=int, default=3000)
+    parser.add_argument("--ratings", type=int, default=500000)
+    parser.add_argument("--iters", type=int, default=3)
+    parser.add_argument("--reg", type=float, default=10.0)
+    args = parser.parse_args()
+
+    train_df, valid_df, _ = synthetic_ratings(args.users, args.items, args.ratings)
+    results = {"cpu_count": os.cpu_count(), "train_ratings": len(train_df), "iters": args.iters, "runs": []}
+    base = None
+    for n_workers in args.workers:
+        start = time.perf_counter()
+        # patience > iters: always run every iteration
+        model = fit_als(train_df, valid_df, reg=args.reg, max_iters=args.iters, patience=args.iters + 1,
+                        n_workers=n_workers, verbose=False)
+        per_iter = (time.perf_counter() - start) / args.iters
+        base = base or per_iter
+        results["runs"].append({
+            "workers": n_workers,
+            "seconds_per_iter": round(per_iter, 3),
+            "speedup": round(base / per_iter, 2),
+            "fold_in_max_abs_diff": fold_in_error(model, train_df),
+        })
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Micro-benchmark: per-request CB -> CF score alignment and rated-item exclusion.
+
+Compares the old per-game `df_games.iloc` + dict lookup loop against the
+precomputed CB row -> CF row scatter used by app.recommend.
+
+    python bench_blend.py --games 21925 --cf-items 12000 --ratings 50
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "recommender"))
+from fold_in import ItemIdIndex  # noqa: E402
+
+
+def blend_loop(cb_sims, df_games, rawid_to_cfidx, rated_item_ids, n_items):
+    cb_scores = np.zeros(n_items, dtype=np.float64)
+    for row_idx, sim in enumerate(cb_sims):
+        raw_id = df_games.iloc[row_idx]["BGGId"]
+        cf_idx = rawid_to_cfidx.get(raw_id)
+        if cf_idx is not None:
+            cb_scores[cf_idx] = sim
+    hybrid = cb_scores.copy()
+    for raw_id in rated_item_ids:
+        idx = rawid_to_cfidx.get(raw_id)
+        if idx is not None:
+            hybrid[idx] = -np.inf
+    return hybrid
+
+
+def blend_scatter(cb_sims, cb_rows, cf_rows, item_lookup, rated_ids, n_items):
+    cb_scores = np.zeros(n_items, dtype=np.float64)
+    cb_scores[cf_rows] = cb_sims[cb_rows]
+    hybrid = cb_scores.copy()
+    rated_idx = item_lookup.lookup(rated_ids)
+    hybrid[rated_idx[rated_idx >= 0]] = -np.inf
+    return hybrid
+
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--games", type=int, default=21925)
+    parser.add_argument("--cf-items", type=int, default=12000)
+    parser.add_argument("--ratings", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    game_ids = np.arange(1, args.games + 1) * 7
+    df_games = pd.DataFrame({"BGGId": game_ids})
+    item_ids_list = rng.choice(game_ids, size=args.cf_items, replace=False).tolist()
+    rated = rng.choice(item_ids_list, size=args.ratings, replace=False).tolist()
+    cb_sims = rng.random(args.games).astype(np.float32)
+
+    # before: per-request loop
+    rawid_to_cfidx = {raw_id: idx for idx, raw_id in enumerate(item_ids_list)}
+    rated_item_ids = set(rated)
+    before = best_of(lambda: blend_loop(cb_sims, df_games, rawid_to_cfidx,
+                                        rated_item_ids, args.cf_items), args.repeat)
+
+    # after: index arrays built once at model load
+    item_lookup = ItemIdIndex(item_ids_list)
+    cb_to_cf = item_lookup.lookup(game_ids)
+    cb_rows = np.flatnonzero(cb_to_cf >= 0)
+    cf_rows = cb_to_cf[cb_rows]
+    after = best_of(lambda: blend_scatter(cb_sims, cb_rows, cf_rows, item_lookup,
+                                          rated, args.cf_items), args.repeat * 20)
+
+    np.testing.assert_array_equal(
+        blend_loop(cb_sims, df_games, rawid_to_cfidx, rated_item_ids, args.cf_items),
+        blend_scatter(cb_sims, cb_rows, cf_rows, item_lookup, rated, args.cf_items))
+
+    print(f"games={args.games} cf_items={args.cf_items} ratings={args.ratings}")
+    print(f"loop    : {before * 1e3:9.3f} ms/request")
+    print(f"scatter : {after * 1e3:9.3f} ms/request")
+    print(f"speedup : {before / after:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
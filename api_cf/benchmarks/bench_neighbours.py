@@ -0,0 +1,61 @@
+"""
+Build time and peak memory of the item-item neighbour table (neighbours.py)
+on random factors / theme flags, for growing catalogue sizes.
+
+Peak memory is what tracemalloc sees NumPy allocate during the build; the
+dense N x N float32 score matrix it avoids is reported next to it.
+
+    python bench_neighbours.py --items 10000 50000 100000 --factors 50 --k 20
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "offline-training"))
+from neighbours import BLOCK_BUDGET_BYTES, build_item_neighbours  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, nargs="+", default=[10000, 50000, 100000])
+    parser.add_argument("--factors", type=int, default=50)
+    parser.add_argument("--themes", type=int, default=107)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--theme-weight", type=float, default=0.3)
+    parser.add_argument("--block-mb", type=int, default=BLOCK_BUDGET_BYTES // 2**20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    report = []
+    for n_items in args.items:
+        factors = rng.normal(0, 0.1, (n_items, args.factors))
+        themes = (rng.random((n_items, args.themes)) < 0.03).astype(np.float32)
+        item_ids = np.arange(n_items, dtype=np.int64) * 3 + 1
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        ids, scores = build_item_neighbours(factors, item_ids, themes, k=args.k, theme_weight=args.theme_weight,
+                                            block_budget_bytes=args.block_mb * 2**20, verbose=False)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        report.append({
+            "items": n_items,
+            "seconds": elapsed,
+            "peak_mb": peak / 2**20,
+            "dense_nxn_mb": n_items * n_items * 4 / 2**20,
+            "table_mb": (ids.nbytes + scores.nbytes) / 2**20,
+        })
+        print(json.dumps(report[-1]), file=sys.stderr)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""
+Benchmark suite for the recommender service; prints (or writes) one JSON report.
+
+  * micro: fold-in, CB scoring, CF scoring, blend + rated-item exclusion, top-k,
+    each for a single user and for a batch (median time per call and per user)
+  * e2e (Flask test client): sequential /recommend latency percentiles and
+    throughput, /recommend/batch throughput and /similar latency
+  * e2e (local WSGI server): /recommend over HTTP with N concurrent clients
+  * e2e (uvicorn, asgi.py): the same load against the micro-batching variant
+
+The model is synthetic (synthetic.make_model_data) unless --model-data points
+at a real model_data directory; payloads are always synthetic. Compare two
+reports with compare.py.
+
+    python bench_service.py --output before.json
+    python bench_service.py --games 50000 --cf-items 40000 --factors 100 --output big.json
+"""
+import argparse
+import http.client
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "recommender"))
+from synthetic import make_model_data, make_payloads  # noqa: E402
+
+
+def percentiles(samples):
+    samples = np.asarray(samples) * 1e3
+    return {"mean_ms": float(samples.mean()), "p50_ms": float(np.percentile(samples, 50)),
+            "p90_ms": float(np.percentile(samples, 90)), "p99_ms": float(np.percentile(samples, 99)),
+            "max_ms": float(samples.max()), "n": int(len(samples))}
+
+
+def median_time(fn, repeat):
+    fn()   # warm-up
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times))
+
+
+def micro_benchmarks(service, payloads, batch_size, repeat):
+    """Time each scoring stage in isolation on the loaded bundle."""
+    from fold_in import compute_user_profiles
+    from hybrid import blend_into, cf_score_matrix, exclude_rated, top_n_rows
+    from response_cache import LRUCache, cached_cb_scores
+    from service import parse_user
+
+    bundle = service.registry.current
+    cf = bundle.cf
+    results = {}
+    for label, batch in (("single", payloads[:1]), ("batch", payloads[:batch_size])):
+        users = [parse_user(p, bundle.num_checkboxes) for p in batch]
+        ratings = [r for r, _, _ in users]
+        prefs = [p for _, p, _ in users]
+        b_u, U = compute_user_profiles(ratings, cf.item_lookup, cf.item_factors, cf.item_biases,
+                                       cf.global_mean, cf.reg_coeff, cf.n_factors, item_scales=cf.item_scales)
+        rated_rows = [cf.item_lookup.lookup([i for i, _ in r]) for r in ratings]
+        no_cache = LRUCache(0)
+        cb_sims, cb_of_user = cached_cb_scores(no_cache, bundle, prefs)
+        cf_scores = cf_score_matrix(b_u, U, cf.item_factors, cf.item_biases, cf.global_mean, cf.item_scales)
+        hybrid, _ = blend_into(cf_scores.copy(), cb_sims, cb_of_user, [len(r) for r in ratings])
+
+        def blend_and_exclude():
+            # blend_into works in place; the copy is part of the timing
+            h, _ = blend_into(cf_scores.copy(), cb_sims, cb_of_user, [len(r) for r in ratings])
+            exclude_rated(h, rated_rows)
+
+        stages = {
+            "fold_in": lambda: compute_user_profiles(ratings, cf.item_lookup, cf.item_factors, cf.item_biases,
+                                                     cf.global_mean, cf.reg_coeff, cf.n_factors,
+                                                     item_scales=cf.item_scales),
+            "cb_score": lambda: cached_cb_scores(no_cache, bundle, prefs),
+            "cf_score": lambda: cf_score_matrix(b_u, U, cf.item_factors, cf.item_biases, cf.global_mean,
+                                                cf.item_scales),
+            "blend": blend_and_exclude,
+            "top_k": lambda: top_n_rows(hybrid, 20),
+        }
+        results[label] = {}
+        for name, fn in stages.items():
+            seconds = median_time(fn, repeat)
+            results[label][name] = {"ms_per_call": seconds * 1e3, "us_per_user": seconds * 1e6 / len(batch)}
+        results[label]["users"] = len(batch)
+    return results
+
+
+def test_client_benchmarks(flask_app, payloads, batch_size):
+    client = flask_app.test_client()
+    for p in payloads[:10]:   # warm-up
+        client.post("/recommend", json=p)
+
+    latencies = []
+    start = time.perf_counter()
+    for p in payloads:
+        t0 = time.perf_counter()
+        response = client.post("/recommend", json=p)
+        latencies.append(time.perf_counter() - t0)
+        assert response.status_code == 200, response.get_data(as_text=True)
+    elapsed = time.perf_counter() - start
+    single = {**percentiles(latencies), "requests_per_s": len(payloads) / elapsed}
+
+    batch_latencies = []
+    start = time.perf_counter()
+    for lo in range(0, len(payloads), batch_size):
+        t0 = time.perf_counter()
+        response = client.post("/recommend/batch", json={"users": payloads[lo:lo + batch_size]})
+        batch_latencies.append(time.perf_counter() - t0)
+        assert response.status_code == 200
+    elapsed = time.perf_counter() - start
+    batch = {**percentiles(batch_latencies), "batch_size": batch_size, "users_per_s": len(payloads) / elapsed}
+    results = {"recommend": single, "recommend_batch": batch}
+
+    # /similar/<game_id> for the first rated game of every payload
+    game_ids = [p["ratings"][0][0] for p in payloads if p["ratings"]]
+    if game_ids and client.get(f"/similar/{game_ids[0]}").status_code == 200:
+        similar_latencies = []
+        start = time.perf_counter()
+        for game_id in game_ids:
+            t0 = time.perf_counter()
+            response = client.get(f"/similar/{game_id}")
+            similar_latencies.append(time.perf_counter() - t0)
+            assert response.status_code == 200
+        elapsed = time.perf_counter() - start
+        results["similar"] = {**percentiles(similar_latencies), "requests_per_s": len(game_ids) / elapsed}
+    return results
+
+
+def http_load(port, payloads, concurrency):
+    """POST every payload to /recommend with each concurrency level; latency percentiles and throughput."""
+    bodies = [json.dumps(p).encode() for p in payloads]
+
+    def post(body):
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        t0 = time.perf_counter()
+        conn.request("POST", "/recommend", body=body, headers={"Content-Type": "application/json"})
+        response = conn.getresponse()
+        response.read()
+        conn.close()
+        assert response.status == 200
+        return time.perf_counter() - t0
+
+    for body in bodies[:10]:
+        post(body)
+    results = {}
+    for c in concurrency:
+        with ThreadPoolExecutor(max_workers=c) as pool:
+            start = time.perf_counter()
+            latencies = list(pool.map(post, bodies))
+            elapsed = time.perf_counter() - start
+        results[f"concurrency_{c}"] = {**percentiles(latencies), "requests_per_s": len(bodies) / elapsed}
+    return results
+
+
+def wsgi_server_benchmarks(flask_app, payloads, concurrency):
+    """Serve the app with werkzeug's threaded server on a free port and hit it over HTTP."""
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)   # no access log per request
+    server = make_server("127.0.0.1", 0, flask_app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        return http_load(server.server_port, payloads, concurrency)
+    finally:
+        server.shutdown()
+
+
+def asgi_server_benchmarks(settings, payloads, concurrency):
+    """Serve asgi.py (micro-batching) with uvicorn on a free port and hit it over HTTP."""
+    import socket
+    import uvicorn
+    from asgi import create_app
+
+    sock = socket.socket()
+    sock.bind(("127.0.0.1", 0))
+    server = uvicorn.Server(uvicorn.Config(create_app(settings), log_level="warning", access_log=False,
+                                           lifespan="on"))
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        return http_load(sock.getsockname()[1], payloads, concurrency)
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HERE, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-data", help="existing model_data dir (default: generate a synthetic one)")
+    parser.add_argument("--games", type=int, default=21925)
+    parser.add_argument("--cf-items", type=int, default=15000)
+    parser.add_argument("--factors", type=int, default=50)
+    parser.add_argument("--users", type=int, default=500, help="synthetic payloads per e2e run")
+    parser.add_argument("--median-ratings", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=50, help="repetitions per micro-benchmark")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--retrieval-mode", default="exact", choices=["exact", "ivf"])
+    parser.add_argument("--factor-dtype", choices=["float64", "float32", "int8"],
+                        help="convert the CF factors on load (default: as stored)")
+    parser.add_argument("--cb-theme-format", default="dense", choices=["dense", "csr"])
+    parser.add_argument("--cache", action="store_true", help="keep the response/CB caches on")
+    parser.add_argument("--skip-server", action="store_true")
+    parser.add_argument("--skip-asgi", action="store_true")
+    parser.add_argument("--max-batch", type=int, default=64, help="asgi.py MICROBATCH_MAX_SIZE")
+    parser.add_argument("--max-wait-ms", type=float, default=2.0, help="asgi.py MICROBATCH_MAX_WAIT_MS")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_data = args.model_data
+        synthetic = None
+        if model_data is None:
+            model_data = tmp
+            synthetic = make_model_data(tmp, args.games, args.cf_items, args.factors, seed=args.seed)
+            synthetic.pop("version_dir")
+
+        from app import create_app
+
+        settings = {"MODEL_DATA_DIR": model_data, "CF_MODEL_PATH": None, "RETRIEVAL_MODE": args.retrieval_mode,
+                    "FACTOR_DTYPE": args.factor_dtype, "CB_THEME_FORMAT": args.cb_theme_format}
+        if not args.cache:
+            settings.update({"RESPONSE_CACHE_SIZE": 0, "CB_CACHE_SIZE": 0})
+        flask_app = create_app(settings, start_watcher=False)
+        service = flask_app.extensions["recommender"]
+
+        bundle = service.registry.current
+        payloads = make_payloads(args.users, bundle.cf.item_ids, bundle.num_checkboxes,
+                                 median_ratings=args.median_ratings, seed=args.seed)
+        report = {
+            "meta": {
+                "git_commit": git_commit(),
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "model_version": bundle.version,
+                "model_load_seconds": bundle.load_seconds,
+                "model_factor_dtype": bundle.cf.factor_dtype,
+                "model_bytes": bundle.cf.nbytes,
+                "cb_theme_bytes": bundle.cb_theme_bytes,
+                "synthetic_model": synthetic,
+                "config": vars(args),
+            },
+            "micro": micro_benchmarks(service, payloads, args.batch_size, args.repeat),
+            "test_client": test_client_benchmarks(flask_app, payloads, args.batch_size),
+        }
+        if not args.skip_server:
+            report["wsgi_server"] = wsgi_server_benchmarks(flask_app, payloads, args.concurrency)
+        if not args.skip_asgi:
+            asgi_settings = {**settings, "MICROBATCH_MAX_SIZE": args.max_batch,
+                             "MICROBATCH_MAX_WAIT_MS": args.max_wait_ms}
+            report["asgi_server"] = asgi_server_benchmarks(asgi_settings, payloads, args.concurrency)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
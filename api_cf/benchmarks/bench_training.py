@@ -0,0 +1,101 @@
+"""
+Benchmark: CF training with early stopping.
+
+Compares the old loop (a fresh surprise.SVD fitted from epoch 1 for every
+epoch count) with the single-pass trainer in offline-training/mf_sgd.py on
+synthetic low-rank ratings, reporting wall-clock and validation/test RMSE.
+
+    python bench_training.py --users 20000 --items 3000 --ratings 500000
+
+The Surprise baseline is skipped if scikit-surprise is not installed.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "offline-training"))
+from mf_sgd import fit_with_early_stopping  # noqa: E402
+
+
+def synthetic_ratings(n_users, n_items, n_ratings, rank=8, seed=42):
+    rng = np.random.default_rng(seed)
+    users = rng.integers(0, n_users, n_ratings)
+    # popular games get most of the ratings, as on BGG
+    items = np.minimum(rng.zipf(1.3, n_ratings) - 1, n_items - 1)
+    P = rng.normal(0, 0.6, (n_users, rank))
+    Q = rng.normal(0, 0.6, (n_items, rank))
+    item_bias = rng.normal(0, 0.8, n_items)
+    rating = 7.0 + item_bias[items] + np.einsum('ij,ij->i', P[users], Q[items]) + rng.normal(0, 0.8, n_ratings)
+    df = pd.DataFrame({"user_id": users + 1, "game_id": items * 3 + 1, "rating": np.clip(rating, 1, 10)})
+    df = df.drop_duplicates(["user_id", "game_id"]).sample(frac=1.0, random_state=seed)
+    n = len(df)
+    return df.iloc[:int(n * 0.8)], df.iloc[int(n * 0.8):int(n * 0.9)], df.iloc[int(n * 0.9):]
+
+
+def surprise_refit_loop(train_df, valid_df, max_epochs, patience):
+    """The trainer train_cf_model.py used before: refit from scratch for each epoch count."""
+    from surprise import Dataset, Reader, SVD, accuracy
+    trainset = Dataset.load_from_df(train_df[['user_id', 'game_id', 'rating']],
+                                    Reader(rating_scale=(0, 10))).build_full_trainset()
+    validset = [tuple(row) for row in valid_df[['user_id', 'game_id', 'rating']].values]
+    best_rmse, best_algo, stale = np.inf, None, 0
+    for epoch in range(1, max_epochs + 1):
+        algo = SVD(n_factors=50, n_epochs=epoch, lr_all=0.005, reg_all=0.02, random_state=42)
+        algo.fit(trainset)
+        rmse = accuracy.rmse(algo.test(validset), verbose=False)
+        if rmse < best_rmse:
+            best_rmse, best_algo, stale = rmse, algo, 0
+        else:
+            stale += 1
+        if stale >= patience:
+            break
+    return best_algo, best_rmse, epoch
+
+
+def rmse_of(pred, df):
+    return float(np.sqrt(np.mean((df["rating"].to_numpy() - pred) ** 2)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--items", type=int, default=3000)
+    parser.add_argument("--ratings", type=int, default=500000)
+    parser.add_argument("--max-epochs", type=int, default=30)
+    parser.add_argument("--patience", type=int, default=3)
+    parser.add_argument("--skip-surprise", action="store_true")
+    args = parser.parse_args()
+
+    train_df, valid_df, test_df = synthetic_ratings(args.users, args.items, args.ratings)
+    print(f"train={len(train_df)} valid={len(valid_df)} test={len(test_df)}")
+
+    start = time.perf_counter()
+    model = fit_with_early_stopping(train_df, valid_df, max_epochs=args.max_epochs, patience=args.patience)
+    single_pass = time.perf_counter() - start
+    valid_rmse = rmse_of(model.predict(valid_df["user_id"].to_numpy(), valid_df["game_id"].to_numpy()), valid_df)
+    test_rmse = rmse_of(model.predict(test_df["user_id"].to_numpy(), test_df["game_id"].to_numpy()), test_df)
+    print(f"single pass   : {single_pass:8.2f} s  valid RMSE {valid_rmse:.4f}  test RMSE {test_rmse:.4f}")
+
+    if args.skip_surprise:
+        return
+    try:
+        import surprise  # noqa: F401
+    except ImportError:
+        print("scikit-surprise not installed; skipping the refit-loop baseline")
+        return
+    start = time.perf_counter()
+    algo, valid_rmse, stopped = surprise_refit_loop(train_df, valid_df, args.max_epochs, args.patience)
+    refit = time.perf_counter() - start
+    test_rmse = rmse_of(np.array([algo.predict(u, i).est for u, i in
+                                  zip(test_df["user_id"], test_df["game_id"])]), test_df)
+    print(f"surprise refit: {refit:8.2f} s  valid RMSE {valid_rmse:.4f}  test RMSE {test_rmse:.4f}"
+          f"  ({stopped * (stopped + 1) // 2} epochs of SGD)")
+    print(f"speedup       : {refit / single_pass:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Compare two bench_service.py reports (e.g. from two commits).
+
+Prints every timing / throughput metric present in both with its relative
+change; regressions beyond --threshold are marked and make the exit code 1.
+
+    python compare.py before.json after.json --threshold 0.10
+"""
+import argparse
+import json
+import sys
+
+# Higher is better for these leaf names; every other *_ms / *_us metric is a time.
+THROUGHPUT_KEYS = ("requests_per_s", "users_per_s")
+TIME_SUFFIXES = ("_ms", "_us_per_user", "us_per_user", "ms_per_call")
+
+
+def flatten(node, prefix=""):
+    if isinstance(node, dict):
+        for key, value in node.items():
+            yield from flatten(value, f"{prefix}.{key}" if prefix else key)
+    elif isinstance(node, (int, float)) and not isinstance(node, bool):
+        yield prefix, float(node)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change flagged as a regression")
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+    print(f"before: {before['meta'].get('git_commit')}  after: {after['meta'].get('git_commit')}")
+
+    old = dict(flatten({k: v for k, v in before.items() if k != "meta"}))
+    new = dict(flatten({k: v for k, v in after.items() if k != "meta"}))
+    regressions = 0
+    for name in sorted(old.keys() & new.keys()):
+        leaf = name.rsplit(".", 1)[-1]
+        higher_is_better = leaf in THROUGHPUT_KEYS
+        if not higher_is_better and not leaf.endswith(TIME_SUFFIXES):
+            continue
+        if old[name] == 0:
+            continue
+        change = (new[name] - old[name]) / old[name]
+        worse = -change if higher_is_better else change
+        flag = ""
+        if worse > args.threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif worse < -args.threshold:
+            flag = "  improved"
+        print(f"{name:60s} {old[name]:12.3f} -> {new[name]:12.3f}  {change:+7.1%}{flag}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Accuracy / memory / speed of float32 and int8 factors against float64.
+
+Loads the same model once per encoding (FACTOR_DTYPE) and CB theme format,
+scores the same users through the service's hybrid path and reports, per
+encoding:
+
+  * top-k overlap with the float64 recommendations (|A & B| / k)
+  * NDCG@k of the recommendations, graded by the float64 ranking
+    (the float64 #1 item has gain k, #2 has k-1, ...; unlisted items 0)
+  * max |CF score difference|, CF + CB array bytes, ms per scoring call
+
+    python quantization_accuracy.py                       # synthetic model
+    python quantization_accuracy.py --model-data ../model_data --users 2000
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "recommender"))
+from synthetic import make_model_data, make_payloads  # noqa: E402
+
+VARIANTS = (("float64", "dense"), ("float32", "dense"), ("int8", "dense"), ("float32", "csr"), ("int8", "csr"))
+
+
+def ndcg_at_k(reference, candidate, k):
+    """NDCG@k of `candidate` with graded gains from the `reference` ranking."""
+    gain = {item: k - rank for rank, item in enumerate(reference[:k])}
+    discounts = 1.0 / np.log2(np.arange(2, k + 2))
+    dcg = sum(gain.get(item, 0) * d for item, d in zip(candidate[:k], discounts))
+    idcg = sum(g * d for g, d in zip(sorted(gain.values(), reverse=True), discounts))
+    return dcg / idcg if idcg > 0 else 1.0
+
+
+def median_ms(fn, repeat):
+    fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)) * 1e3
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model-data", help="existing model_data dir (default: generate a synthetic one)")
+    parser.add_argument("--games", type=int, default=21925)
+    parser.add_argument("--cf-items", type=int, default=15000)
+    parser.add_argument("--factors", type=int, default=50)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="write the JSON report here as well")
+    args = parser.parse_args()
+
+    from service import RecommenderService, parse_user, settings_from_env
+    from fold_in import compute_user_profiles
+    from hybrid import cf_score_matrix
+
+    with tempfile.TemporaryDirectory() as tmp:
+        model_data = args.model_data
+        if model_data is None:
+            model_data = tmp
+            make_model_data(tmp, args.games, args.cf_items, args.factors, seed=args.seed)
+
+        results, reference, reference_cf = [], None, None
+        for factor_dtype, theme_format in VARIANTS:
+            service = RecommenderService({**settings_from_env(), "MODEL_DATA_DIR": model_data, "CF_MODEL_PATH": None,
+                                          "FACTOR_DTYPE": factor_dtype, "CB_THEME_FORMAT": theme_format,
+                                          "RETRIEVAL_MODE": "exact", "CB_CACHE_SIZE": 0})
+            service.registry.reload()
+            bundle = service.registry.current
+            cf = bundle.cf
+            payloads = make_payloads(args.users, cf.item_ids, bundle.num_checkboxes,
+                                     top_n=args.k, seed=args.seed)
+            users = [parse_user(p, bundle.num_checkboxes) for p in payloads]
+
+            ranked = []
+            for lo in range(0, len(users), args.batch_size):
+                ranked += [[item for item, _ in recs]
+                           for _, recs in service.recommend_users(bundle, users[lo:lo + args.batch_size])]
+            b_u, U = compute_user_profiles([r for r, _, _ in users], cf.item_lookup, cf.item_factors,
+                                           cf.item_biases, cf.global_mean, cf.reg_coeff, cf.n_factors,
+                                           item_scales=cf.item_scales)
+            cf_scores = cf_score_matrix(b_u, U, cf.item_factors, cf.item_biases, cf.global_mean, cf.item_scales)
+            if reference is None:
+                reference, reference_cf = ranked, cf_scores
+
+            single, batch = users[:1], users[:args.batch_size]
+            results.append({
+                "factor_dtype": cf.factor_dtype,
+                "cb_theme_format": theme_format,
+                f"top{args.k}_overlap": float(np.mean([len(set(a) & set(b)) / args.k
+                                                       for a, b in zip(reference, ranked)])),
+                f"ndcg@{args.k}": float(np.mean([ndcg_at_k(a, b, args.k) for a, b in zip(reference, ranked)])),
+                "max_abs_cf_score_diff": float(np.abs(cf_scores.astype(np.float64) - reference_cf).max()),
+                "cf_bytes": int(cf.nbytes),
+                "cb_theme_bytes": int(bundle.cb_theme_bytes),
+                "ms_single_user": median_ms(lambda: service.recommend_users(bundle, single), args.repeat),
+                "ms_batch": median_ms(lambda: service.recommend_users(bundle, batch), args.repeat),
+            })
+            print(json.dumps(results[-1]), file=sys.stderr)
+
+    report = {"users": len(reference), "k": args.k, "batch_size": args.batch_size, "variants": results}
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
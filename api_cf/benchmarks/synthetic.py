@@ -0,0 +1,122 @@
+"""
+Synthetic model data and request payloads for the benchmarks.
+
+Writes a model_data directory in the shapes app.py loads: themes.pkl,
+games.pkl, category_transform.pkl and a versioned cf_model artifact (through
+offline-training/artifact.save_model_artifact). The catalogue size, CF
+coverage, factor count and theme/checkbox counts are configurable.
+
+    python synthetic.py /tmp/bench_model_data --games 21925 --cf-items 15000 --factors 50
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "offline-training"))
+from artifact import save_model_artifact  # noqa: E402
+from neighbours import build_item_neighbours, theme_vectors  # noqa: E402
+
+
+def make_model_data(out_dir, n_games=21925, n_cf_items=15000, n_factors=50, n_themes=107,
+                    n_checkboxes=20, theme_density=0.03, neighbours_k=20, seed=42):
+    """
+    Write a synthetic model_data directory.
+
+    Returns:
+        dict describing what was generated (sizes, artifact version dir).
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(out_dir, exist_ok=True)
+    game_ids = np.arange(1, n_games + 1) * 3
+
+    # Every theme column needs > MIN_THEME_COUNT games or content_based drops it,
+    # which would leave category_transform with extra rows.
+    themes = (rng.random((n_games, n_themes)) < theme_density).astype(np.int64)
+    themes[rng.integers(0, n_games, (30, n_themes)), np.arange(n_themes)] = 1
+    df_themes = pd.DataFrame(themes, columns=[f"Theme_{i}" for i in range(n_themes)])
+    df_themes.insert(0, "BGGId", game_ids)
+    df_games = pd.DataFrame({"BGGId": game_ids,
+                             "Name": [f"Game {i}" for i in game_ids],
+                             "AvgRating": rng.uniform(4, 9, n_games).round(2)})
+    transform = (rng.random((n_themes, n_checkboxes)) < 0.08).astype(np.int64)
+    transform[np.arange(n_themes), rng.integers(0, n_checkboxes, n_themes)] = 1   # every theme maps somewhere
+    df_transform = pd.DataFrame(transform, columns=[f"Category {j}" for j in range(n_checkboxes)])
+    df_transform.insert(0, "All_themes", [f"Theme_{i}" for i in range(n_themes)])
+
+    df_themes.to_pickle(os.path.join(out_dir, "themes.pkl"))
+    df_games.to_pickle(os.path.join(out_dir, "games.pkl"))
+    df_transform.to_pickle(os.path.join(out_dir, "category_transform.pkl"))
+
+    cf_ids = rng.choice(game_ids, size=min(n_cf_items, n_games), replace=False)
+    item_factors = rng.normal(0, 0.1, (len(cf_ids), n_factors))
+    neighbours = {}
+    if neighbours_k > 0:
+        neighbours["neighbour_ids"], neighbours["neighbour_scores"] = build_item_neighbours(
+            item_factors, cf_ids, theme_vectors(df_themes, cf_ids), k=neighbours_k, verbose=False)
+    version_dir = save_model_artifact(
+        os.path.join(out_dir, "cf_model"),
+        item_factors=item_factors,
+        item_biases=rng.normal(0, 0.3, len(cf_ids)),
+        global_mean=7.0,
+        item_ids=cf_ids.tolist(),
+        reg_coeff=0.02,
+        extra={"synthetic": True, "seed": seed},
+        extra_arrays=neighbours,
+    )
+    return {"games": n_games, "cf_items": int(len(cf_ids)), "factors": n_factors, "themes": n_themes,
+            "checkboxes": n_checkboxes, "version_dir": version_dir}
+
+
+def make_payloads(n_users, item_ids, num_checkboxes, median_ratings=20, cold_share=0.05, top_n=20, seed=42):
+    """
+    Synthetic /recommend payloads.
+
+    Rating counts are log-normal around `median_ratings` (long tail of heavy
+    raters, capped at 500) with a `cold_share` of users who rated nothing;
+    rated games are drawn with Zipf-like popularity, ratings skew towards 7,
+    and users tick a Poisson(2) handful of checkboxes.
+    """
+    rng = np.random.default_rng(seed)
+    item_ids = np.asarray(item_ids)
+    popularity = 1.0 / np.arange(1, len(item_ids) + 1) ** 0.8
+    popularity /= popularity.sum()
+    popular_order = rng.permutation(len(item_ids))
+
+    counts = np.minimum(np.rint(rng.lognormal(np.log(median_ratings), 1.0, n_users)), 500).astype(int)
+    counts[rng.random(n_users) < cold_share] = 0
+    counts = np.minimum(counts, len(item_ids))
+    payloads = []
+    for u, n in enumerate(counts):
+        rated = item_ids[popular_order[rng.choice(len(item_ids), size=n, replace=False, p=popularity)]]
+        ratings = np.clip(np.rint(rng.normal(7, 1.5, n)), 1, 10)
+        prefs = np.zeros(num_checkboxes, dtype=bool)
+        prefs[rng.choice(num_checkboxes, size=min(rng.poisson(2), num_checkboxes), replace=False)] = True
+        payloads.append({
+            "username": f"bench{u}",
+            "ratings": [[int(i), float(r)] for i, r in zip(rated, ratings)],
+            "preferences": prefs.tolist(),
+            "top_n": top_n,
+        })
+    return payloads
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("out_dir")
+    parser.add_argument("--games", type=int, default=21925)
+    parser.add_argument("--cf-items", type=int, default=15000)
+    parser.add_argument("--factors", type=int, default=50)
+    parser.add_argument("--themes", type=int, default=107)
+    parser.add_argument("--checkboxes", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    info = make_model_data(args.out_dir, args.games, args.cf_items, args.factors, args.themes,
+                           args.checkboxes, seed=args.seed)
+    print(info)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+"""
+Parallel alternating least squares for the biased MF model:
+
+    r_ui ~ global_mean + b_u + b_i + p_u . q_i
+
+Every iteration solves all items with the users fixed, then all users with the
+items fixed; each side is a set of independent ridge problems (ridge.py) fanned
+out over a process pool. The rating matrix (CSR by user and by item) and the
+parameter arrays live in shared memory: workers attach to them once and write
+their solved rows in place, so nothing but (side, row range) tasks is pickled.
+
+The user solve uses reg on p_u and leaves b_u unregularised, exactly like the
+fold-in the recommender runs for a new user (fold_in.compute_user_profile),
+and every iteration ends with the user solve, so folding in a training user's
+ratings against the saved item factors reproduces that user's trained row.
+"""
+import os
+import time
+from multiprocessing import get_context, shared_memory
+
+import numpy as np
+import pandas as pd
+
+from mf_sgd import FactorModel
+from ridge import solve_ridge_rows, to_csr
+
+# Tasks per worker and side; more, smaller tasks even out skewed row lengths.
+TASKS_PER_WORKER = 4
+
+# Worker-side views of the shared arrays, set by _attach.
+_shared = {}
+
+
+class SharedArrays:
+    """Named NumPy arrays backed by multiprocessing shared memory (owned by the creator)."""
+
+    def __init__(self, arrays):
+        self.blocks = {}
+        self.specs = {}
+        self.arrays = {}
+        for name, value in arrays.items():
+            value = np.ascontiguousarray(value)
+            block = shared_memory.SharedMemory(create=True, size=max(value.nbytes, 1))
+            view = np.ndarray(value.shape, dtype=value.dtype, buffer=block.buf)
+            view[...] = value
+            self.blocks[name] = block
+            self.specs[name] = (block.name, value.shape, value.dtype.str)
+            self.arrays[name] = view
+
+    def __getitem__(self, name):
+        return self.arrays[name]
+
+    def close(self):
+        self.arrays.clear()
+        for block in self.blocks.values():
+            block.close()
+            block.unlink()
+        self.blocks.clear()
+
+
+def _attach(specs, global_mean, reg, reg_item_bias):
+    """Pool initializer: map the parent's shared blocks (only the parent unlinks them)."""
+    blocks = {}
+    for name, (shm_name, _, _) in specs.items():
+        blocks[name] = shared_memory.SharedMemory(name=shm_name)
+    _shared.clear()
+    _shared["_blocks"] = blocks   # keep the mappings alive for the worker's lifetime
+    for name, (_, shape, dtype) in specs.items():
+        _shared[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=blocks[name].buf)
+    _shared["params"] = (global_mean, reg, reg_item_bias)
+
+
+def _solve_range(task):
+    """Solve rows [lo, hi) of one side against the other side's current factors, in place."""
+    side, lo, hi = task
+    s = _shared
+    global_mean, reg, reg_item_bias = s["params"]
+    if side == "user":
+        indptr, cols, vals = s["user_indptr"], s["user_cols"], s["user_vals"]
+        other_bias, other_factors = s["bi"], s["Q"]
+        out_bias, out_factors, reg_bias = s["bu"], s["P"], 0.0
+    else:
+        indptr, cols, vals = s["item_indptr"], s["item_cols"], s["item_vals"]
+        other_bias, other_factors = s["bu"], s["P"]
+        out_bias, out_factors, reg_bias = s["bi"], s["Q"], reg_item_bias
+
+    start, stop = indptr[lo], indptr[hi]
+    local_cols = cols[start:stop]
+    targets = vals[start:stop] - global_mean - other_bias[local_cols]
+    biases, vectors = solve_ridge_rows(indptr[lo:hi + 1] - start, local_cols, targets,
+                                       other_factors, reg, reg_bias)
+    out_bias[lo:hi] = biases
+    out_factors[lo:hi] = vectors
+    return hi - lo
+
+
+def _balanced_ranges(indptr, n_tasks):
+    """Split the rows into up to n_tasks contiguous ranges with similar rating counts."""
+    n_rows = len(indptr) - 1
+    cuts = np.searchsorted(indptr, np.linspace(0, indptr[-1], n_tasks + 1)[1:-1])
+    bounds = np.unique(np.concatenate([[0], cuts, [n_rows]]))
+    return list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+
+
+def fit_als(train_df, valid_df, n_factors=50, max_iters=15, patience=2, reg=0.1, reg_item_bias=None,
+            n_workers=None, seed=42, rating_scale=(0, 10), verbose=True):
+    """
+    Train biased MF with parallel ALS, validating after every iteration.
+
+    Parameters:
+        train_df, valid_df (DataFrame): user_id, game_id, rating.
+        n_factors (int): Latent dimension.
+        max_iters (int): Max ALS iterations (each = item solve + user solve).
+        patience (int): Stop after this many iterations without a better validation RMSE.
+        reg (float): λ on p_u and q_i; saved as reg_coeff and used by the service fold-in.
+        reg_item_bias (float): λ on b_i (default reg); b_u is never regularised.
+        n_workers (int): Worker processes (default os.cpu_count(); 1 = no pool).
+        seed (int): Seed for the N(0, 0.1) factor initialisation.
+
+    Returns:
+        FactorModel with the best-iteration parameters.
+    """
+    n_workers = n_workers or os.cpu_count() or 1
+    reg_item_bias = reg if reg_item_bias is None else reg_item_bias
+    rng = np.random.default_rng(seed)
+
+    user_codes, user_ids = pd.factorize(train_df["user_id"])
+    item_codes, item_ids = pd.factorize(train_df["game_id"])
+    ratings = train_df["rating"].to_numpy(dtype=np.float64)
+    global_mean = float(ratings.mean())
+    n_users, n_items = len(user_ids), len(item_ids)
+
+    user_indptr, user_cols, user_vals = to_csr(user_codes, item_codes, ratings, n_users)
+    item_indptr, item_cols, item_vals = to_csr(item_codes, user_codes, ratings, n_items)
+    shared = SharedArrays({
+        "user_indptr": user_indptr, "user_cols": user_cols, "user_vals": user_vals,
+        "item_indptr": item_indptr, "item_cols": item_cols, "item_vals": item_vals,
+        "bu": np.zeros(n_users), "bi": np.zeros(n_items),
+        "P": rng.normal(0, 0.1, (n_users, n_factors)),
+        "Q": rng.normal(0, 0.1, (n_items, n_factors)),
+    })
+    tasks = {
+        "item": [("item", lo, hi) for lo, hi in _balanced_ranges(item_indptr, n_workers * TASKS_PER_WORKER)],
+        "user": [("user", lo, hi) for lo, hi in _balanced_ranges(user_indptr, n_workers * TASKS_PER_WORKER)],
+    }
+
+    pool = None
+    try:
+        if n_workers > 1:
+            pool = get_context("spawn" if os.name == "nt" else "fork").Pool(
+                n_workers, initializer=_attach, initargs=(shared.specs, global_mean, reg, reg_item_bias))
+            run = lambda side: pool.map(_solve_range, tasks[side])  # noqa: E731
+        else:
+            _shared.update(shared.arrays, params=(global_mean, reg, reg_item_bias))
+            run = lambda side: [_solve_range(task) for task in tasks[side]]  # noqa: E731
+
+        model = FactorModel(global_mean, shared["bu"], shared["bi"], shared["P"], shared["Q"],
+                            user_ids, item_ids, reg)
+        valid_users = valid_df["user_id"].to_numpy()
+        valid_items = valid_df["game_id"].to_numpy()
+        valid_ratings = valid_df["rating"].to_numpy(dtype=np.float64)
+
+        best_rmse = np.inf
+        best_params = None
+        iters_without_improve = 0
+        for iteration in range(1, max_iters + 1):
+            start = time.perf_counter()
+            run("item")
+            run("user")   # last, so the saved users equal the service fold-in
+            pred = model.predict(valid_users, valid_items, rating_scale)
+            current_rmse = float(np.sqrt(np.mean((valid_ratings - pred) ** 2)))
+            if verbose:
+                print(f"ALS iteration {iteration}, Validation RMSE: {current_rmse:.4f} "
+                      f"({time.perf_counter() - start:.2f}s, {n_workers} workers)")
+
+            if current_rmse < best_rmse:
+                best_rmse = current_rmse
+                best_params = tuple(shared[name].copy() for name in ("bu", "bi", "P", "Q"))
+                iters_without_improve = 0
+            else:
+                iters_without_improve += 1
+
+            if iters_without_improve >= patience:
+                if verbose:
+                    print(f"Early stopping at iteration {iteration}. Best Validation RMSE: {best_rmse:.4f}")
+                break
+    finally:
+        model = None   # drop the views before the blocks are closed
+        if pool is not None:
+            pool.close()
+            pool.join()
+        _shared.clear()
+        shared.close()
+
+    return FactorModel(global_mean, *best_params, user_ids, item_ids, reg)
@@ -0,0 +1,211 @@
+"""
+Versioned on-disk format for the CF model artifact.
+
+Layout (one directory per trained model, plus a pointer to the newest one):
+
+    <output_dir>/
+        LATEST                      # name of the newest version directory
+        <version>/
+            manifest.json           # format, version, schema and scalar params
+            item_factors.npy        # (num_items, n_factors)
+            item_biases.npy         # (num_items,)
+            item_ids.npy            # raw item id of each model row
+            item_ids_sorted.npy     # raw ids, sorted (for searchsorted lookups)
+            item_ids_order.npy      # model row of each sorted id
+            item_factor_scales.npy  # per-row scales, only for int8 factors
+            neighbour_ids.npy       # optional (num_items, K) int32 "more like this" ids
+            neighbour_scores.npy    # ... and their float16 similarities (neighbours.py)
+            ranking_metrics.json    # top-N metrics, or why they were skipped (evaluate_ranking.py)
+
+item_factors is float64 as trained, or float32 / int8 with per-row scales
+(factor_dtype); int8 artifacts are written as format_version 2 so services
+that cannot dequantise refuse them instead of scoring with raw codes. The
+float32 / int8 encodings come from the recommender's quantize.py, the code
+that reads them back, so writer and reader cannot disagree on the scales;
+writing them needs that directory (RECOMMENDER_DIR, default ../recommender).
+
+All arrays are plain .npy files, so the service can np.load(mmap_mode='r')
+them and every worker shares one page-cache copy; nothing is pickled.
+"""
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+import numpy as np
+
+FORMAT_NAME = "bgrec-cf-model"
+FORMAT_VERSION = 1
+QUANTISED_FORMAT_VERSION = 2
+MANIFEST_FILE = "manifest.json"
+LATEST_FILE = "LATEST"
+RECOMMENDER_DIR = os.getenv("RECOMMENDER_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                            "..", "recommender"))
+
+
+def new_model_version():
+    """Sortable UTC timestamp used as the version directory name."""
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+
+
+def encode_factors(item_factors, item_biases, factor_dtype):
+    """quantize.encode_factors of the recommender: (factors, biases, int8 scales or None)."""
+    if RECOMMENDER_DIR not in sys.path:
+        sys.path.insert(0, RECOMMENDER_DIR)
+    try:
+        from quantize import encode_factors as recommender_encode_factors
+    except ImportError as e:
+        raise ImportError(f"writing {factor_dtype} factors needs the recommender's quantize.py; "
+                          f"set RECOMMENDER_DIR (now {RECOMMENDER_DIR})") from e
+    return recommender_encode_factors(item_factors, item_biases, factor_dtype)
+
+
+def save_model_artifact(output_dir, item_factors, item_biases, global_mean, item_ids, reg_coeff,
+                        metrics=None, extra=None, version=None, factor_dtype="float64", extra_arrays=None):
+    """
+    Write a new model version under output_dir and point LATEST at it.
+
+    Parameters:
+        output_dir (str): Root directory holding all model versions.
+        item_factors (np.array): Item latent vectors (num_items x n_factors).
+        item_biases (np.array): Item biases (num_items,).
+        global_mean (float): Global average rating.
+        item_ids (array-like): Raw item id of each model row.
+        reg_coeff (float): Regularization coefficient used by the fold-in.
+        metrics (dict, optional): Evaluation results stored in the manifest.
+        extra (dict, optional): Additional manifest fields (e.g. training mode).
+        version (str, optional): Version name; defaults to a UTC timestamp.
+        factor_dtype (str): "float64", "float32" or "int8" (with per-row scales).
+        extra_arrays (dict, optional): More per-item arrays to store (e.g. the neighbour table).
+
+    Returns:
+        Path of the new version directory.
+    """
+    item_factors = np.ascontiguousarray(item_factors)
+    item_biases = np.ascontiguousarray(item_biases)
+    item_ids = np.asarray(item_ids)
+    if item_ids.dtype == object:
+        raise ValueError("item ids must be numeric or strings, not Python objects")
+    if item_factors.ndim != 2 or item_biases.shape != (item_factors.shape[0],) \
+            or item_ids.shape != (item_factors.shape[0],):
+        raise ValueError("item_factors, item_biases and item_ids disagree on the number of items")
+    if len(np.unique(item_ids)) != len(item_ids):
+        raise ValueError("item ids must be unique")
+
+    order = np.argsort(item_ids, kind="stable")
+    arrays = {
+        "item_factors": item_factors,
+        "item_biases": item_biases,
+        "item_ids": item_ids,
+        "item_ids_sorted": item_ids[order],
+        "item_ids_order": order.astype(np.int64),
+    }
+    if factor_dtype != "float64":
+        # Raises ValueError for an unknown factor_dtype, before anything is written.
+        arrays["item_factors"], arrays["item_biases"], scales = encode_factors(item_factors, item_biases,
+                                                                               factor_dtype)
+        if scales is not None:
+            arrays["item_factor_scales"] = scales
+    for name, arr in (extra_arrays or {}).items():
+        arr = np.ascontiguousarray(arr)
+        if arr.shape[:1] != (item_factors.shape[0],):
+            raise ValueError(f"{name} must have one row per item")
+        arrays[name] = arr
+
+    version = version or new_model_version()
+    os.makedirs(output_dir, exist_ok=True)
+    # Write into a temporary directory first so readers never see a partial version.
+    tmp_dir = tempfile.mkdtemp(prefix=f".{version}-", dir=output_dir)
+    os.chmod(tmp_dir, 0o755)
+    schema = {}
+    for name, arr in arrays.items():
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), arr, allow_pickle=False)
+        schema[name] = {"file": f"{name}.npy", "dtype": arr.dtype.str, "shape": list(arr.shape)}
+
+    manifest = {
+        "format": FORMAT_NAME,
+        "format_version": QUANTISED_FORMAT_VERSION if factor_dtype == "int8" else FORMAT_VERSION,
+        "model_version": version,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "n_items": int(item_factors.shape[0]),
+        "n_factors": int(item_factors.shape[1]),
+        "factor_dtype": factor_dtype,
+        "global_mean": float(global_mean),
+        "reg_coeff": float(reg_coeff),
+        "arrays": schema,
+        "metrics": metrics or {},
+    }
+    manifest.update(extra or {})
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w") as f:
+        json.dump(manifest, f, indent=2)
+
+    version_dir = os.path.join(output_dir, version)
+    os.rename(tmp_dir, version_dir)
+    update_latest(output_dir, version)
+    return version_dir
+
+
+def update_latest(output_dir, version):
+    """Atomically point LATEST at a version directory."""
+    fd, tmp_path = tempfile.mkstemp(prefix=".LATEST-", dir=output_dir)
+    with os.fdopen(fd, "w") as f:
+        f.write(version + "\n")
+    os.chmod(tmp_path, 0o644)
+    os.replace(tmp_path, os.path.join(output_dir, LATEST_FILE))
+
+
+def latest_version_dir(output_dir):
+    """Directory of the newest model version, or None if nothing was published yet."""
+    latest = os.path.join(output_dir, LATEST_FILE)
+    if not os.path.isfile(latest):
+        return None
+    with open(latest) as f:
+        return os.path.join(output_dir, f.read().strip())
+
+
+def load_model_artifact(version_dir):
+    """
+    Read a model version back into memory (writable copies, for warm starts).
+
+    int8 factors are dequantised to float64, so a warm start from a quantised
+    artifact continues from the rounded values.
+
+    Returns:
+        arrays (dict): name -> np.array, as listed in the manifest schema.
+        manifest (dict): The parsed manifest.json.
+    """
+    with open(os.path.join(version_dir, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT_NAME or \
+            manifest.get("format_version") not in (FORMAT_VERSION, QUANTISED_FORMAT_VERSION):
+        raise ValueError(f"{version_dir}: unsupported model artifact")
+    arrays = {name: np.load(os.path.join(version_dir, spec["file"]), allow_pickle=False)
+              for name, spec in manifest["arrays"].items()}
+    scales = arrays.pop("item_factor_scales", None)
+    if scales is not None:
+        arrays["item_factors"] = arrays["item_factors"].astype(np.float64) * scales[:, None]
+    return arrays, manifest
+
+
+def convert_legacy_pickle(pickle_path, output_dir):
+    """Re-write an old item_factors.pkl artifact in the versioned .npy format."""
+    import pickle
+    with open(pickle_path, "rb") as f:
+        model_data = pickle.load(f)
+    return save_model_artifact(
+        output_dir,
+        item_factors=model_data["item_factors"],
+        item_biases=model_data["item_biases"],
+        global_mean=model_data["global_mean"],
+        item_ids=model_data["item_ids_list"],
+        reg_coeff=model_data["reg_coeff"],
+        extra={"converted_from": os.path.basename(pickle_path)},
+    )
+
+
+if __name__ == "__main__":
+    import sys
+    if len(sys.argv) != 3:
+        sys.exit("usage: python artifact.py <item_factors.pkl> <output_dir>")
+    print("Converted artifact written to:", convert_legacy_pickle(sys.argv[1], sys.argv[2]))
@@ -0,0 +1,229 @@
+"""
+Offline ranking evaluation of a model version through the serving path.
+
+RMSE/MAE measure rating prediction; what the service ships is a top-N hybrid
+ranking. This replays the test split through the recommender's own
+RecommenderService.recommend_users (fold-in, CF scores, CB scores and the
+dynamic_alpha blend, with the service's RETRIEVAL_MODE / FACTOR_DTYPE
+settings from the environment):
+
+  * each test user posts their train + valid ratings as history
+  * their checkboxes are simulated from the themes of the games they liked
+    (the checkboxes whose CB similarity to those games is highest)
+  * the relevant items are their test ratings >= relevance_threshold
+
+precision@k, recall@k, NDCG@k (binary gains) and catalogue coverage@k are
+computed over all users at once from a (num_users x k) hit matrix. Users are
+scored in chunks, on a process pool for large user counts. The report is
+written as ranking_metrics.json into the model's version directory.
+
+    python evaluate_ranking.py --model ../model_data/cf_model --model-data ../model_data --split-dir ./data
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime, timezone
+from multiprocessing import get_context
+
+import numpy as np
+import pandas as pd
+
+RECOMMENDER_DIR = os.getenv("RECOMMENDER_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                            "..", "recommender"))
+sys.path.insert(0, RECOMMENDER_DIR)
+from model_store import resolve_version_dir  # noqa: E402
+from service import RecommenderService, settings_from_env  # noqa: E402
+
+RANKING_METRICS_FILE = "ranking_metrics.json"
+CHUNK_SIZE = 256          # users per recommend_users call
+POOL_MIN_USERS = 2000     # fewer users are scored in-process
+
+# Key stride for (user index, raw item id) pairs; raw game ids are far below it.
+_STRIDE = 2 ** 32
+
+_shared = {}
+
+
+def _attach(settings):
+    """Pool initializer: forked workers inherit the loaded service, spawned ones load it."""
+    if "service" not in _shared:
+        service = RecommenderService(settings)
+        service.registry.reload()
+        _shared["service"] = service
+
+
+def _score_chunk(users):
+    """Top-N raw item ids for a chunk of (ratings, preferences, top_n) users, -1 padded."""
+    service = _shared["service"]
+    bundle = service.registry.current
+    results = service.recommend_users(bundle, users)
+    width = max(top_n for _, _, top_n in users)
+    recommended = np.full((len(users), width), -1, dtype=np.int64)
+    for row, (_, recommendations) in enumerate(results):
+        recommended[row, :len(recommendations)] = [item_id for item_id, _ in recommendations]
+    return recommended
+
+
+def simulate_preferences(bundle, histories, liked_threshold, n_checked):
+    """
+    Checkbox booleans per user from the themes of the games they liked.
+
+    Each checkbox's CB similarity to every game is summed over the user's
+    liked games; the n_checked best checkboxes with a positive sum are ticked.
+    """
+    cf = bundle.cf
+    cb = bundle.cb_index
+    # (num_games x num_checkboxes): similarity of each single checkbox to each game
+    checkbox_sims = cb.score_matrix(np.eye(cb.num_checkboxes, dtype=bool)).T.astype(np.float64)
+    preferences = np.zeros((len(histories), cb.num_checkboxes), dtype=bool)
+    for i, ratings in enumerate(histories):
+        cf_rows = cf.item_lookup.lookup([item_id for item_id, rating in ratings if rating >= liked_threshold])
+        cb_rows = bundle.cf_to_cb[cf_rows[cf_rows >= 0]]
+        cb_rows = cb_rows[cb_rows >= 0]
+        if len(cb_rows) == 0:
+            continue
+        affinity = checkbox_sims[cb_rows].sum(axis=0)
+        best = np.argsort(-affinity, kind="stable")[:n_checked]
+        preferences[i, best[affinity[best] > 0]] = True
+    return preferences
+
+
+def ranking_metrics(recommended, relevant_keys, n_relevant, ks, n_items):
+    """
+    precision / recall / NDCG / coverage at each k from the recommendation matrix.
+
+    Parameters:
+        recommended (np.array): (num_users, max_k) recommended item ids, best first, -1 padded.
+        relevant_keys (np.array): Sorted user_index * _STRIDE + item_id keys of the relevant items.
+        n_relevant (np.array): Relevant items per user (all > 0).
+        ks (list): Cut-offs.
+        n_items (int): Items the model can recommend (coverage denominator).
+    """
+    n_users, max_k = recommended.shape
+    keys = np.arange(n_users, dtype=np.int64)[:, None] * _STRIDE + recommended
+    pos = np.minimum(np.searchsorted(relevant_keys, keys), len(relevant_keys) - 1)
+    hits = (relevant_keys[pos] == keys) & (recommended >= 0)
+
+    discounts = 1.0 / np.log2(np.arange(2, max_k + 2))
+    report = {}
+    for k in ks:
+        hits_k = hits[:, :k]
+        n_hits = hits_k.sum(axis=1)
+        dcg = hits_k.dot(discounts[:k])
+        idcg = np.cumsum(discounts[:k])[np.minimum(n_relevant, k) - 1]
+        recommended_k = recommended[:, :k]
+        report[f"precision@{k}"] = float(np.mean(n_hits / k))
+        report[f"recall@{k}"] = float(np.mean(n_hits / n_relevant))
+        report[f"ndcg@{k}"] = float(np.mean(dcg / idcg))
+        report[f"coverage@{k}"] = float(len(np.unique(recommended_k[recommended_k >= 0])) / n_items)
+    return report
+
+
+def evaluate_model(model_path, model_data_dir, history_df, test_df, ks=(5, 10, 20), relevance_threshold=7.0,
+                   n_checked=2, n_workers=None, chunk_size=CHUNK_SIZE, output_path=None, split=None):
+    """
+    Replay test users through the serving path and write ranking_metrics.json.
+
+    Parameters:
+        model_path (str): Artifact root (LATEST is followed), version directory or legacy .pkl.
+        model_data_dir (str): Directory with themes.pkl, games.pkl and category_transform.pkl.
+        history_df (pd.DataFrame): user_id, game_id, rating posted as each user's history (train + valid).
+        test_df (pd.DataFrame): Held-out user_id, game_id, rating.
+        ks (tuple): Cut-offs; the service is asked for max(ks) items.
+        relevance_threshold (float): Test ratings at or above this are relevant
+            (also the "liked" threshold for the simulated checkboxes).
+        n_checked (int): Checkboxes ticked per simulated user.
+        n_workers (int, optional): Processes for large user counts (default: CPU count).
+        chunk_size (int): Users per recommend_users call.
+        output_path (str, optional): Where to write the report (default: the version directory).
+        split (str, optional): Which ratings test_df holds, recorded in the report.
+
+    Returns:
+        dict with the metrics and the evaluation settings.
+    """
+    start = time.perf_counter()
+    version_dir = resolve_version_dir(model_path)
+    settings = {**settings_from_env(), "MODEL_DATA_DIR": model_data_dir, "CF_MODEL_PATH": version_dir,
+                "MODEL_WATCH_INTERVAL": 0, "RESPONSE_CACHE_SIZE": 0}
+    _shared.clear()
+    _attach(settings)
+    bundle = _shared["service"].registry.current
+
+    # ----------- 1.  Users, histories, relevant items -----------
+    relevant_df = test_df[test_df["rating"] >= relevance_threshold]
+    user_ids = np.sort(relevant_df["user_id"].unique())
+    history_df = history_df[history_df["user_id"].isin(user_ids)]
+    grouped = {user_id: list(zip(group["game_id"].tolist(), group["rating"].tolist()))
+               for user_id, group in history_df.groupby("user_id", sort=False)}
+    histories = [grouped.get(user_id, []) for user_id in user_ids]
+    preferences = simulate_preferences(bundle, histories, relevance_threshold, n_checked)
+
+    user_index = np.searchsorted(user_ids, relevant_df["user_id"].to_numpy())
+    relevant_keys = np.sort(user_index.astype(np.int64) * _STRIDE + relevant_df["game_id"].to_numpy(np.int64))
+    n_relevant = np.bincount(user_index, minlength=len(user_ids))
+
+    # ----------- 2.  Recommendations through the serving path -----------
+    top_n = max(ks)
+    users = [(ratings, prefs.tolist(), top_n) for ratings, prefs in zip(histories, preferences)]
+    chunks = [users[lo:lo + chunk_size] for lo in range(0, len(users), chunk_size)]
+    n_workers = n_workers or os.cpu_count() or 1
+    if n_workers > 1 and len(users) >= POOL_MIN_USERS:
+        with get_context("spawn" if os.name == "nt" else "fork").Pool(
+                n_workers, initializer=_attach, initargs=(settings,)) as pool:
+            parts = pool.map(_score_chunk, chunks)
+    else:
+        parts = [_score_chunk(chunk) for chunk in chunks]
+    recommended = np.vstack(parts) if parts else np.empty((0, top_n), dtype=np.int64)
+
+    # ----------- 3.  Metrics -----------
+    report = {
+        "model_version": bundle.version,
+        "evaluated_at": datetime.now(timezone.utc).isoformat(),
+        "split": split,
+        "users": int(len(user_ids)),
+        "relevance_threshold": relevance_threshold,
+        "simulated_checkboxes": n_checked,
+        "retrieval_mode": settings["RETRIEVAL_MODE"],
+        "factor_dtype": bundle.cf.factor_dtype,
+    }
+    if len(user_ids):
+        report.update(ranking_metrics(recommended, relevant_keys, n_relevant, sorted(ks), bundle.cf.n_items))
+    report["seconds"] = time.perf_counter() - start
+
+    if output_path is None:
+        # Legacy .pkl models have no version directory; the report goes next to the file.
+        report_dir = version_dir if os.path.isdir(version_dir) else os.path.dirname(os.path.abspath(version_dir))
+        output_path = os.path.join(report_dir, RANKING_METRICS_FILE)
+    with open(output_path, "w") as f:
+        json.dump(report, f, indent=2)
+    _shared.clear()
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", default="../model_data/cf_model", help="artifact root or version directory")
+    parser.add_argument("--model-data", default="../model_data", help="directory with the CB frames")
+    parser.add_argument("--split-dir", default=os.getenv("SPLIT_DIR", "./data"),
+                        help="train_df / valid_df / test_df .parquet written by train_cf_model.py")
+    parser.add_argument("--k", type=int, nargs="+", default=[5, 10, 20])
+    parser.add_argument("--threshold", type=float, default=7.0)
+    parser.add_argument("--checkboxes", type=int, default=2)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", help="report path (default: <version dir>/ranking_metrics.json)")
+    args = parser.parse_args()
+
+    history_df = pd.concat([pd.read_parquet(os.path.join(args.split_dir, f"{name}_df.parquet"))
+                            for name in ("train", "valid")])
+    test_df = pd.read_parquet(os.path.join(args.split_dir, "test_df.parquet"))
+    report = evaluate_model(args.model, args.model_data, history_df, test_df, ks=args.k,
+                            relevance_threshold=args.threshold, n_checked=args.checkboxes,
+                            n_workers=args.workers, output_path=args.output,
+                            split=os.path.join(args.split_dir, "test_df.parquet"))
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
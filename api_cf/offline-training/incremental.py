@@ -0,0 +1,290 @@
+"""
+Incremental CF training from rating deltas.
+
+Instead of re-fetching user_ratings and retraining from scratch, pull only the
+ratings newer than the watermark stored in the previous artifact, warm-start
+from its item factors and biases, and run a few SGD passes over the complete
+histories of the affected users. Only items that received new ratings are
+updated (games the model has never seen are appended); every other item
+stays frozen. A share of the new ratings is held out; the previous model,
+the updated model and (if its version is still on disk) the last full retrain
+are all scored on those same ratings, and the update is only published if it
+does no worse than the model it started from.
+"""
+import os
+import re
+
+import numpy as np
+import pandas as pd
+
+from artifact import load_model_artifact, save_model_artifact
+from mf_sgd import rmse_mae, sgd_epoch
+from ratings_extract import RATINGS_QUERY, load_ratings_cache, stream_ratings_to_cache
+from ridge import solve_ridge_rows, to_csr
+
+_IDENTIFIER = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+INCREMENTAL_BATCH_SIZE = 256
+
+
+class IncrementalRejected(Exception):
+    """The updated model did worse on the held-out delta than the model it started from."""
+
+
+class IncrementalUnavailable(Exception):
+    """No incremental update is possible (e.g. no watermark); run a full retrain."""
+
+
+def _check_column(column):
+    if not _IDENTIFIER.match(column):
+        raise ValueError(f"invalid watermark column name: {column!r}")
+    return column
+
+
+def _row_lookup(item_ids):
+    """Function mapping raw game ids to rows of `item_ids` (-1 for unknown games)."""
+    order = np.argsort(item_ids, kind="stable")
+    sorted_ids = item_ids[order]
+
+    def rows(game_ids):
+        if len(sorted_ids) == 0:
+            return np.full(len(game_ids), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(sorted_ids, game_ids), len(order) - 1)
+        return np.where(sorted_ids[pos] == game_ids, order[pos], -1)
+    return rows
+
+
+def fetch_watermark(conn, column):
+    """Current max of the watermark column (None if the table is empty or has no such column)."""
+    with conn.cursor() as cursor:
+        try:
+            cursor.execute(f"SELECT max({_check_column(column)}) FROM user_ratings")
+        except Exception as e:
+            conn.rollback()
+            print(f"No usable watermark column '{column}':", e)
+            return None
+        value = cursor.fetchone()[0]
+    # timestamps are stored in the manifest as ISO strings; PostgreSQL casts them back
+    return value.isoformat() if hasattr(value, "isoformat") else value
+
+
+def fetch_delta(conn, column, since, until, cache_dir):
+    """
+    Fetch the new ratings and the full histories of the users who made them.
+
+    Returns:
+        delta (DataFrame): Ratings with since < column <= until.
+        history (DataFrame): All ratings of the affected users (includes the delta).
+    """
+    column = _check_column(column)
+    with conn.cursor() as cursor:
+        window = cursor.mogrify(f"{column} > %s AND {column} <= %s", (since, until)).decode()
+    delta_query = f"{RATINGS_QUERY} AND {window}"
+    history_query = (f"{RATINGS_QUERY} AND user_id IN "
+                     f"(SELECT DISTINCT user_id FROM user_ratings WHERE {window})")
+
+    stream_ratings_to_cache(conn, os.path.join(cache_dir, "delta"), delta_query)
+    stream_ratings_to_cache(conn, os.path.join(cache_dir, "history"), history_query)
+    return (load_ratings_cache(os.path.join(cache_dir, "delta")),
+            load_ratings_cache(os.path.join(cache_dir, "history")))
+
+
+def update_model(previous, delta, history, n_epochs=3, lr=0.005, reg=0.02, holdout_frac=0.1,
+                 min_new_item_ratings=1, batch_size=INCREMENTAL_BATCH_SIZE, full=None, seed=42):
+    """
+    Warm-start SGD update of a CF model from a rating delta.
+
+    Parameters:
+        previous (dict): Arrays of the previous artifact plus 'global_mean' and 'reg_coeff'.
+        delta (DataFrame): New ratings (user_id, game_id, rating).
+        history (DataFrame): All ratings of the affected users.
+        n_epochs (int): SGD passes over the affected users' ratings.
+        lr, reg (float): SGD learning rate and regularisation (as surprise.SVD).
+        holdout_frac (float): Share of the delta held out for the drift report.
+        min_new_item_ratings (int): New games need this many delta ratings to be added.
+        batch_size (int): SGD mini-batch size. Updates are averaged per user / item
+            within a batch: the training set is a few users' full histories, so rows
+            repeat many times per batch and summed updates overshoot.
+        full (dict, optional): item_factors, item_biases, item_ids of the last full
+            retrain, scored on the same holdout for the drift report.
+
+    Returns:
+        model (dict): item_factors, item_biases, item_ids, global_mean.
+        metrics (dict): Holdout RMSE/MAE of the previous, updated and full model.
+            rmse_change_vs_previous (updated - previous, same holdout ratings)
+            is what run_incremental gates on.
+    """
+    rng = np.random.default_rng(seed)
+    global_mean = previous["global_mean"]
+    history = history.drop_duplicates(subset=["user_id", "game_id"], keep="last")
+    delta = delta.drop_duplicates(subset=["user_id", "game_id"], keep="last")
+
+    # ----------- Items: keep old rows, append new games -----------
+    item_ids = previous["item_ids"]
+    counts = delta["game_id"].value_counts()
+    new_games = counts[(counts >= min_new_item_ratings) & ~counts.index.isin(item_ids)].index.to_numpy()
+    n_old, n_factors = previous["item_factors"].shape
+    Q = np.vstack([previous["item_factors"].astype(np.float64),
+                   rng.normal(0, 0.1, (len(new_games), n_factors))])  # surprise init_std_dev
+    bi = np.concatenate([previous["item_biases"].astype(np.float64), np.zeros(len(new_games))])
+    all_item_ids = np.concatenate([item_ids, new_games.astype(item_ids.dtype)])
+    item_rows = _row_lookup(all_item_ids)
+
+    history = history.assign(item=item_rows(history["game_id"].to_numpy()))
+    history = history[history["item"] >= 0]
+
+    # ----------- Hold out part of the delta for the drift report -----------
+    delta_keys = pd.MultiIndex.from_frame(delta[["user_id", "game_id"]])
+    in_delta = pd.MultiIndex.from_frame(history[["user_id", "game_id"]]).isin(delta_keys)
+    holdout = in_delta & (rng.random(len(history)) < holdout_frac)
+    train, test = history[~holdout], history[holdout]
+
+    user_codes, user_ids = pd.factorize(np.concatenate([train["user_id"].to_numpy(),
+                                                        test["user_id"].to_numpy()]))
+    users_train, users_test = user_codes[:len(train)], user_codes[len(train):]
+    items_train, items_test = train["item"].to_numpy(), test["item"].to_numpy()
+    ratings_train = train["rating"].to_numpy(dtype=np.float64)
+    ratings_test = test["rating"].to_numpy(dtype=np.float64)
+
+    def fold_in(Q_, bi_, train_rows):
+        # Same ridge solve as the service fold-in (unregularised user bias).
+        known = train_rows >= 0
+        indptr, cols, targets = to_csr(users_train[known], train_rows[known],
+                                       ratings_train[known] - global_mean - bi_[train_rows[known]], len(user_ids))
+        return solve_ridge_rows(indptr, cols, targets, Q_, previous["reg_coeff"])
+
+    def holdout_rmse_mae(Q_, bi_, model_item_ids, scored):
+        """Fold the affected users in against a model, as the service would, and score holdout rows `scored`."""
+        rows = _row_lookup(model_item_ids)
+        bu_, P_ = fold_in(Q_, bi_, rows(train["game_id"].to_numpy()))
+        test_rows = rows(test["game_id"].to_numpy()[scored])
+        return rmse_mae(users_test[scored], test_rows, ratings_test[scored], global_mean, bu_, bi_, P_, Q_)
+
+    # Every model is scored on the holdout ratings of games the previous model knows,
+    # so the numbers below differ only in the model.
+    metrics = {"holdout_ratings": int(len(test))}
+    known_before = items_test < n_old
+    if known_before.any():
+        metrics["previous_rmse"], metrics["previous_mae"] = holdout_rmse_mae(
+            previous["item_factors"].astype(np.float64), previous["item_biases"].astype(np.float64),
+            item_ids, known_before)
+    known_to_full = None
+    if full is not None:
+        known_to_full = known_before & np.isin(test["game_id"].to_numpy(), full["item_ids"])
+    if known_to_full is not None and known_to_full.any():
+        metrics["full_rmse"], metrics["full_mae"] = holdout_rmse_mae(
+            full["item_factors"].astype(np.float64), full["item_biases"].astype(np.float64),
+            full["item_ids"], known_to_full)
+
+    # ----------- Warm-started SGD passes -----------
+    bu, P = fold_in(Q, bi, items_train)
+    item_mask = np.zeros(len(all_item_ids), dtype=bool)
+    delta_rows = item_rows(delta["game_id"].to_numpy())
+    item_mask[delta_rows[delta_rows >= 0]] = True
+    for epoch in range(1, n_epochs + 1):
+        sgd_epoch(users_train, items_train, ratings_train, global_mean, bu, bi, P, Q,
+                  lr, reg, rng, batch_size=batch_size, item_mask=item_mask, average_updates=True)
+        train_rmse, _ = rmse_mae(users_train, items_train, ratings_train, global_mean, bu, bi, P, Q)
+        print(f"Incremental epoch {epoch}, train RMSE on affected users: {train_rmse:.4f}")
+
+    # Re-fold users against the updated items, as the service will.
+    if len(test):
+        metrics["incremental_rmse"], metrics["incremental_mae"] = holdout_rmse_mae(
+            Q, bi, all_item_ids, np.ones(len(test), dtype=bool))
+    if "previous_rmse" in metrics:
+        rmse, mae = holdout_rmse_mae(Q, bi, all_item_ids, known_before)
+        metrics["rmse_change_vs_previous"] = rmse - metrics["previous_rmse"]
+        metrics["mae_change_vs_previous"] = mae - metrics["previous_mae"]
+    if "full_rmse" in metrics:
+        rmse, mae = holdout_rmse_mae(Q, bi, all_item_ids, known_to_full)
+        metrics["drift_rmse_vs_full"] = rmse - metrics["full_rmse"]
+        metrics["drift_mae_vs_full"] = mae - metrics["full_mae"]
+
+    metrics.update({"affected_users": int(len(user_ids)),
+                    "updated_items": int(item_mask.sum()),
+                    "new_items": int(len(new_games))})
+    model = {"item_factors": Q, "item_biases": bi, "item_ids": all_item_ids, "global_mean": global_mean}
+    return model, metrics
+
+
+def last_full_model(version_dir, arrays, manifest):
+    """
+    Version and arrays of the last full retrain before the artifact in version_dir.
+
+    Returns (version, arrays) with arrays None if that version is no longer on
+    disk (or unknown, for incremental artifacts written before it was recorded).
+    """
+    if manifest.get("training_mode") != "incremental":
+        return manifest["model_version"], arrays
+    full_version = manifest.get("last_full_version")
+    full_dir = os.path.join(os.path.dirname(os.path.abspath(version_dir)), full_version or "")
+    if full_version is None or not os.path.isdir(full_dir):
+        print("Last full retrain is not on disk; no drift report against it.")
+        return full_version, None
+    full_arrays, _ = load_model_artifact(full_dir)
+    return full_version, full_arrays
+
+
+def run_incremental(conn, version_dir, output_dir, watermark_column, cache_dir, factor_dtype=None,
+                    extra_arrays_fn=None, **update_kwargs):
+    """
+    Fetch the delta since the artifact in version_dir and publish an updated artifact.
+
+    factor_dtype is the stored factor encoding of the new artifact (default:
+    the previous artifact's); extra_arrays_fn(item_factors, item_ids), if
+    given, returns more arrays to store with it (e.g. the neighbour table).
+
+    Returns:
+        Path of the new version directory, or None if there was nothing new.
+
+    Raises:
+        IncrementalRejected: if the update's holdout RMSE is worse than the
+            previous model's on the same ratings; nothing is published.
+        IncrementalUnavailable: if the artifact or the table has no watermark.
+    """
+    arrays, manifest = load_model_artifact(version_dir)
+    since = manifest.get("watermark")
+    until = fetch_watermark(conn, watermark_column)
+    if since is None or until is None:
+        raise IncrementalUnavailable("previous artifact or table has no watermark")
+    if until == since:
+        print("No ratings newer than the watermark; keeping model", manifest["model_version"])
+        return None
+
+    print(f"Fetching ratings with {watermark_column} in ({since}, {until}]...")
+    delta, history = fetch_delta(conn, watermark_column, since, until, cache_dir)
+    print(f"New ratings: {len(delta)}, affected users' ratings: {len(history)}")
+
+    previous = dict(arrays, global_mean=manifest["global_mean"], reg_coeff=manifest["reg_coeff"])
+    full_version, full = last_full_model(version_dir, arrays, manifest)
+    model, metrics = update_model(previous, delta, history, full=full, **update_kwargs)
+
+    print("Incremental update report:")
+    for key, value in metrics.items():
+        print(f"  {key}: {value}")
+    if "rmse_change_vs_previous" in metrics and not metrics["rmse_change_vs_previous"] <= 0:
+        # "not <=" also rejects a NaN RMSE from a diverged update.
+        raise IncrementalRejected(
+            f"incremental update changes the holdout RMSE by {metrics['rmse_change_vs_previous']:+.4f} "
+            f"against the previous model ({metrics['previous_rmse']:.4f}); not publishing it")
+    full_metrics = manifest.get("last_full_metrics") or manifest.get("metrics", {})
+
+    return save_model_artifact(
+        output_dir,
+        item_factors=model["item_factors"],
+        item_biases=model["item_biases"],
+        global_mean=model["global_mean"],
+        item_ids=model["item_ids"],
+        reg_coeff=manifest["reg_coeff"],
+        metrics=metrics,
+        extra={
+            "training_mode": "incremental",
+            "watermark": until,
+            "base_version": manifest["model_version"],
+            "last_full_version": full_version,
+            "incremental_runs_since_full": manifest.get("incremental_runs_since_full", 0) + 1,
+            "last_full_metrics": full_metrics,
+        },
+        factor_dtype=factor_dtype or manifest.get("factor_dtype", "float64"),
+        extra_arrays=extra_arrays_fn(model["item_factors"], model["item_ids"]) if extra_arrays_fn else None,
+    )
@@ -0,0 +1,147 @@
+"""
+Vectorised SGD for the biased matrix-factorisation model Surprise's SVD fits:
+
+    r_ui ~ global_mean + b_u + b_i + p_u . q_i
+
+Ratings are visited in shuffled mini-batches; every rating in a batch is
+evaluated against the parameters at the start of the batch and the per-rating
+SGD updates (same form and defaults as surprise.SVD) are scattered back with
+np.add.at.
+"""
+import numpy as np
+import pandas as pd
+
+BATCH_SIZE = 4096
+
+
+def predict(users, items, global_mean, bu, bi, P, Q):
+    """Predicted ratings for (user row, item row) pairs."""
+    return global_mean + bu[users] + bi[items] + np.einsum('ij,ij->i', P[users], Q[items])
+
+
+def rmse_mae(users, items, ratings, global_mean, bu, bi, P, Q):
+    err = ratings - predict(users, items, global_mean, bu, bi, P, Q)
+    return float(np.sqrt(np.mean(err ** 2))), float(np.mean(np.abs(err)))
+
+
+def sgd_epoch(users, items, ratings, global_mean, bu, bi, P, Q, lr, reg, rng,
+              batch_size=BATCH_SIZE, item_mask=None, average_updates=False):
+    """
+    One pass of mini-batch SGD over all ratings; updates bu, bi, P, Q in place.
+
+    Parameters:
+        users, items (np.array): Row indices into bu/P and bi/Q per rating.
+        ratings (np.array): Observed ratings.
+        lr, reg (float): Learning rate and regularisation (surprise lr_all / reg_all).
+        rng (np.random.Generator): Shuffles the rating order.
+        item_mask (np.array of bool, optional): Only items where this is True
+            are updated; the rest stay frozen.
+        average_updates (bool): Divide each rating's update by the number of
+            ratings its user (item) has in the batch, so a row gets the mean of
+            its updates instead of their sum. Needed when rows repeat a lot
+            within a batch (e.g. a few users' full histories); summing then
+            overshoots and diverges.
+    """
+    order = rng.permutation(len(ratings))
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        u, i = users[batch], items[batch]
+        pu, qi = P[u], Q[i]
+        err = ratings[batch] - (global_mean + bu[u] + bi[i] + np.einsum('ij,ij->i', pu, qi))
+        # Per-rating step sizes; with average_updates a row's steps sum to lr.
+        lr_u = lr / np.bincount(u)[u] if average_updates else np.full(len(u), lr)
+        lr_i = lr / np.bincount(i)[i] if average_updates else lr_u
+
+        np.add.at(bu, u, lr_u * (err - reg * bu[u]))
+        np.add.at(P, u, lr_u[:, None] * (err[:, None] * qi - reg * pu))
+        if item_mask is not None:
+            keep = item_mask[i]
+            i, err, pu, qi, lr_i = i[keep], err[keep], pu[keep], qi[keep], lr_i[keep]
+        np.add.at(bi, i, lr_i * (err - reg * bi[i]))
+        np.add.at(Q, i, lr_i[:, None] * (err[:, None] * pu - reg * qi))
+
+
+class FactorModel:
+    """Trained biased-MF parameters plus the raw id of every user / item row."""
+
+    def __init__(self, global_mean, bu, bi, P, Q, user_ids, item_ids, reg_all):
+        self.global_mean = global_mean
+        self.bu, self.bi, self.P, self.Q = bu, bi, P, Q
+        self.user_ids = np.asarray(user_ids)
+        self.item_ids = np.asarray(item_ids)
+        self.reg_all = reg_all
+        self._user_order = np.argsort(self.user_ids, kind="stable")
+        self._item_order = np.argsort(self.item_ids, kind="stable")
+
+    @staticmethod
+    def _rows(raw_ids, ids, order):
+        if len(ids) == 0:
+            return np.full(len(raw_ids), -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(ids[order], raw_ids), len(ids) - 1)
+        return np.where(ids[order][pos] == raw_ids, order[pos], -1)
+
+    def predict(self, user_ids, item_ids, rating_scale=(0, 10)):
+        """
+        Predict ratings for raw (user_id, item_id) pairs like surprise.SVD.estimate:
+        unknown users / items drop their bias and factor terms; results are clipped.
+        """
+        u = self._rows(np.asarray(user_ids), self.user_ids, self._user_order)
+        i = self._rows(np.asarray(item_ids), self.item_ids, self._item_order)
+        known_u, known_i = u >= 0, i >= 0
+        both = known_u & known_i
+        est = np.full(len(u), self.global_mean, dtype=np.float64)
+        est[known_u] += self.bu[u[known_u]]
+        est[known_i] += self.bi[i[known_i]]
+        est[both] += np.einsum('ij,ij->i', self.P[u[both]], self.Q[i[both]])
+        return np.clip(est, *rating_scale)
+
+
+def fit_with_early_stopping(train_df, valid_df, n_factors=50, max_epochs=30, patience=3,
+                            lr=0.005, reg=0.02, seed=42, batch_size=BATCH_SIZE, rating_scale=(0, 10)):
+    """
+    Train biased MF with SGD, evaluating validation RMSE after every epoch.
+
+    The epochs run once (not refitted from epoch 1 for each epoch count); the
+    parameters of the best epoch are kept and training stops after
+    `patience` epochs without improvement.
+
+    Returns:
+        FactorModel with the best-epoch parameters.
+    """
+    rng = np.random.default_rng(seed)
+    user_codes, user_ids = pd.factorize(train_df["user_id"])
+    item_codes, item_ids = pd.factorize(train_df["game_id"])
+    ratings = train_df["rating"].to_numpy(dtype=np.float64)
+    global_mean = float(ratings.mean())
+
+    # Same initialisation as surprise.SVD: zero biases, N(0, 0.1) factors.
+    bu = np.zeros(len(user_ids))
+    bi = np.zeros(len(item_ids))
+    P = rng.normal(0, 0.1, (len(user_ids), n_factors))
+    Q = rng.normal(0, 0.1, (len(item_ids), n_factors))
+
+    model = FactorModel(global_mean, bu, bi, P, Q, user_ids, item_ids, reg)
+    valid_ratings = valid_df["rating"].to_numpy(dtype=np.float64)
+
+    best_rmse = np.inf
+    best_params = None
+    epochs_without_improve = 0
+    for epoch in range(1, max_epochs + 1):
+        sgd_epoch(user_codes, item_codes, ratings, global_mean, bu, bi, P, Q, lr, reg, rng, batch_size)
+
+        pred = model.predict(valid_df["user_id"].to_numpy(), valid_df["game_id"].to_numpy(), rating_scale)
+        current_rmse = float(np.sqrt(np.mean((valid_ratings - pred) ** 2)))
+        print(f"Epoch {epoch}, Validation RMSE: {current_rmse:.4f}")
+
+        if current_rmse < best_rmse:
+            best_rmse = current_rmse
+            best_params = (bu.copy(), bi.copy(), P.copy(), Q.copy())
+            epochs_without_improve = 0
+        else:
+            epochs_without_improve += 1
+
+        if epochs_without_improve >= patience:
+            print(f"Early stopping at epoch {epoch}. Best Validation RMSE: {best_rmse:.4f}")
+            break
+
+    return FactorModel(global_mean, *best_params, user_ids, item_ids, reg)
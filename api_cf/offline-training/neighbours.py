@@ -0,0 +1,93 @@
+"""
+Item-item "more like this" table for the model artifact.
+
+For every CF item, its top-K neighbours by
+
+    (1 - theme_weight) * cos(item_factors) + theme_weight * cos(theme flags)
+
+with the theme flags taken from themes.pkl (items without theme data only
+get the factor term). Both cosines come out of one GEMM over the
+concatenation [sqrt(1 - w) * factors / |factors|, sqrt(w) * themes / |themes|],
+computed one block of rows at a time, so memory is bounded by
+block_budget_bytes and the N x N matrix is never materialised.
+
+The table is two (num_items, K) arrays: int32 raw item ids and float16
+scores, best first; the service answers /similar/<game_id> with one row.
+"""
+import numpy as np
+import pandas as pd
+
+# Theme columns flagged on this many games or fewer are dropped (as the service does).
+MIN_THEME_COUNT = 20
+
+# Working memory per block. A block row costs num_items * 16 bytes: float32
+# scores plus argpartition's int64 indices and its partitioned copy.
+BLOCK_BUDGET_BYTES = 256 * 1024 * 1024
+_BYTES_PER_SCORE = 16
+
+
+def theme_vectors(df_themes, item_ids, id_column="BGGId", min_theme_count=MIN_THEME_COUNT):
+    """
+    Theme flags of each CF item, aligned with item_ids.
+
+    Returns:
+        np.array (num_items x num_themes) float32, zero rows for items without theme data.
+    """
+    cols_sum = df_themes.drop(columns=[id_column]).sum(axis=0, numeric_only=True)
+    keep = cols_sum[cols_sum > min_theme_count].index
+    flags = df_themes.set_index(id_column)[keep]
+    flags = flags[~flags.index.duplicated(keep="first")]
+    return flags.reindex(pd.Index(item_ids)).fillna(0).to_numpy(dtype=np.float32)
+
+
+def _unit_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1)
+    inv = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    return matrix * inv[:, None]
+
+
+def build_item_neighbours(item_factors, item_ids, themes=None, k=20, theme_weight=0.3,
+                          block_budget_bytes=BLOCK_BUDGET_BYTES, verbose=True):
+    """
+    Top-k neighbours of every item, computed in row blocks.
+
+    Parameters:
+        item_factors (np.array): Item latent vectors (num_items x n_factors).
+        item_ids (array-like): Raw item id of each row (must fit int32).
+        themes (np.array, optional): Theme flags aligned with item_ids (see theme_vectors).
+        k (int): Neighbours kept per item.
+        theme_weight (float): Weight of the theme cosine in the blend (ignored without themes).
+        block_budget_bytes (int): Working memory allowed for one block of rows.
+        verbose (bool): Print progress.
+
+    Returns:
+        neighbour_ids (np.array): (num_items, k) int32 raw ids, best first.
+        neighbour_scores (np.array): (num_items, k) float16 blended similarities.
+    """
+    item_ids = np.asarray(item_ids)
+    if item_ids.size and (item_ids.min() < np.iinfo(np.int32).min or item_ids.max() > np.iinfo(np.int32).max):
+        raise ValueError("item ids do not fit int32")
+    n_items = len(item_ids)
+    k = max(0, min(int(k), n_items - 1))
+
+    vectors = _unit_rows(item_factors)
+    if themes is not None and theme_weight > 0:
+        vectors = np.hstack([np.sqrt(1 - theme_weight) * vectors, np.sqrt(theme_weight) * _unit_rows(themes)])
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+
+    neighbour_rows = np.empty((n_items, k), dtype=np.int64)
+    neighbour_scores = np.empty((n_items, k), dtype=np.float16)
+    block_rows = max(1, int(block_budget_bytes // max(1, n_items * _BYTES_PER_SCORE)))
+    for lo in range(0, n_items, block_rows):
+        hi = min(lo + block_rows, n_items)
+        scores = vectors[lo:hi].dot(vectors.T)
+        scores[np.arange(hi - lo), np.arange(lo, hi)] = -np.inf   # an item is not its own neighbour
+        top = np.argpartition(scores, -k, axis=1)[:, -k:] if k else np.empty((hi - lo, 0), dtype=np.int64)
+        top_scores = np.take_along_axis(scores, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        neighbour_rows[lo:hi] = np.take_along_axis(top, order, axis=1)
+        neighbour_scores[lo:hi] = np.take_along_axis(top_scores, order, axis=1)
+        if verbose and (lo // block_rows) % 10 == 0:
+            print(f"Neighbours: {hi}/{n_items} items")
+    return item_ids[neighbour_rows].astype(np.int32), neighbour_scores
@@ -0,0 +1,143 @@
+"""
+Streaming extraction of the user_ratings table.
+
+`COPY (...) TO STDOUT WITH CSV` is streamed through a small file-like sink:
+every few MB of CSV is decoded by pandas' C parser straight into typed
+NumPy columns (int32 ids, float32 ratings) and appended to a local columnar
+cache, so no Python object is ever built per row. Peak memory is the final
+columns plus one chunk.
+
+Cache layout (<cache_dir>/):
+    meta.json       # rows, columns + dtypes, query, created_at
+    user_id.bin     # raw little-endian column data
+    game_id.bin
+    rating.bin
+"""
+import io
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+RATINGS_QUERY = (
+    "SELECT user_id, game_id, rating FROM user_ratings "
+    "WHERE user_id IS NOT NULL AND game_id IS NOT NULL AND rating IS NOT NULL"
+)
+COLUMNS = {"user_id": np.dtype("<i4"), "game_id": np.dtype("<i4"), "rating": np.dtype("<f4")}
+META_FILE = "meta.json"
+CHUNK_BYTES = 16 * 1024 * 1024
+
+
+class _CopyChunkDecoder:
+    """
+    File-like sink for cursor.copy_expert.
+
+    Buffers the CSV stream and hands every complete block of lines, decoded
+    into typed columns, to `on_chunk`.
+    """
+
+    def __init__(self, on_chunk, chunk_bytes=CHUNK_BYTES):
+        self._on_chunk = on_chunk
+        self._chunk_bytes = chunk_bytes
+        self._pending = bytearray()
+        self.rows = 0
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        self._pending += data
+        if len(self._pending) >= self._chunk_bytes:
+            self._decode(final=False)
+        return len(data)
+
+    def close(self):
+        self._decode(final=True)
+
+    def _decode(self, final):
+        cut = len(self._pending) if final else self._pending.rfind(b"\n") + 1
+        if cut <= 0:
+            return
+        block = bytes(self._pending[:cut])
+        del self._pending[:cut]
+        frame = pd.read_csv(io.BytesIO(block), header=None, names=list(COLUMNS),
+                            dtype={name: dtype for name, dtype in COLUMNS.items()}, engine="c")
+        self.rows += len(frame)
+        self._on_chunk({name: frame[name].to_numpy(dtype=dtype) for name, dtype in COLUMNS.items()})
+
+
+def stream_ratings_to_cache(conn, cache_dir, query=RATINGS_QUERY, chunk_bytes=CHUNK_BYTES):
+    """
+    COPY the ratings out of PostgreSQL into a columnar cache directory.
+
+    Parameters:
+        conn: Open psycopg2 connection.
+        cache_dir (str): Destination; replaced atomically once the copy completes.
+        query (str): SELECT producing user_id, game_id, rating.
+        chunk_bytes (int): CSV bytes decoded per chunk.
+
+    Returns:
+        Number of rows written.
+    """
+    parent = os.path.dirname(os.path.abspath(cache_dir))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=".ratings-", dir=parent)
+    files = {name: open(os.path.join(tmp_dir, f"{name}.bin"), "wb") for name in COLUMNS}
+    try:
+        def append(columns):
+            for name, values in columns.items():
+                files[name].write(values.tobytes())
+
+        sink = _CopyChunkDecoder(append, chunk_bytes)
+        with conn.cursor() as cursor:
+            cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH (FORMAT csv)", sink)
+        sink.close()
+    except BaseException:
+        for f in files.values():
+            f.close()
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    for f in files.values():
+        f.close()
+
+    meta = {
+        "rows": sink.rows,
+        "columns": {name: dtype.str for name, dtype in COLUMNS.items()},
+        "query": query,
+        "created_at": time.time(),
+    }
+    with open(os.path.join(tmp_dir, META_FILE), "w") as f:
+        json.dump(meta, f, indent=2)
+
+    if os.path.isdir(cache_dir):
+        shutil.rmtree(cache_dir)
+    os.rename(tmp_dir, cache_dir)
+    return sink.rows
+
+
+def cache_age_hours(cache_dir):
+    """Age of a complete cache in hours, or None if there is none."""
+    meta_path = os.path.join(cache_dir, META_FILE)
+    if not os.path.isfile(meta_path):
+        return None
+    with open(meta_path) as f:
+        return (time.time() - json.load(f)["created_at"]) / 3600
+
+
+def load_ratings_cache(cache_dir):
+    """
+    Read a columnar cache back as a DataFrame with typed columns.
+
+    Returns:
+        DataFrame with user_id (int32), game_id (int32) and rating (float32).
+    """
+    with open(os.path.join(cache_dir, META_FILE)) as f:
+        meta = json.load(f)
+    columns = {
+        name: np.fromfile(os.path.join(cache_dir, f"{name}.bin"), dtype=np.dtype(dtype), count=meta["rows"])
+        for name, dtype in meta["columns"].items()
+    }
+    return pd.DataFrame(columns, copy=False)
@@ -0,0 +1,90 @@
+"""
+Batched per-row ridge solves shared by the offline trainers.
+
+For every row r of a CSR matrix (a user's or an item's ratings) this solves
+
+    min_{b, x}  sum_c (t_rc - b - f_c . x)^2 + reg * |x|^2 + reg_bias * b^2
+
+which, with reg_bias = 0, is exactly the fold-in solved by the recommender
+service (recommender/fold_in.compute_user_profile).
+"""
+import numpy as np
+
+# Padded design tensor entries (rows x width) per stacked solve; bounds memory.
+PAD_BUDGET = 250_000
+
+
+def solve_ridge_rows(indptr, cols, targets, factors, reg, reg_bias=0.0, rows=None, pad_budget=PAD_BUDGET):
+    """
+    Solve the ridge system of many CSR rows at once.
+
+    Parameters:
+        indptr, cols (np.array): CSR structure; cols index into `factors`.
+        targets (np.array): Residual ratings aligned with `cols`.
+        factors (np.array): Fixed factors of the other side (num_cols x k).
+        reg (float): Regularisation on the latent vector.
+        reg_bias (float): Regularisation on the bias (0 = unregularised).
+        rows (np.array, optional): Subset of rows to solve; default all.
+        pad_budget (int): Max rows x width entries per stacked solve.
+
+    Returns:
+        biases (np.array): (len(rows),) solved biases, 0 for empty rows.
+        vectors (np.array): (len(rows), k) solved latent vectors, 0 for empty rows.
+    """
+    n_factors = factors.shape[1]
+    rows = np.arange(len(indptr) - 1) if rows is None else np.asarray(rows)
+    counts = indptr[rows + 1] - indptr[rows]
+    biases = np.zeros(len(rows), dtype=np.float64)
+    vectors = np.zeros((len(rows), n_factors), dtype=np.float64)
+
+    reg_matrix = np.eye(n_factors + 1) * reg
+    reg_matrix[0, 0] = reg_bias
+
+    # Sort by row length so every stacked solve pads to a similar width.
+    by_count = np.argsort(counts, kind="stable")
+    by_count = by_count[counts[by_count] > 0]
+    for lo, hi in _padded_chunks(counts[by_count], pad_budget):
+        chunk = by_count[lo:hi]
+        width = int(counts[chunk].max())
+
+        offsets = np.arange(width)
+        mask = offsets[None, :] < counts[chunk][:, None]
+        pos = np.where(mask, indptr[rows[chunk]][:, None] + offsets[None, :], 0)
+        X = np.zeros((len(chunk), width, n_factors + 1))
+        X[:, :, 0] = mask
+        X[:, :, 1:] = factors[cols[pos]] * mask[:, :, None]
+        y = np.where(mask, targets[pos], 0.0)
+
+        Xt = X.transpose(0, 2, 1)
+        A = np.matmul(Xt, X) + reg_matrix
+        rhs = np.matmul(Xt, y[:, :, None])
+        theta = np.linalg.solve(A, rhs)[:, :, 0]
+        biases[chunk] = theta[:, 0]
+        vectors[chunk] = theta[:, 1:]
+    return biases, vectors
+
+
+def _padded_chunks(sorted_counts, pad_budget):
+    """
+    Split rows sorted by ascending count into (lo, hi) ranges whose padded
+    size (rows x widest row) stays within pad_budget; a single row wider than
+    the budget gets a range of its own.
+    """
+    ranges = []
+    lo, n = 0, len(sorted_counts)
+    while lo < n:
+        # Counts ascend, so the padded size grows with every row added to the range.
+        span = sorted_counts[lo:lo + max(1, pad_budget // sorted_counts[lo])]
+        cells = np.arange(1, len(span) + 1) * span
+        hi = lo + max(1, int(np.searchsorted(cells, pad_budget, side="right")))
+        ranges.append((lo, hi))
+        lo = hi
+    return ranges
+
+
+def to_csr(row_idx, col_idx, values, n_rows):
+    """Group (row, col, value) triplets by row. Returns (indptr, cols, values)."""
+    order = np.argsort(row_idx, kind="stable")
+    indptr = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(np.bincount(row_idx, minlength=n_rows), out=indptr[1:])
+    return indptr, col_idx[order], values[order]
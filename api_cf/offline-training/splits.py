@@ -0,0 +1,43 @@
+"""
+Per-user train / validation / test split of the ratings.
+
+One seeded shuffle of all ratings; each rating's rank within its user then
+decides its split, so no Python loop runs over the users. Per user with n
+ratings:
+
+    n_train = max(1, round(train_frac * n))
+    n_valid = max(1, round(valid_frac * n))
+    n_test  = the rest, at least 1 (taken from n_train)
+
+Users with fewer than 3 ratings are dropped.
+"""
+import numpy as np
+
+
+def split_by_user(df, train_frac=0.8, valid_frac=0.1, seed=42):
+    """
+    Split a user_id / game_id / rating frame per user.
+
+    Returns:
+        train_df, valid_df, test_df (DataFrames, shuffled, fresh index);
+        the same seed gives the same split.
+    """
+    # One seeded shuffle, then each rating's rank within its user decides its split
+    rng = np.random.default_rng(seed)
+    df = df.iloc[rng.permutation(len(df))].reset_index(drop=True)
+
+    by_user = df.groupby('user_id', sort=False)
+    rank = by_user.cumcount().to_numpy()
+    n_ratings = by_user['user_id'].transform('size').to_numpy()
+
+    # At least one rating per user in every split; users with fewer than 3 are dropped
+    n_train = np.maximum(1, np.rint(train_frac * n_ratings)).astype(np.int64)
+    n_valid = np.maximum(1, np.rint(valid_frac * n_ratings)).astype(np.int64)
+    n_test = n_ratings - n_train - n_valid
+    n_train = np.where(n_test < 1, n_ratings - n_valid - 1, n_train)
+
+    kept = n_ratings >= 3
+    train_df = df[kept & (rank < n_train)]
+    valid_df = df[kept & (rank >= n_train) & (rank < n_train + n_valid)]
+    test_df = df[kept & (rank >= n_train + n_valid)]
+    return train_df, valid_df, test_df
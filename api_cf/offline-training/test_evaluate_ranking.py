@@ -0,0 +1,43 @@
+"""
+Tests for the ranking metrics of the offline evaluation.
+
+    python -m pytest test_evaluate_ranking.py
+"""
+import numpy as np
+import pytest
+
+from evaluate_ranking import _STRIDE, ranking_metrics
+
+
+def relevant(per_user):
+    keys = [user * _STRIDE + item for user, items in enumerate(per_user) for item in items]
+    return np.sort(np.array(keys, dtype=np.int64)), np.array([len(items) for items in per_user])
+
+
+def test_metrics_by_hand():
+    recommended = np.array([[10, 11, 12, 13],
+                            [20, 21, -1, -1]])
+    keys, n_relevant = relevant([[11, 13, 99], [20]])
+
+    report = ranking_metrics(recommended, keys, n_relevant, ks=[2, 4], n_items=10)
+
+    # user 0 hits at ranks 2 and 4, user 1 at rank 1
+    assert report["precision@2"] == pytest.approx((1 / 2 + 1 / 2) / 2)
+    assert report["recall@2"] == pytest.approx((1 / 3 + 1) / 2)
+    assert report["precision@4"] == pytest.approx((2 / 4 + 1 / 4) / 2)
+    assert report["recall@4"] == pytest.approx((2 / 3 + 1) / 2)
+    d = 1 / np.log2(np.arange(2, 6))
+    ndcg0 = (d[1] + d[3]) / d[:3].sum()
+    assert report["ndcg@4"] == pytest.approx((ndcg0 + 1.0) / 2)
+    assert report["ndcg@2"] == pytest.approx((d[1] / d[:2].sum() + 1.0) / 2)
+    assert report["coverage@2"] == pytest.approx(4 / 10)
+    assert report["coverage@4"] == pytest.approx(6 / 10)    # -1 padding is not an item
+
+
+def test_hits_are_per_user():
+    # user 1 recommends an item only user 0 finds relevant
+    recommended = np.array([[5, 6], [5, 7]])
+    keys, n_relevant = relevant([[5], [7]])
+    report = ranking_metrics(recommended, keys, n_relevant, ks=[1, 2], n_items=3)
+    assert report["precision@1"] == pytest.approx(0.5)
+    assert report["recall@2"] == pytest.approx(1.0)
@@ -0,0 +1,63 @@
+"""
+Tests for the NumPy SGD matrix factorisation.
+
+    python -m pytest test_mf_sgd.py
+"""
+import numpy as np
+
+from mf_sgd import rmse_mae, sgd_epoch
+
+
+def params(n_users, n_items, n_factors=4, seed=0):
+    rng = np.random.default_rng(seed)
+    return (np.zeros(n_users), np.zeros(n_items),
+            rng.normal(0, 0.1, (n_users, n_factors)), rng.normal(0, 0.1, (n_items, n_factors)))
+
+
+def test_average_updates_give_each_row_the_mean_step():
+    # One user rating one item 100 times in a batch: summed steps are 100x the mean step.
+    users, items = np.zeros(100, dtype=np.int64), np.zeros(100, dtype=np.int64)
+    ratings = np.full(100, 9.0)
+    bu, bi, P, Q = params(1, 1)
+    P[:] = Q[:] = 0
+
+    sgd_epoch(users, items, ratings, 7.0, bu, bi, P, Q, lr=0.1, reg=0.0,
+              rng=np.random.default_rng(0), batch_size=100, average_updates=True)
+    np.testing.assert_allclose([bu[0], bi[0]], 0.1 * 2.0)   # lr * err, as for a single rating
+
+    bu, bi, P, Q = params(1, 1)
+    P[:] = Q[:] = 0
+    sgd_epoch(users, items, ratings, 7.0, bu, bi, P, Q, lr=0.1, reg=0.0,
+              rng=np.random.default_rng(0), batch_size=100)
+    assert np.isclose(bu[0], 100 * 0.1 * 2.0)
+
+
+def test_average_updates_match_plain_sgd_without_repeats():
+    users, items = np.arange(50), np.arange(50)[::-1].copy()
+    ratings = np.random.default_rng(1).uniform(1, 10, 50)
+    plain, averaged = params(50, 50), params(50, 50)
+    for state, average in ((plain, False), (averaged, True)):
+        sgd_epoch(users, items, ratings, 6.0, *state, lr=0.01, reg=0.02,
+                  rng=np.random.default_rng(2), batch_size=16, average_updates=average)
+    for a, b in zip(plain, averaged):
+        np.testing.assert_allclose(a, b)
+
+
+def test_frozen_items_and_convergence_with_repeated_rows():
+    rng = np.random.default_rng(3)
+    users, items = rng.integers(0, 5, 2000), rng.integers(0, 30, 2000)
+    true_bias = rng.normal(0, 1, 30)
+    ratings = 7.0 + true_bias[items]
+    bu, bi, P, Q = params(5, 30)
+    item_mask = np.arange(30) < 20
+    Q_before = Q.copy()
+
+    before, _ = rmse_mae(users, items, ratings, 7.0, bu, bi, P, Q)
+    for _ in range(20):
+        sgd_epoch(users, items, ratings, 7.0, bu, bi, P, Q, lr=0.5, reg=0.0, rng=rng,
+                  batch_size=512, item_mask=item_mask, average_updates=True)
+    after, _ = rmse_mae(users, items, ratings, 7.0, bu, bi, P, Q)
+
+    assert after < 0.5 * before
+    np.testing.assert_array_equal(Q[20:], Q_before[20:])
+    assert not bi[20:].any()
@@ -0,0 +1,49 @@
+"""
+Tests for the item-item neighbour table.
+
+    python -m pytest test_neighbours.py
+"""
+import numpy as np
+import pandas as pd
+
+from neighbours import build_item_neighbours, theme_vectors
+
+
+def brute_force(vectors, k):
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    sims = unit.dot(unit.T)
+    np.fill_diagonal(sims, -np.inf)
+    order = np.argsort(-sims, axis=1, kind="stable")[:, :k]
+    return order, np.take_along_axis(sims, order, axis=1)
+
+
+def test_top_k_matches_brute_force_across_blocks():
+    rng = np.random.default_rng(0)
+    factors = rng.normal(size=(120, 6))
+    item_ids = np.arange(120) * 5 + 1
+    # A budget of ~7 rows per block exercises the block loop.
+    ids, scores = build_item_neighbours(factors, item_ids, k=8, block_budget_bytes=120 * 16 * 7,
+                                        verbose=False)
+    rows, expected = brute_force(factors, 8)
+
+    assert ids.dtype == np.int32 and scores.dtype == np.float16 and ids.shape == (120, 8)
+    np.testing.assert_array_equal(ids, item_ids[rows])
+    np.testing.assert_allclose(scores, expected, atol=2e-3)
+    assert not (ids == item_ids[:, None]).any()          # never its own neighbour
+    assert (np.diff(scores.astype(np.float32), axis=1) <= 0).all()
+
+
+def test_theme_weight_blends_cosines_and_k_is_capped():
+    factors = np.array([[1.0, 0.0], [0.9, 0.1], [0.0, 1.0]])
+    themes = np.array([[1, 0], [0, 1], [1, 0]], dtype=np.float32)
+    ids, scores = build_item_neighbours(factors, [10, 20, 30], themes, k=5, theme_weight=0.9, verbose=False)
+
+    assert ids.shape == (3, 2)
+    assert ids[0, 0] == 30               # themes outweigh the factors at w=0.9
+    np.testing.assert_allclose(scores[0, 0], 0.9, atol=1e-3)
+
+
+def test_theme_vectors_align_with_item_ids():
+    df_themes = pd.DataFrame({"BGGId": [1, 2, 3], "A": [1, 0, 1], "B": [0, 1, 0]})
+    flags = theme_vectors(df_themes, [3, 99, 1], min_theme_count=0)
+    np.testing.assert_array_equal(flags, [[1, 0], [0, 0], [1, 0]])
@@ -0,0 +1,108 @@
+"""
+Tests for ratings_extract: a fake copy_expert stream stands in for PostgreSQL.
+
+    python -m pytest test_ratings_extract.py
+"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from ratings_extract import COLUMNS, cache_age_hours, load_ratings_cache, stream_ratings_to_cache
+
+
+class FakeConnection:
+    """Just enough of a psycopg2 connection for stream_ratings_to_cache."""
+
+    def __init__(self, csv_text, write_size=8192, as_str=False, fail_after=None):
+        self.csv_text = csv_text
+        self.write_size = write_size
+        self.as_str = as_str
+        self.fail_after = fail_after
+        self.sql = None
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def copy_expert(self, sql, sink):
+        self.sql = sql
+        data = self.csv_text if self.as_str else self.csv_text.encode()
+        for start in range(0, len(data), self.write_size):
+            if self.fail_after is not None and start >= self.fail_after:
+                raise RuntimeError("connection lost")
+            sink.write(data[start:start + self.write_size])
+
+
+def make_ratings(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "user_id": rng.integers(1, 2_000_000, n_rows).astype(np.int32),
+        "game_id": rng.integers(1, 400_000, n_rows).astype(np.int32),
+        "rating": np.round(rng.uniform(1, 10, n_rows), 3).astype(np.float32),
+    })
+
+
+def to_csv(frame):
+    return frame.to_csv(header=False, index=False, float_format="%.3f")
+
+
+@pytest.mark.parametrize("as_str", [False, True])
+@pytest.mark.parametrize("write_size,chunk_bytes", [(7, 64), (8192, 1024), (1 << 20, 1 << 24)])
+def test_round_trip_across_chunk_boundaries(tmp_path, write_size, chunk_bytes, as_str):
+    # Writes of 7 bytes into 64-byte chunks split nearly every line mid-way.
+    expected = make_ratings(5000)
+    conn = FakeConnection(to_csv(expected), write_size=write_size, as_str=as_str)
+    cache_dir = str(tmp_path / "cache")
+
+    rows = stream_ratings_to_cache(conn, cache_dir, chunk_bytes=chunk_bytes)
+    loaded = load_ratings_cache(cache_dir)
+
+    assert rows == len(expected) == len(loaded)
+    assert "COPY (" in conn.sql and "FORMAT csv" in conn.sql
+    pd.testing.assert_frame_equal(loaded, expected)
+
+
+def test_dtypes_after_cache_round_trip(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    stream_ratings_to_cache(FakeConnection("1,2,7.5\n3,4,10\n"), cache_dir)
+    loaded = load_ratings_cache(cache_dir)
+
+    assert list(loaded.columns) == list(COLUMNS)
+    assert {name: loaded[name].dtype for name in loaded} == dict(COLUMNS)
+    assert loaded["rating"].tolist() == [7.5, 10.0]
+    assert cache_age_hours(cache_dir) < 1
+
+
+def test_last_line_without_newline(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    assert stream_ratings_to_cache(FakeConnection("1,2,7.5\n3,4,6", write_size=5), cache_dir, chunk_bytes=8) == 2
+    assert load_ratings_cache(cache_dir)["user_id"].tolist() == [1, 3]
+
+
+def test_empty_stream(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    assert stream_ratings_to_cache(FakeConnection(""), cache_dir) == 0
+    loaded = load_ratings_cache(cache_dir)
+
+    assert len(loaded) == 0
+    assert {name: loaded[name].dtype for name in loaded} == dict(COLUMNS)
+
+
+def test_failed_copy_keeps_previous_cache(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    stream_ratings_to_cache(FakeConnection("1,2,7.5\n"), cache_dir)
+
+    with pytest.raises(RuntimeError):
+        stream_ratings_to_cache(FakeConnection(to_csv(make_ratings(1000)), write_size=100, fail_after=500),
+                                cache_dir, chunk_bytes=256)
+
+    assert load_ratings_cache(cache_dir)["game_id"].tolist() == [2]
+    assert sorted(os.listdir(tmp_path)) == ["cache"]   # no temp directory left behind
+    assert cache_age_hours(str(tmp_path / "missing")) is None
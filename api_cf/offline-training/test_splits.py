@@ -0,0 +1,51 @@
+"""
+Tests for the per-user train / valid / test split.
+
+    python -m pytest test_splits.py
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from splits import split_by_user
+
+
+def ratings_per_user(counts):
+    users = np.repeat(np.arange(1, len(counts) + 1), counts)
+    return pd.DataFrame({"user_id": users, "game_id": np.arange(len(users)) * 7,
+                         "rating": np.linspace(1, 10, len(users))})
+
+
+@pytest.mark.parametrize("n, expected", [
+    (3, (1, 1, 1)),       # the minimum: one rating in each split
+    (4, (2, 1, 1)),
+    (5, (3, 1, 1)),       # round(4.0) train would leave no test rating
+    (10, (8, 1, 1)),
+    (20, (16, 2, 2)),
+    (101, (81, 10, 10)),
+])
+def test_counts_per_user(n, expected):
+    train_df, valid_df, test_df = split_by_user(ratings_per_user([n]))
+    assert (len(train_df), len(valid_df), len(test_df)) == expected
+
+
+def test_small_users_dropped_and_ratings_partitioned():
+    df = ratings_per_user([1, 2, 3, 9, 40])
+    train_df, valid_df, test_df = split_by_user(df)
+
+    assert set(train_df["user_id"]) == set(valid_df["user_id"]) == set(test_df["user_id"]) == {3, 4, 5}
+    together = pd.concat([train_df, valid_df, test_df])
+    assert not together.duplicated(["user_id", "game_id"]).any()
+    kept = df[df["user_id"] >= 3]
+    pd.testing.assert_frame_equal(together.sort_values("game_id").reset_index(drop=True),
+                                  kept.reset_index(drop=True))
+
+
+def test_seed_makes_it_deterministic():
+    df = ratings_per_user([30, 12, 7])
+    first = split_by_user(df, seed=1)
+    again = split_by_user(df, seed=1)
+    other = split_by_user(df, seed=2)
+    for a, b in zip(first, again):
+        pd.testing.assert_frame_equal(a, b)
+    assert set(first[2]["game_id"]) != set(other[2]["game_id"])
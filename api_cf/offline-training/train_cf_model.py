@@ -1,13 +1,19 @@
+import json
 import os
+import sys
+import time
 import pandas as pd
 import psycopg2
-from psycopg2.extras import RealDictCursor
 from dotenv import load_dotenv
-from sklearn.utils import shuffle
 from pathlib import Path
-from surprise import Dataset, Reader, SVD, accuracy
 import numpy as np
-import pickle
+from artifact import latest_version_dir, load_model_artifact, save_model_artifact
+from incremental import IncrementalRejected, IncrementalUnavailable, fetch_watermark, run_incremental
+from neighbours import build_item_neighbours, theme_vectors
+from als import fit_als
+from mf_sgd import fit_with_early_stopping
+from ratings_extract import cache_age_hours, load_ratings_cache, stream_ratings_to_cache
+from splits import split_by_user
 
 # Load environment variables from the .env file
 # Check for an environment variable specifying which .env file to load.
@@ -23,45 +29,72 @@ DB_PASSWORD = os.getenv("DB_PASSWORD", "password")
 DB_NAME = os.getenv("DB_NAME", "recommend")
 USER_THRESHOLD = int(os.getenv("USER_THRESHOLD", 8))  # Minimum number of ratings per user
 GAMES_THRESHOLD = int(os.getenv("GAMES_THRESHOLD", 20))  # Minimum number of ratings per game
-MODEL_OUTPUT_PATH = os.getenv("MODEL_OUTPUT_PATH", '../model_data/item_factors.pkl')
+MODEL_OUTPUT_DIR = os.getenv("MODEL_OUTPUT_DIR", '../model_data/cf_model')
+RATINGS_CACHE_DIR = os.getenv("RATINGS_CACHE_DIR", "./data/ratings_cache")
+SPLIT_DIR = os.getenv("SPLIT_DIR", "./data")  # train/valid/test Parquet files
+SPLIT_SEED = int(os.getenv("SPLIT_SEED", 42))
+# Reuse the local ratings cache if it is younger than this many hours (0 = always re-fetch)
+RATINGS_CACHE_MAX_AGE = float(os.getenv("RATINGS_CACHE_MAX_AGE", 0))
+# auto: incremental update when possible, full retrain every FULL_RETRAIN_EVERY runs
+TRAINING_MODE = os.getenv("TRAINING_MODE", "auto")  # auto | full | incremental
+FULL_RETRAIN_EVERY = int(os.getenv("FULL_RETRAIN_EVERY", 7))
+WATERMARK_COLUMN = os.getenv("RATINGS_WATERMARK_COLUMN", "created_at")  # monotonic column of user_ratings
+INCREMENTAL_EPOCHS = int(os.getenv("INCREMENTAL_EPOCHS", 3))
+# Full-retrain trainer: "sgd" (single-process SGD) or "als" (ALS over a process pool)
+CF_TRAINER = os.getenv("CF_TRAINER", "sgd")
+ALS_WORKERS = int(os.getenv("ALS_WORKERS", os.cpu_count() or 1))
+ALS_REG = float(os.getenv("ALS_REG", 10.0))  # λ of the ALS solves; saved as reg_coeff for the fold-in
+ALS_MAX_ITERS = int(os.getenv("ALS_MAX_ITERS", 15))
+# Stored encoding of item_factors: float64 | float32 | int8 (per-row scales)
+MODEL_FACTOR_DTYPE = os.getenv("MODEL_FACTOR_DTYPE", "float64")
+# "More like this" table stored with the model: top-K neighbours per item (0 disables)
+NEIGHBOURS_K = int(os.getenv("NEIGHBOURS_K", 20))
+NEIGHBOURS_THEME_WEIGHT = float(os.getenv("NEIGHBOURS_THEME_WEIGHT", 0.3))
+THEMES_PATH = os.getenv("THEMES_PATH", "../model_data/themes.pkl")
+# Top-N ranking metrics of the new version through the serving path (evaluate_ranking.py)
+RANKING_EVAL = os.getenv("RANKING_EVAL", "1") == "1"
+RANKING_EVAL_DATA_DIR = os.getenv("RANKING_EVAL_DATA_DIR", os.path.dirname(THEMES_PATH))
+RANKING_EVAL_WORKERS = int(os.getenv("RANKING_EVAL_WORKERS", os.cpu_count() or 1))
 print("DB_HOST:", DB_HOST)
 print("DB_PORT:", DB_PORT)
 print("DB_USER:", DB_USER)
 print("USER_THRESHOLD:", USER_THRESHOLD)
 print("GAMES_THRESHOLD:", GAMES_THRESHOLD)
-print("MODEL_OUTPUT_PATH:", MODEL_OUTPUT_PATH)
+print("MODEL_OUTPUT_DIR:", MODEL_OUTPUT_DIR)
+print("TRAINING_MODE:", TRAINING_MODE)
+
+def connect_db():
+    """Open a psycopg2 connection with the configured parameters."""
+    return psycopg2.connect(
+        host=DB_HOST,
+        port=DB_PORT,
+        user=DB_USER,
+        password=DB_PASSWORD,
+        dbname=DB_NAME
+    )
 
 def fetch_ratings_from_db():
     """Connect to PostgreSQL and fetch all historical user-rating data."""
+    age = cache_age_hours(RATINGS_CACHE_DIR)
+    if age is not None and age < RATINGS_CACHE_MAX_AGE:
+        print(f"Loading ratings from the local cache ({age:.1f} h old)...")
+        return load_ratings_cache(RATINGS_CACHE_DIR)
+
     try:
         # Establish connection to PostgreSQL using psycopg2
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            port=DB_PORT,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            dbname=DB_NAME
-        )
-        # Use a RealDictCursor so that columns are returned as dictionary keys
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        
-        # Execute SQL query to fetch the data (adjust table name and column names as needed)
+        conn = connect_db()
         print("Fetching ratings from the database...")
-        
-        query = "SELECT user_id, game_id, rating FROM user_ratings;" #TODO: Adjust the query to match the table name
-        cursor.execute(query)
-        
-        # Fetch all rows into a list of dictionaries
-        rows = cursor.fetchall()
-        # Create a pandas DataFrame from the query result
-        df = pd.DataFrame(rows)
-        
-        # Close the cursor and connection
-        cursor.close()
-        conn.close()
-        
-        return df
-        
+
+        # Stream the table out with COPY into typed columns on disk
+        # (adjust table name and column names in ratings_extract.RATINGS_QUERY as needed)
+        try:
+            n_rows = stream_ratings_to_cache(conn, RATINGS_CACHE_DIR)
+        finally:
+            conn.close()
+        print(f"Fetched {n_rows} ratings into {RATINGS_CACHE_DIR}")
+
+        return load_ratings_cache(RATINGS_CACHE_DIR)
+
     except Exception as e:
         print("Error fetching ratings from the database:", e)
         return None
@@ -108,34 +141,9 @@ def preprocess_ratings(df):
     
     return df
 
-def split_train_valid_test(df, train_frac=0.8, valid_frac=0.1):
-    df = shuffle(df, random_state=42)
-
-    train_list, valid_list, test_list = [], [], []
-    grouped = df.groupby('user_id')
-
-    for user, group in grouped:
-        n_ratings = len(group)
-        if n_ratings < 3:
-            continue
-
-        n_train = max(1, int(round(train_frac * n_ratings)))
-        n_valid = max(1, int(round(valid_frac * n_ratings)))
-
-        n_test = n_ratings - n_train - n_valid
-        if n_test < 1:
-            n_test = 1
-            n_train = n_ratings - n_valid - n_test
-
-        group_shuffled = group.sample(frac=1, random_state=42)
-
-        train_list.append(group_shuffled.iloc[:n_train])
-        valid_list.append(group_shuffled.iloc[n_train:n_train + n_valid])
-        test_list.append(group_shuffled.iloc[n_train + n_valid:])
-
-    train_df = pd.concat(train_list)
-    valid_df = pd.concat(valid_list)
-    test_df = pd.concat(test_list)
+def split_train_valid_test(df, train_frac=0.8, valid_frac=0.1, seed=SPLIT_SEED):
+    # Per-user split rules live in splits.py
+    train_df, valid_df, test_df = split_by_user(df, train_frac, valid_frac, seed)
 
     print("Train set shape:", train_df.shape)
     print("Validation set shape:", valid_df.shape)
@@ -143,79 +151,172 @@ def split_train_valid_test(df, train_frac=0.8, valid_frac=0.1):
     print("Unique users in train:", train_df['user_id'].nunique())
     print("Unique users in test:", test_df['user_id'].nunique())
 
-    train_df.to_csv("./data/train_df.csv", index=False)
-    valid_df.to_csv("./data/valid_df.csv", index=False)
-    test_df.to_csv("./data/test_df.csv", index=False)
+    os.makedirs(SPLIT_DIR, exist_ok=True)
+    train_df.to_parquet(os.path.join(SPLIT_DIR, "train_df.parquet"), index=False)
+    valid_df.to_parquet(os.path.join(SPLIT_DIR, "valid_df.parquet"), index=False)
+    test_df.to_parquet(os.path.join(SPLIT_DIR, "test_df.parquet"), index=False)
 
     return train_df, valid_df, test_df
 
 def train_svd_with_early_stopping(train_df, valid_df):
-    reader = Reader(rating_scale=(0, 10))
-    train_data = Dataset.load_from_df(train_df[['user_id', 'game_id', 'rating']], reader)
-    trainset = train_data.build_full_trainset()
-
-    validset = [tuple(row) for row in valid_df[['user_id', 'game_id', 'rating']].values]
-
-    max_epochs = 30
-    patience = 3
-    best_rmse = np.inf
-    epochs_without_improve = 0
-    best_algo = None
-
+    # One pass of SGD epochs, validating after each epoch (the old loop refit
+    # surprise.SVD from epoch 1 for every epoch count: 465 epochs to reach 30).
     print("Training SVD model with early stopping...")
-    for epoch in range(1, max_epochs + 1):
-        algo = SVD(n_factors=50, n_epochs=epoch, lr_all=0.005, reg_all=0.02, random_state=42)
-        algo.fit(trainset)
+    best_model = fit_with_early_stopping(train_df, valid_df, n_factors=50, max_epochs=30, patience=3,
+                                         lr=0.005, reg=0.02, seed=42)
+    print("Model training completed.")
+    return best_model
 
-        predictions = algo.test(validset)
-        current_rmse = accuracy.rmse(predictions, verbose=False)
-        print(f"Epoch {epoch}, Validation RMSE: {current_rmse:.4f}")
+def train_als_with_early_stopping(train_df, valid_df):
+    print(f"Training ALS model with early stopping on {ALS_WORKERS} workers...")
+    best_model = fit_als(train_df, valid_df, n_factors=50, max_iters=ALS_MAX_ITERS, patience=2,
+                         reg=ALS_REG, n_workers=ALS_WORKERS, seed=42)
+    print("Model training completed.")
+    return best_model
+
+def build_neighbour_arrays(item_factors, item_ids):
+    """Item-item neighbour table for the artifact (empty if NEIGHBOURS_K is 0)."""
+    if NEIGHBOURS_K <= 0:
+        return {}
+    themes = None
+    if os.path.exists(THEMES_PATH):
+        themes = theme_vectors(pd.read_pickle(THEMES_PATH), item_ids)
+    else:
+        print(f"{THEMES_PATH} not found; neighbours use the item factors only.")
+    start = time.time()
+    neighbour_ids, neighbour_scores = build_item_neighbours(item_factors, item_ids, themes, k=NEIGHBOURS_K,
+                                                            theme_weight=NEIGHBOURS_THEME_WEIGHT)
+    print(f"Built {NEIGHBOURS_K} neighbours for {len(item_ids)} items in {time.time() - start:.1f}s")
+    return {"neighbour_ids": neighbour_ids, "neighbour_scores": neighbour_scores}
+
+def evaluate_and_persist_model(model, test_df, extra=None):
+    predictions = model.predict(test_df['user_id'].to_numpy(), test_df['game_id'].to_numpy())
+    errors = test_df['rating'].to_numpy(dtype=np.float64) - predictions
+
+    rmse = float(np.sqrt(np.mean(errors ** 2)))
+    mae = float(np.mean(np.abs(errors)))
+    print(f"RMSE: {rmse:.4f}")
+    print(f"MAE:  {mae:.4f}")
+
+    # Persist the model artifact: .npy arrays + manifest, in a new version directory.
+    version_dir = save_model_artifact(
+        MODEL_OUTPUT_DIR,
+        item_factors=model.Q,               # NumPy array (num_items x n_factors)
+        item_biases=model.bi,               # NumPy array (num_items,)
+        global_mean=model.global_mean,      # float
+        item_ids=model.item_ids.tolist(),   # raw item IDs in model row order
+        reg_coeff=model.reg_all,            # Regularization coefficient
+        metrics={"test_rmse": rmse, "test_mae": mae},
+        extra=extra,
+        factor_dtype=MODEL_FACTOR_DTYPE,
+        extra_arrays=build_neighbour_arrays(model.Q, model.item_ids),
+    )
+    print(f"Model parameters persisted at: {version_dir}")
+    return version_dir
+
+def record_ranking_skip(version_dir, reason):
+    """Leave a ranking_metrics.json that says why this version has no ranking metrics."""
+    print("Skipping the ranking evaluation:", reason)
+    with open(os.path.join(version_dir, "ranking_metrics.json"), "w") as f:  # evaluate_ranking.RANKING_METRICS_FILE
+        json.dump({"skipped": reason}, f, indent=2)
+
+def evaluate_ranking_quality(version_dir, history_df, test_df, split):
+    """Replay a test split through the recommender and store ranking_metrics.json with the version."""
+    if not RANKING_EVAL:
+        record_ranking_skip(version_dir, "disabled (RANKING_EVAL=0)")
+        return None
+    try:
+        from evaluate_ranking import evaluate_model
+    except ImportError as e:
+        record_ranking_skip(version_dir, f"recommender code not importable: {e}")
+        return None
+    try:
+        report = evaluate_model(version_dir, RANKING_EVAL_DATA_DIR, history_df, test_df,
+                                n_workers=RANKING_EVAL_WORKERS, split=split)
+    except Exception as e:
+        # The artifact is already persisted; a failed evaluation must not fail the run.
+        record_ranking_skip(version_dir, f"evaluation failed: {e}")
+        return None
+    print("Ranking metrics:", {key: round(value, 4) for key, value in report.items()
+                               if "@" in key})
+    return report
+
+def evaluate_incremental_ranking(version_dir):
+    """
+    Ranking metrics of an incremental version, on the Parquet split of the last full retrain.
+
+    The update trained on the affected users' full histories, which can include
+    some of their test-split ratings, so these numbers lean slightly optimistic.
+    """
+    paths = {name: os.path.join(SPLIT_DIR, f"{name}_df.parquet") for name in ("train", "valid", "test")}
+    missing = [path for path in paths.values() if not os.path.exists(path)]
+    if missing:
+        record_ranking_skip(version_dir, f"no split to evaluate on ({', '.join(missing)} missing)")
+        return None
+    history_df = pd.concat([pd.read_parquet(paths["train"]), pd.read_parquet(paths["valid"])])
+    return evaluate_ranking_quality(version_dir, history_df, pd.read_parquet(paths["test"]),
+                                    split="test split of the last full retrain")
 
-        if current_rmse < best_rmse:
-            best_rmse = current_rmse
-            best_algo = algo
-            epochs_without_improve = 0
-        else:
-            epochs_without_improve += 1
+def incremental_due():
+    """Previous artifact to warm-start from, if this run should be incremental; else None."""
+    if TRAINING_MODE == "full":
+        return None
+    version_dir = latest_version_dir(MODEL_OUTPUT_DIR)
+    if version_dir is None:
+        print("No previous model artifact; running a full retrain.")
+        return None
+    try:
+        _, manifest = load_model_artifact(version_dir)
+    except (OSError, ValueError) as e:
+        print(f"Cannot warm-start from {version_dir} ({e}); running a full retrain.")
+        return None
+    if manifest.get("watermark") is None:
+        print("Previous model has no watermark; running a full retrain.")
+        return None
+    if TRAINING_MODE == "auto" and manifest.get("incremental_runs_since_full", 0) >= FULL_RETRAIN_EVERY:
+        print(f"{FULL_RETRAIN_EVERY} incremental runs since the last full retrain; running a full retrain.")
+        return None
+    return version_dir
 
-        if epochs_without_improve >= patience:
-            print(f"Early stopping at epoch {epoch}. Best Validation RMSE: {best_rmse:.4f}")
-            break
+def run_incremental_training(version_dir):
+    """Update the model from the ratings newer than its watermark."""
+    conn = connect_db()
+    try:
+        return run_incremental(conn, version_dir, MODEL_OUTPUT_DIR, WATERMARK_COLUMN,
+                               cache_dir="./data/delta_cache", factor_dtype=MODEL_FACTOR_DTYPE,
+                               extra_arrays_fn=build_neighbour_arrays,
+                               n_epochs=INCREMENTAL_EPOCHS, min_new_item_ratings=GAMES_THRESHOLD)
+    finally:
+        conn.close()
 
-    print("Model training completed.")
-    return best_algo
-
-def evaluate_and_persist_model(algo, test_df):
-    testset = [tuple(row) for row in test_df[['user_id', 'game_id', 'rating']].values]
-    predictions = algo.test(testset)
-
-    accuracy.rmse(predictions, verbose=True)
-    accuracy.mae(predictions, verbose=True)
-
-    # Compute additional metadata
-    trainset = algo.trainset
-    # Create a list of raw item IDs in the order corresponding to algo.qi and algo.bi.
-    item_ids_list = [trainset.to_raw_iid(inner_id) for inner_id in trainset.all_items()]
-    # Create a mapping: raw item id --> index in the model arrays.
-    item_index_map = {item_id: idx for idx, item_id in enumerate(item_ids_list)}
-    # Set reg_coeff (use algo.reg_all if available or a default value).
-    reg_coeff = getattr(algo, 'reg_all', 0.02)
-
-    # Build the model artifact dictionary.
-    model_artifact = {
-        'item_factors': algo.qi,           # NumPy array (num_items x n_factors)
-        'item_biases': algo.bi,             # NumPy array (num_items,)
-        'global_mean': trainset.global_mean,  # float
-        'item_ids_list': item_ids_list,     # list of raw item IDs
-        'item_index_map': item_index_map,   # dict mapping item_id -> index
-        'reg_coeff': reg_coeff              # Regularization coefficient
-    }
-
-    with open(MODEL_OUTPUT_PATH, 'wb') as f:
-        pickle.dump(model_artifact, f)
-    print(f"Model parameters persisted at: {MODEL_OUTPUT_PATH}")
+def fetch_current_watermark():
+    """Watermark recorded with a full retrain, so the next incremental run knows where to start."""
+    try:
+        conn = connect_db()
+    except Exception as e:
+        print("Could not read the ratings watermark:", e)
+        return None
+    try:
+        return fetch_watermark(conn, WATERMARK_COLUMN)
+    finally:
+        conn.close()
 
 if __name__ == "__main__":
+    # Incremental mode: warm-start from the previous artifact with only the new ratings.
+    previous_version = incremental_due()
+    if previous_version is not None:
+        try:
+            version_dir = run_incremental_training(previous_version)
+            if version_dir is not None:
+                evaluate_incremental_ranking(version_dir)
+            sys.exit(0)
+        except (IncrementalRejected, IncrementalUnavailable) as e:
+            print(f"{e}; running a full retrain.")
+
+    # Full retrain. Read the watermark first so ratings arriving during training
+    # are picked up by the next incremental run.
+    watermark = fetch_current_watermark()
+
     # Step 1: Connect to the DB and retrieve all historical rating data.
     ratings_df = fetch_ratings_from_db()
     
@@ -225,12 +326,23 @@ if __name__ == "__main__":
     # Step 3: Split the data into train, validation, and test sets
     train_df, valid_df, test_df = split_train_valid_test(ratings_df)
 
-    # SeedUp: Load the data from CSV files if they exist
-    # Load train, validation, and test datasets from CSV files
-    # train_df = pd.read_csv("./data/train_df.csv")
-    # valid_df = pd.read_csv("./data/valid_df.csv")
-    # test_df  = pd.read_csv("./data/test_df.csv")
-
-    # Step 4: Train the SVD model with early stopping
-    best_model = train_svd_with_early_stopping(train_df, valid_df)
-    evaluate_and_persist_model(best_model, test_df)
+    # SeedUp: Load the data from the Parquet files if they exist
+    # Load train, validation, and test datasets written by split_train_valid_test
+    # train_df = pd.read_parquet(os.path.join(SPLIT_DIR, "train_df.parquet"))
+    # valid_df = pd.read_parquet(os.path.join(SPLIT_DIR, "valid_df.parquet"))
+    # test_df  = pd.read_parquet(os.path.join(SPLIT_DIR, "test_df.parquet"))
+
+    # Step 4: Train the SVD (or ALS) model with early stopping
+    if CF_TRAINER == "als":
+        best_model = train_als_with_early_stopping(train_df, valid_df)
+    else:
+        best_model = train_svd_with_early_stopping(train_df, valid_df)
+    version_dir = evaluate_and_persist_model(best_model, test_df, extra={
+        "training_mode": "full",
+        "trainer": CF_TRAINER,
+        "watermark": watermark,
+        "incremental_runs_since_full": 0,
+    })
+
+    # Step 5: Top-N ranking metrics of the new version, as the service would rank
+    evaluate_ranking_quality(version_dir, pd.concat([train_df, valid_df]), test_df, split="test split")
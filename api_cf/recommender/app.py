@@ -1,64 +1,27 @@
 # recommender_service/app.py
-from flask import Flask, request, jsonify
-import numpy as np
-import pandas as pd
-import pickle
-from fold_in import compute_user_profile, recommend_top_n
+from flask import Blueprint, Flask, Response, current_app, g, request, jsonify
+import time
+from metrics import metrics, stage
+from service import RecommenderService, parse_user, settings_from_env
 import os
-app = Flask(__name__)
-
-# Load the model data once when the service starts
-with open("../model_data/item_factors.pkl", "rb") as f:
-    model_data = pickle.load(f)
-
-from content_based import content_based_recommender
-# Load content-based model data
-df_themes      = pd.read_pickle("../model_data/themes.pkl")
-df_transform   = pd.read_pickle("../model_data/category_transform.pkl")
-df_games       = pd.read_pickle("../model_data/games.pkl")
-
-# Load model parameters and metadata
-item_factors = model_data["item_factors"]      # shape: (num_items, n_factors)
-item_biases = model_data["item_biases"]          # shape: (num_items,)
-global_mean = model_data["global_mean"]
-item_ids_list = model_data["item_ids_list"]      # list of raw item IDs
-item_index_map = model_data["item_index_map"]    # mapping from raw item_id to index
-reg_coeff = model_data["reg_coeff"]              # regularization coefficient
-n_factors = item_factors.shape[1]                # number of latent factors
-
-# Build inverse map once: raw-id -> CF row‑index (robust join key)
-rawid_to_cfidx = {raw_id: idx for idx, raw_id in enumerate(item_ids_list)}
-
-checkbox_cols  = df_transform.columns[1:]          # order expected from UI
-NUM_CHECKBOXES = len(checkbox_cols)
-N_ITEMS        = len(item_ids_list)                # sanity check
 
-# ------------------------------------------------------------------
-# Utility functions
-# ------------------------------------------------------------------
-def normalise(arr: np.ndarray) -> np.ndarray:
-    """Min‑max normalise to 0‑1 (no div‑by‑zero if all identical)."""
-    amin, amax = arr.min(), arr.max()
-    return (arr - amin) / (amax - amin) if amax > amin else np.zeros_like(arr)
-
-def dynamic_alpha(num_ratings: int,
-                  low: float = 0.3,
-                  high: float = 0.8,
-                  pivot: int = 10) -> float:
-    """
-    Less data -> rely more on CB; more data -> rely on CF.
-    • ≤0 ratings  → α = low
-    • ≥pivot      → α = high
-    • linear in‑between
-    """
-    if num_ratings >= pivot:
-        return high
-    return low + (high - low) * (num_ratings / pivot)
+def _service():
+    return current_app.extensions["recommender"]
+
+def _model_or_503():
+    """The active bundle, or a 503 response while no model is loaded."""
+    registry = _service().registry
+    bundle = registry.current
+    if bundle is None:
+        return None, (jsonify({"error": "model not loaded", **registry.status()}), 503)
+    return bundle, None
 
 # ------------------------------------------------------------------
 # Flask service
 # ------------------------------------------------------------------
-@app.route('/recommend', methods=['POST'])
+bp = Blueprint("recommender", __name__)
+
+@bp.route('/recommend', methods=['POST'])
 def recommend():
     """
     Expects a JSON payload:
@@ -68,68 +31,204 @@ def recommend():
         "preferences": [true, false, false, true, ...]    // length = num_checkboxes
     }
     """
-    data = request.get_json()
-    print(data)
-    # Get the ratings list (each element is a (item_id, rating) tuple).
-    ratings = data.get("ratings", [])
-
-
-    pref_booleans  = data.get("preferences", [False] * NUM_CHECKBOXES)
-    if len(pref_booleans) != NUM_CHECKBOXES:
-        return jsonify({"error": f"'preferences' must have {NUM_CHECKBOXES} booleans"}), 400
-    
-    # Derive the set of rated item IDs from the ratings list.
-    rated_item_ids = {item_id for (item_id, rating) in ratings}
-
-     # ----------- 1.  CF score vector -----------
-    # Compute the temporary user profile using new ratings.
-    b_u, u = compute_user_profile(ratings, item_index_map, item_factors,
-                                  item_biases, global_mean, reg_coeff, n_factors)
-
-    # Generate top-N recommendations for the user.
-    cf_scores = global_mean + b_u + item_biases + item_factors.dot(u)  # (N_ITEMS,)
-
-    # ----------- 2.  CB score vector -----------
-    cb_raw = content_based_recommender(pref_booleans, top_n=None) # get all scores
-    cb_scores = np.zeros(N_ITEMS, dtype=np.float64)
-
-    for row_idx, (sim, _avg) in cb_raw:
-        # Map df_themes row index -> raw BGGId -> CF row index
-        raw_id = df_games.iloc[row_idx]["BGGId"]      # adapt column name if needed
-        cf_idx = rawid_to_cfidx.get(raw_id)
-        if cf_idx is not None:
-            cb_scores[cf_idx] = sim
-    
-    # ----------- 3.  Blend -----------
-    cf_norm = normalise(cf_scores)
-    cb_norm = normalise(cb_scores)
-
-    alpha   = dynamic_alpha(len(ratings))
-    hybrid  = alpha * cf_norm + (1 - alpha) * cb_norm
-
-    # Exclude rated items!!
-    for raw_id in rated_item_ids:
-        idx = rawid_to_cfidx.get(raw_id)
-        if idx is not None:
-            hybrid[idx] = -np.inf
-
-    # ----------- 4.  Top‑N -----------
-    N = int(data.get("top_n", 20))
-    top_idx = np.argpartition(hybrid, -N)[-N:]
-    top_idx = top_idx[np.argsort(hybrid[top_idx])[::-1]]
-
-    recommendations = [
-        (int(item_ids_list[i]), float(hybrid[i])) for i in top_idx
-    ]
-
+    bundle, unavailable = _model_or_503()   # one consistent model snapshot for the whole request
+    if unavailable:
+        return unavailable
+    with stage("parse"):
+        data = request.get_json()
+        try:
+            user = parse_user(data, bundle.num_checkboxes)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    alpha, recommendations = _service().recommend_users_cached(bundle, [user])[0]
 
     # ----------- 5.  Response -----------
-    response = {
-        "username": data.get("username", "unknown"),
-        "cf_coffcicient": alpha,
-        "recommendations": recommendations  # list of (item_id, predicted_rating) tuples
+    with stage("serialise"):
+        response = {
+            "username": data.get("username", "unknown"),
+            "cf_coffcicient": alpha,
+            "recommendations": recommendations  # list of (item_id, predicted_rating) tuples
+        }
+        return jsonify(response)
+
+@bp.route('/recommend/batch', methods=['POST'])
+def recommend_batch():
+    """
+    Expects a JSON payload:
+    {
+        "users": [
+            {"username": "user123", "ratings": [...], "preferences": [...], "top_n": 20},
+            ...
+        ]
     }
-    return jsonify(response)
+    Each entry takes the same fields as /recommend and gets the same result.
+    """
+    bundle, unavailable = _model_or_503()
+    if unavailable:
+        return unavailable
+    with stage("parse"):
+        data = request.get_json()
+        if not isinstance(data, dict) or not isinstance(data.get("users", []), list):
+            return jsonify({"error": "payload must be a JSON object with a 'users' list"}), 400
+        payloads = data.get("users", [])
+        try:
+            users = [parse_user(user_data, bundle.num_checkboxes) for user_data in payloads]
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+
+    service = _service()
+    chunk_size = service.settings["BATCH_CHUNK_SIZE"]
+    scored = []
+    for start in range(0, len(users), chunk_size):
+        scored.extend(service.recommend_users_cached(bundle, users[start:start + chunk_size]))
+
+    with stage("serialise"):
+        results = [
+            {
+                "username": user_data.get("username", "unknown"),
+                "cf_coffcicient": alpha,
+                "recommendations": recommendations
+            }
+            for user_data, (alpha, recommendations) in zip(payloads, scored)
+        ]
+        return jsonify({"results": results})
+
+@bp.route('/similar/<int:game_id>', methods=['GET'])
+def similar(game_id):
+    """
+    "More like this": the games nearest to game_id in the precomputed
+    neighbour table (item factors blended with themes). ?top_n=N limits
+    the list to N of the K stored neighbours.
+    """
+    bundle, unavailable = _model_or_503()
+    if unavailable:
+        return unavailable
+    cf = bundle.cf
+    if cf.neighbour_ids is None:
+        return jsonify({"error": f"model {bundle.version} has no neighbour table"}), 404
+    top_n = request.args.get("top_n", default=cf.neighbour_ids.shape[1], type=int)
+    neighbours = cf.similar_items(game_id, max(top_n, 0))
+    if neighbours is None:
+        return jsonify({"error": f"game {game_id} is not in the model"}), 404
+    return jsonify({"game_id": game_id, "similar": neighbours})
+
+# ------------------------------------------------------------------
+# Health
+# ------------------------------------------------------------------
+@bp.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process is up and answering."""
+    return jsonify({"status": "ok", "pid": os.getpid()})
+
+@bp.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: 200 once a model is loaded, 503 before that."""
+    status = _service().registry.status()
+    ready = status["model_version"] is not None
+    return jsonify({"ready": ready, "pid": os.getpid(), **status}), (200 if ready else 503)
+
+# ------------------------------------------------------------------
+# Metrics
+# ------------------------------------------------------------------
+@bp.before_app_request
+def _start_timer():
+    g.request_start = time.perf_counter()
+    g.profiler = _service().profiler.start()
+
+@bp.after_app_request
+def _record_request(response):
+    elapsed = time.perf_counter() - g.request_start
+    endpoint = request.url_rule.rule if request.url_rule else "unmatched"
+    metrics.observe("recommender_request_seconds", elapsed, endpoint=endpoint)
+    metrics.inc("recommender_requests_total", endpoint=endpoint, status=str(response.status_code))
+    if g.profiler is not None:
+        _service().profiler.finish(g.profiler, elapsed, endpoint)
+    return response
+
+@bp.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Stage / request latency histograms, model size and load time, cache counters (Prometheus text)."""
+    return Response(metrics.render(_service().model_samples()), mimetype="text/plain; version=0.0.4")
+
+# ------------------------------------------------------------------
+# Model admin
+# ------------------------------------------------------------------
+def _admin_denied():
+    token = _service().settings["ADMIN_TOKEN"]
+    if token and request.headers.get("X-Admin-Token") != token:
+        return jsonify({"error": "forbidden"}), 403
+    return None
+
+@bp.route('/admin/model', methods=['GET'])
+def model_status():
+    """Active model version, when and how fast it was loaded, and the last reload error."""
+    denied = _admin_denied()
+    if denied:
+        return denied
+    service = _service()
+    return jsonify({**service.registry.status(),
+                    "response_cache": service.response_cache.stats(),
+                    "cb_cache": service.cb_cache.stats()})
+
+@bp.route('/admin/cache', methods=['GET', 'DELETE'])
+def cache_status():
+    """Hit/miss counters of the response and CB caches; DELETE empties both."""
+    denied = _admin_denied()
+    if denied:
+        return denied
+    service = _service()
+    if request.method == 'DELETE':
+        service.clear_caches()
+    return jsonify({"response_cache": service.response_cache.stats(), "cb_cache": service.cb_cache.stats()})
+
+@bp.route('/admin/reload', methods=['POST'])
+def reload_model():
+    """
+    Load the newest model and swap it in.
+
+    Runs in the background and answers 202; with ?wait=true it blocks and
+    answers with the new status (or 500 with the error, keeping the old model).
+    Under gunicorn only the worker that got the request reloads; the other
+    workers pick the new model up through their watchers.
+    """
+    denied = _admin_denied()
+    if denied:
+        return denied
+    registry = _service().registry
+    if request.args.get("wait", "").lower() in ("1", "true", "yes"):
+        try:
+            registry.reload()
+        except Exception as e:
+            return jsonify({"error": f"reload failed: {e}", **registry.status()}), 500
+        return jsonify(registry.status())
+    started = registry.reload_in_background()
+    return jsonify({"reload_started": started, **registry.status()}), 202
+
+# ------------------------------------------------------------------
+# Application factory
+# ------------------------------------------------------------------
+def create_app(settings=None, load_model=True, start_watcher=True):
+    """
+    Build the Flask app and its RecommenderService.
+
+    Parameters:
+        settings (dict, optional): Overrides on top of settings_from_env().
+        load_model (bool): Load the model now (under gunicorn's preload_app
+            this runs once in the master, before the workers fork).
+        start_watcher (bool): Start the model watcher thread now; pass False
+            when the app is built before a fork and start it per worker.
+    """
+    app = Flask(__name__)
+    service = RecommenderService({**settings_from_env(), **(settings or {})})
+    app.extensions["recommender"] = service
+    app.register_blueprint(bp)
+    if load_model:
+        service.load_model()
+    if start_watcher:
+        service.start_watching()
+    return app
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    # Development server only; production runs gunicorn -c gunicorn.conf.py wsgi:app
+    create_app().run(host="0.0.0.0", port=int(os.getenv("PORT", 5000)), threaded=True)
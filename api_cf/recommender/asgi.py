@@ -0,0 +1,186 @@
+# recommender_service/asgi.py
+"""
+asyncio (ASGI) variant of the service for bursty traffic:
+
+    uvicorn asgi:create_app --factory --host 0.0.0.0 --port 5000
+
+POST /recommend takes the same payload and returns the same response as the
+Flask endpoint, but requests are not scored one by one: they are coalesced
+by a MicroBatcher for up to MICROBATCH_MAX_WAIT_MS and scored together with
+one fold-in solve and one GEMM on a thread pool. /healthz, /readyz and
+/metrics behave as in app.py. Plain ASGI, so uvicorn is the only extra
+dependency. With `--workers N` every worker loads its own bundle; the CF
+artifact is memory-mapped, so its pages are still shared.
+"""
+import json
+import os
+import time
+import traceback
+
+from service import RecommenderService, parse_user, settings_from_env
+from metrics import metrics, stage
+from micro_batch import MicroBatcher
+from response_cache import request_key
+
+
+def asgi_settings_from_env():
+    """settings_from_env() plus the micro-batching knobs."""
+    return {
+        **settings_from_env(),
+        # Requests scored together at most
+        "MICROBATCH_MAX_SIZE": int(os.getenv("MICROBATCH_MAX_SIZE", 64)),
+        # How long the first request of a batch waits for others (the latency a lone request pays)
+        "MICROBATCH_MAX_WAIT_MS": float(os.getenv("MICROBATCH_MAX_WAIT_MS", 2)),
+        # Batches scored concurrently (scoring threads)
+        "MICROBATCH_THREADS": int(os.getenv("MICROBATCH_THREADS", 2)),
+    }
+
+
+class RecommenderASGI:
+    """Minimal ASGI app: /recommend through the micro-batcher, plus health and metrics."""
+
+    def __init__(self, settings=None, load_model=True):
+        self.settings = {**asgi_settings_from_env(), **(settings or {})}
+        self.service = RecommenderService(self.settings)
+        if load_model:
+            self.service.load_model()
+        self.batcher = None
+
+    # ----------- Scoring (runs on a batcher thread) -----------
+    def score_batch(self, items):
+        """
+        Score a micro-batch of (bundle, user) items.
+
+        Items are grouped by the bundle they were parsed against, so a model
+        swap mid-burst never mixes versions inside one request. If a group
+        fails, its items are re-scored one at a time and only the failing
+        ones get their exception back (MicroBatcher raises it to that caller).
+        """
+        results = [None] * len(items)
+        groups = {}
+        for i, (bundle, user) in enumerate(items):
+            groups.setdefault(id(bundle), (bundle, []))[1].append(i)
+        for bundle, rows in groups.values():
+            try:
+                scored = self.service.recommend_users(bundle, [items[i][1] for i in rows])
+            except Exception:
+                scored = [self._score_one(bundle, items[i][1]) for i in rows]
+            for i, result in zip(rows, scored):
+                results[i] = result
+        return results
+
+    def _score_one(self, bundle, user):
+        try:
+            return self.service.recommend_users(bundle, [user])[0]
+        except Exception as e:
+            return e
+
+    async def recommend(self, body):
+        bundle = self.service.registry.current
+        if bundle is None:
+            return 503, {"error": "model not loaded", **self.service.registry.status()}
+        with stage("parse"):
+            try:
+                data = json.loads(body)
+                user = parse_user(data, bundle.num_checkboxes)
+            except (ValueError, AttributeError) as e:
+                return 400, {"error": str(e)}
+
+        # Repeat requests are answered from the cache without waiting for a batch.
+        key = request_key(bundle.load_id, *user)
+        result = self.service.response_cache.get(key) if key is not None else None
+        if result is None:
+            result = await self.start().submit((bundle, user))
+            if key is not None:
+                self.service.response_cache.put(key, result)
+        alpha, recommendations = result
+        return 200, {
+            "username": data.get("username", "unknown"),
+            "cf_coffcicient": alpha,
+            "recommendations": recommendations
+        }
+
+    def start(self):
+        """
+        Create the batcher and start the model watcher; returns the batcher.
+
+        Runs at lifespan startup, or on the first request when the server runs
+        without lifespan events (uvicorn --lifespan off).
+        """
+        if self.batcher is None:
+            self.batcher = MicroBatcher(self.score_batch, self.settings["MICROBATCH_MAX_SIZE"],
+                                        self.settings["MICROBATCH_MAX_WAIT_MS"],
+                                        self.settings["MICROBATCH_THREADS"])
+            self.service.start_watching()
+        return self.batcher
+
+    def readyz(self):
+        status = self.service.registry.status()
+        ready = status["model_version"] is not None
+        return (200 if ready else 503), {"ready": ready, "pid": os.getpid(), **status}
+
+    # ----------- ASGI plumbing -----------
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+        elif scope["type"] == "http":
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                self.start()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                if self.batcher is not None:
+                    await self.batcher.close()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _http(self, scope, receive, send):
+        start = time.perf_counter()
+        method, path = scope["method"], scope["path"]
+        endpoint = path
+        try:
+            if path == "/recommend" and method == "POST":
+                status, payload = await self.recommend(await _read_body(receive))
+            elif path == "/healthz" and method == "GET":
+                status, payload = 200, {"status": "ok", "pid": os.getpid()}
+            elif path == "/readyz" and method == "GET":
+                status, payload = self.readyz()
+            elif path == "/metrics" and method == "GET":
+                text = metrics.render(self.service.model_samples())
+                await _respond(send, 200, text.encode(), b"text/plain; version=0.0.4")
+                return
+            elif path in ("/recommend", "/healthz", "/readyz", "/metrics"):
+                status, payload = 405, {"error": "method not allowed"}
+            else:
+                status, payload, endpoint = 404, {"error": "not found"}, "unmatched"
+        except Exception:
+            # Answer and count the failure instead of letting the server drop the connection.
+            traceback.print_exc()
+            status, payload = 500, {"error": "internal server error"}
+        await _respond(send, status, json.dumps(payload).encode(), b"application/json")
+        metrics.observe("recommender_request_seconds", time.perf_counter() - start, endpoint=endpoint)
+        metrics.inc("recommender_requests_total", endpoint=endpoint, status=str(status))
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get("body", b""))
+        if not message.get("more_body", False):
+            return b"".join(chunks)
+
+
+async def _respond(send, status, body, content_type):
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", content_type), (b"content-length", str(len(body)).encode())]})
+    await send({"type": "http.response.body", "body": body})
+
+
+def create_app(settings=None, load_model=True):
+    """ASGI application factory (uvicorn --factory)."""
+    return RecommenderASGI(settings, load_model)
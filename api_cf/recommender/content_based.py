@@ -9,53 +9,178 @@ Original file is located at
 
 import pandas as pd
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
 
-def content_based_recommender(user_input, top_n=20):
-
-  # # read data from database
-  df_themes = pd.read_pickle("../model_data/themes.pkl")
-  df_games = pd.read_pickle("../model_data/games.pkl")
-  df_transform = pd.read_pickle("../model_data/category_transform.pkl")
-
-  cols_sum = df_themes.sum(axis=0, numeric_only=True)
-  drop_cols = cols_sum[cols_sum <= 20].index
-  df_themes.drop(columns=drop_cols, inplace=True)
-
-
-  # transform the user input into user perference
-  def category_transform(user_input):
-    columns_list = df_transform.columns.tolist()
-    columns_list = columns_list[1:]
-    user_perference = np.array([0] * 107)
-    for i in range(len(user_input)):
-      if user_input[i] == True:
-        temp = np.array(df_transform[columns_list[i]].tolist())
-        user_perference = user_perference + temp
-
-    return user_perference.tolist()
-
-  # data preprocessing
-  df_themes_data = df_themes.iloc[:,1:]
-  user_perference = category_transform(user_input)
-  avg_ratings = df_games.loc[:,"AvgRating"].to_list()
+# Theme columns flagged on this many games or fewer are dropped as noise.
+MIN_THEME_COUNT = 20
+
+THEME_FORMATS = ("dense", "csr")
+
+
+class ContentBasedIndex:
+  """
+  Content-based scoring state, built once when the service starts.
+
+  Holds the theme matrix with its per-row normalisation, the checkbox ->
+  theme transform as a dense matrix and the average-rating tie-break vector,
+  so scoring a request is a single mat-vec product. The theme flags are
+  kept either as a dense float32 matrix or, since only ~3% of them are set,
+  in CSR form (int16 theme indices per game, no values for 0/1 flags).
+  """
+
+  def __init__(self, theme_matrix, transform, avg_ratings, theme_format="dense"):
+    """
+    Parameters:
+        theme_matrix (np.array): Game x theme flags (num_games x num_themes).
+        transform (np.array): Theme x checkbox weights (num_themes x num_checkboxes).
+        avg_ratings (np.array): Average rating per game (num_games,).
+        theme_format (str): "dense" or "csr" storage of the theme flags.
+    """
+    if theme_format not in THEME_FORMATS:
+      raise ValueError(f"theme_format must be one of {THEME_FORMATS}, got {theme_format!r}")
+    theme_matrix = np.asarray(theme_matrix, dtype=np.float32)
+    transform = np.asarray(transform, dtype=np.float32)
+    if transform.shape[0] != theme_matrix.shape[1]:
+      raise ValueError(
+        f"category transform has {transform.shape[0]} themes, "
+        f"theme matrix has {theme_matrix.shape[1]}")
+    if len(avg_ratings) != theme_matrix.shape[0]:
+      raise ValueError("avg_ratings must have one entry per game")
+
+    # Cosine similarity = (flags . pref) * row_scale / |pref|. The flags and the
+    # checkbox transform are small integers, so the product is exact in float32
+    # and scores do not depend on how many users share a GEMM.
+    norms = np.linalg.norm(theme_matrix, axis=1)
+    self.theme_format = theme_format
+    if theme_format == "dense":
+      self.theme_matrix = np.ascontiguousarray(theme_matrix)
+      self.theme_indptr = self.theme_indices = self.theme_data = None
+    else:
+      rows, cols = np.nonzero(theme_matrix)
+      values = theme_matrix[rows, cols]
+      self.theme_matrix = None
+      self.theme_indptr = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=theme_matrix.shape[0]))))
+      self.theme_indices = cols.astype(np.int16 if theme_matrix.shape[1] <= np.iinfo(np.int16).max else np.int32)
+      self.theme_data = None if np.all(values == 1) else values
+      self._row_starts = np.minimum(self.theme_indptr[:-1], max(len(cols) - 1, 0))
+      self._empty_rows = np.flatnonzero(np.diff(self.theme_indptr) == 0)
+    self.row_scale = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    self.transform = transform
+    self.avg_ratings = np.asarray(avg_ratings, dtype=np.float64)
+    self.num_games = theme_matrix.shape[0]
+    self.num_checkboxes = transform.shape[1]
+
+  @property
+  def nbytes(self):
+    """Memory of the theme flags (dense matrix or CSR arrays)."""
+    if self.theme_matrix is not None:
+      return self.theme_matrix.nbytes
+    data = self.theme_data.nbytes if self.theme_data is not None else 0
+    return self.theme_indptr.nbytes + self.theme_indices.nbytes + data
+
+  def reindexed(self, rows):
+    """
+    Index over the games at `rows`, in that order; a -1 row is a game without
+    theme data (similarity 0). The service uses it to score straight into CF
+    item order instead of scattering every game's score per request.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    known = rows >= 0
+    flags = np.zeros((len(rows), self.transform.shape[0]), dtype=np.float32)
+    flags[known] = self._dense_rows(rows[known])
+    avg_ratings = np.zeros(len(rows), dtype=np.float64)
+    avg_ratings[known] = self.avg_ratings[rows[known]]
+    return ContentBasedIndex(flags, self.transform, avg_ratings, self.theme_format)
+
+  def _dense_rows(self, rows):
+    """Theme flags of the given games as a dense float32 matrix."""
+    if self.theme_matrix is not None:
+      return self.theme_matrix[rows]
+    starts, lengths = self.theme_indptr[rows], np.diff(self.theme_indptr)[rows]
+    owner = np.repeat(np.arange(len(rows)), lengths)
+    pos = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+    dense = np.zeros((len(rows), self.transform.shape[0]), dtype=np.float32)
+    dense[owner, self.theme_indices[pos]] = 1 if self.theme_data is None else self.theme_data[pos]
+    return dense
+
+  @classmethod
+  def from_frames(cls, df_themes, df_games, df_transform, min_theme_count=MIN_THEME_COUNT, theme_format="dense"):
+    """Build the index from the themes / games / category_transform frames."""
+    cols_sum = df_themes.sum(axis=0, numeric_only=True)
+    drop_cols = cols_sum[cols_sum <= min_theme_count].index
+    df_themes_data = df_themes.drop(columns=drop_cols).iloc[:, 1:]
+
+    # first column of the transform holds the theme names, the rest are checkboxes
+    transform = df_transform.iloc[:, 1:].to_numpy(dtype=np.float32)
+    avg_ratings = df_games.loc[:, "AvgRating"].to_numpy(dtype=np.float64)
+    return cls(df_themes_data.to_numpy(dtype=np.float32), transform, avg_ratings, theme_format)
+
+  def preference_matrix(self, user_inputs):
+    """
+    Transform checkbox booleans into theme preference rows.
+
+    Returns:
+        user_perference (np.array): Un-normalised preferences (num_users x num_themes).
+        inv_norms (np.array): 1 / |preference| per user, 0 for an empty selection.
+    """
+    mask = np.asarray(user_inputs, dtype=bool).reshape(-1, self.num_checkboxes)
+    user_perference = mask.astype(np.float32).dot(self.transform.T)
+    norms = np.linalg.norm(user_perference, axis=1)
+    inv_norms = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+    return user_perference, inv_norms
+
+  def score_matrix(self, user_inputs):
+    """Cosine similarity of every user against every game in one GEMM (num_users x num_games)."""
+    user_perference, inv_norms = self.preference_matrix(user_inputs)
+    if self.theme_matrix is not None:
+      sim_scores = user_perference.dot(self.theme_matrix.T)
+    else:
+      sim_scores = self._csr_dot(user_perference)
+    sim_scores *= self.row_scale
+    sim_scores *= inv_norms[:, None]
+    return sim_scores
+
+  def _csr_dot(self, user_perference):
+    """user_perference @ theme_matrix.T from the CSR arrays (num_users x num_games)."""
+    gathered = user_perference[:, self.theme_indices]
+    if self.theme_data is not None:
+      gathered *= self.theme_data
+    if gathered.shape[1] == 0:
+      return np.zeros((gathered.shape[0], self.num_games), dtype=np.float32)
+    # reduceat returns the first element instead of 0 for games without flags.
+    sim_scores = np.add.reduceat(gathered, self._row_starts, axis=1)
+    sim_scores[:, self._empty_rows] = 0
+    return sim_scores
+
+  def scores(self, user_input):
+    """Cosine similarity between the user preference and every game (num_games,)."""
+    if len(user_input) != self.num_checkboxes:
+      raise ValueError(f"expected {self.num_checkboxes} preference booleans")
+    return self.score_matrix([user_input])[0]
+
+  def recommend(self, user_input, top_n=20):
+    """
+    Rank games by similarity, using the average rating as tie-breaker.
+
+    Returns a list of (row_index, [similarity, avg_rating]) pairs, best first.
+    """
+    sim_scores = self.scores(user_input)
+    # lexsort is stable and uses the last key as primary: sim desc, then avg desc
+    order = np.lexsort((-self.avg_ratings, -sim_scores))[:top_n]
+    return [(int(i), [float(sim_scores[i]), float(self.avg_ratings[i])]) for i in order]
+
+
+_default_index = None
+
+def _load_default_index():
+  global _default_index
+  if _default_index is None:
+    _default_index = ContentBasedIndex.from_frames(
+      pd.read_pickle("../model_data/themes.pkl"),
+      pd.read_pickle("../model_data/games.pkl"),
+      pd.read_pickle("../model_data/category_transform.pkl"))
+  return _default_index
 
 
-
-  # normalize the user_perference
-  normalized_perference = [x/sum(user_perference) for x in user_perference]
-  df_normalized = pd.DataFrame([normalized_perference])
-
-  # calculate the similarity scores
-  sim_scores = cosine_similarity(df_normalized, df_themes_data).tolist()[0]
-
-  # append average ratings as tie-breaker
-  sim_avg = [[sim_scores[i], avg_ratings[i]] for i in range(len(sim_scores))]
-
-  # sorting
-  sorted_sim_avg = sorted(enumerate(sim_avg), key=lambda i: i[1], reverse=True)
-
-  # top n of games based on user perference
-  ranked_games_ID = [x[0]+1 for x in sorted_sim_avg]
-
-  return sorted_sim_avg[:top_n]
\ No newline at end of file
+def content_based_recommender(user_input, top_n=20):
+  """Top-n (row_index, [similarity, avg_rating]) pairs for the checkbox input."""
+  return _load_default_index().recommend(user_input, top_n)
@@ -1,55 +1,188 @@
 import numpy as np
 
-def compute_user_profile(new_ratings, item_index_map, item_factors, item_biases, global_mean, reg_coeff, n_factors):
+from quantize import dequantize_rows, factor_scores
+
+
+class ItemIdIndex:
+    """
+    Vectorised raw item_id -> model row lookup.
+
+    Keeps the raw ids sorted next to their model row so that a whole array of
+    ids is resolved with one np.searchsorted instead of a dict lookup per id.
+    """
+
+    def __init__(self, item_ids_list):
+        item_ids = np.asarray(item_ids_list)
+        order = np.argsort(item_ids, kind="stable")
+        self.sorted_ids = item_ids[order]
+        self.sorted_pos = order.astype(np.int64)
+
+    @classmethod
+    def from_sorted(cls, sorted_ids, sorted_pos):
+        """Wrap ids that are already sorted (e.g. memory-mapped from a model artifact)."""
+        index = cls.__new__(cls)
+        index.sorted_ids = sorted_ids
+        index.sorted_pos = sorted_pos
+        return index
+
+    def __len__(self):
+        return len(self.sorted_ids)
+
+    def lookup(self, raw_ids):
+        """
+        Map raw item ids to model rows.
+
+        Returns:
+            np.array of int64 rows, -1 for ids that are not in the model.
+        """
+        ids = np.asarray(raw_ids)
+        if ids.dtype.kind not in "iuf" and ids.size:
+            # Mixed input such as [621, "abc"] would become all strings and miss
+            # everywhere; resolve the integral ids and let only the others miss.
+            return self._lookup_mixed(np.asarray(raw_ids, dtype=object))
+        raw_ids = ids
+        if raw_ids.size == 0 or len(self) == 0:
+            return np.full(raw_ids.shape, -1, dtype=np.int64)
+        pos = np.searchsorted(self.sorted_ids, raw_ids)
+        pos = np.minimum(pos, len(self) - 1)
+        found = self.sorted_ids[pos] == raw_ids
+        return np.where(found, self.sorted_pos[pos], -1)
+
+    def _lookup_mixed(self, raw_ids):
+        """lookup for an object array; ids that are not integral numbers map to -1 (as a dict miss)."""
+        integral = np.array([isinstance(x, (int, np.integer)) and not isinstance(x, bool)
+                             or isinstance(x, float) and x.is_integer() for x in raw_ids.flat], dtype=bool)
+        rows = np.full(raw_ids.size, -1, dtype=np.int64)
+        if integral.any():
+            rows[integral] = self.lookup(np.array([int(x) for x in raw_ids.flat[integral]], dtype=np.int64))
+        return rows.reshape(raw_ids.shape)
+
+# Users solved together in one stack of (k+1)x(k+1) systems; users are
+# grouped by rating count so the zero padding inside a stack stays small.
+FOLD_IN_CHUNK_SIZE = 256
+# A stack also ends once users x its widest rating count reaches this many
+# cells, so a few heavy raters do not pad a whole chunk to their width.
+FOLD_IN_MAX_CELLS = 8192
+
+def _lookup_rows(item_ids, item_index_map):
+    """Model rows for raw item ids (-1 if unknown), from an ItemIdIndex or a plain dict."""
+    if isinstance(item_index_map, ItemIdIndex):
+        return item_index_map.lookup(item_ids)
+    return np.fromiter((item_index_map.get(item_id, -1) for item_id in item_ids),
+                       dtype=np.int64, count=len(item_ids))
+
+def _solve_stack(A, b):
+    """
+    Solve a stack of symmetric positive definite systems A x = b.
+
+    A is (batch, n, n) and b is (batch, n). This is an LU solve, not Cholesky:
+    NumPy has no batched triangular solver, so a Cholesky factor has to be
+    inverted (cholesky + inv + two matmuls). For k=50 that is 0.15 ms vs
+    0.04 ms for one system and 43 ms vs 10 ms for a stack of 256, with the
+    same solutions to ~1e-15.
+    """
+    return np.linalg.solve(A, b[:, :, None])[:, :, 0]
+
+def compute_user_profiles(ratings_batch, item_index_map, item_factors, item_biases, global_mean, reg_coeff, n_factors,
+                          chunk_size=FOLD_IN_CHUNK_SIZE, item_scales=None):
+    """
+    Batched version of compute_user_profile: fold in many users at once.
+
+    Parameters:
+        ratings_batch (list): One list of (item_id, rating) tuples per user.
+        item_index_map (ItemIdIndex or dict): Mapping from raw item_id to index in the model arrays.
+        (remaining parameters as in compute_user_profile)
+        chunk_size (int): Maximum number of users per stacked solve (see also FOLD_IN_MAX_CELLS).
+        item_scales (np.array, optional): Per-row scales of int8 item_factors (see quantize.py).
+
+    Returns:
+        b_u (np.array): User biases (num_users,).
+        U (np.array): User latent vectors (num_users x n_factors).
+    """
+    n_users = len(ratings_batch)
+    dtype = np.result_type(item_factors.dtype, np.float32)
+    b_u = np.zeros(n_users, dtype=dtype)
+    U = np.zeros((n_users, n_factors), dtype=dtype)
+    if n_users == 0:
+        return b_u, U
+
+    # Resolve every (item_id, rating) pair of the batch with one lookup.
+    counts = np.array([len(ratings) for ratings in ratings_batch], dtype=np.int64)
+    owner = np.repeat(np.arange(n_users), counts)
+    item_ids = [item_id for ratings in ratings_batch for (item_id, rating) in ratings]
+    values = np.array([rating for ratings in ratings_batch for (item_id, rating) in ratings], dtype=dtype)
+    rows = _lookup_rows(item_ids, item_index_map)
+
+    known = rows >= 0                   # skip unknown item_id
+    owner, rows, values = owner[known], rows[known], values[known]
+    counts = np.bincount(owner, minlength=n_users)
+
+    # Adjust ratings by subtracting global mean and item bias.
+    values = values - (global_mean + item_biases[rows])
+
+    # Regularise the latent factors but not the bias (first element).
+    reg_matrix = np.eye(n_factors + 1, dtype=dtype) * reg_coeff
+    reg_matrix[0, 0] = 0
+
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    by_count = np.argsort(counts, kind="stable")
+    sorted_counts = np.maximum(counts[by_count], 1)
+    lo = 0
+    while lo < n_users:
+        # Counts ascend, so the padded size grows with every user added to the stack.
+        cells = np.arange(1, min(chunk_size, n_users - lo) + 1) * sorted_counts[lo:lo + chunk_size]
+        hi = lo + max(1, int(np.searchsorted(cells, FOLD_IN_MAX_CELLS, side="right")))
+        users, lo = by_count[lo:hi], hi
+        width = int(counts[users].max())
+
+        # Gather factor rows for the whole chunk into a zero-padded design tensor.
+        offsets = np.arange(width)
+        mask = offsets[None, :] < counts[users][:, None]
+        pos = np.where(mask, starts[users][:, None] + offsets[None, :], 0)
+        X = np.zeros((len(users), width, n_factors + 1), dtype=dtype)
+        X[:, :, 0] = mask
+        if len(rows):
+            X[:, :, 1:] = dequantize_rows(item_factors, item_scales, rows[pos]) * mask[:, :, None]
+            y = np.where(mask, values[pos], 0)
+        else:
+            y = np.zeros(mask.shape, dtype=dtype)
+
+        # Solve regularized least squares: (X^T X + λ*I)θ = X^T y per user.
+        Xt = X.transpose(0, 2, 1)
+        A = np.matmul(Xt, X) + reg_matrix
+        rhs = np.matmul(Xt, y[:, :, None])[:, :, 0]
+        # Users with no known items keep the zero profile; make their system solvable.
+        A[counts[users] == 0, 0, 0] = 1.0
+        theta = _solve_stack(A, rhs)
+        b_u[users] = theta[:, 0]
+        U[users] = theta[:, 1:]
+    return b_u, U
+
+def compute_user_profile(new_ratings, item_index_map, item_factors, item_biases, global_mean, reg_coeff, n_factors,
+                         item_scales=None):
     """
     Compute the temporary user bias and latent factor vector for a new set of ratings.
     
     Parameters:
         new_ratings (list of tuples): List of (item_id, rating) tuples.
-        item_index_map (dict): Mapping from raw item_id to index in the model arrays.
+        item_index_map (ItemIdIndex or dict): Mapping from raw item_id to index in the model arrays.
         item_factors (np.array): Matrix of item latent vectors (num_items x n_factors).
         item_biases (np.array): Array of item biases.
         global_mean (float): Global average rating.
         reg_coeff (float): Regularization coefficient (λ).
         n_factors (int): Number of latent factors.
+        item_scales (np.array, optional): Per-row scales of int8 item_factors.
     
     Returns:
-        b_u (float): Computed user bias.
+        b_u (float): Computed user bias (0 if no rated item is known to the model).
         u (np.array): Computed user latent vector (length n_factors).
     """
-    if len(new_ratings) == 0:
-        return 0.0, np.zeros(n_factors)
-    
-    X_list = []
-    y_list = []
-    for (item_id, rating) in new_ratings:
-        if item_id not in item_index_map:
-            continue  # skip unknown item_id
-        idx = item_index_map[item_id]
-        v_i = item_factors[idx]      # latent vector for this item
-        b_i = item_biases[idx]       # bias for this item
-        # Adjust rating by subtracting global mean and item bias.
-        adj_rating = rating - (global_mean + b_i)
-        # Feature vector: first element for user bias, then latent factors.
-        X_list.append(np.hstack(([1.0], v_i)))
-        y_list.append(adj_rating)
-    
-    X = np.vstack(X_list)  # shape: (num_ratings, 1+n_factors)
-    y = np.array(y_list)   # shape: (num_ratings,)
-    
-    # Solve regularized least squares: (X^T X + λ*I)θ = X^T y, but do not regularize bias (first element).
-    lam = reg_coeff
-    XTX = X.T.dot(X)
-    XTy = X.T.dot(y)
-    reg_matrix = np.eye(XTX.shape[0])
-    reg_matrix[0, 0] = 0  # no regularization on the bias term
-    A = XTX + lam * reg_matrix
-    theta = np.linalg.solve(A, XTy)
-    b_u = theta[0]
-    u = theta[1:]
-    return b_u, u
-
-def recommend_top_n(b_u, u, rated_item_ids, item_factors, item_biases, global_mean, item_ids_list, N=20):
+    b_u, U = compute_user_profiles([new_ratings], item_index_map, item_factors, item_biases,
+                                   global_mean, reg_coeff, n_factors, item_scales=item_scales)
+    return b_u[0], U[0]
+
+def recommend_top_n(b_u, u, rated_item_ids, item_factors, item_biases, global_mean, item_ids_list, N=20,
+                    index=None, item_scales=None):
     """
     Compute predictions for all items and return the top N recommendations that the user hasn't rated.
     
@@ -62,24 +195,29 @@ def recommend_top_n(b_u, u, rated_item_ids, item_factors, item_biases, global_me
         global_mean (float): Global average rating.
         item_ids_list (list): List of raw item IDs corresponding to the model arrays.
         N (int): Number of recommendations to return.
+        index (IVFIndex, optional): Approximate MIPS index; only its candidate
+            items are scored. None scores every item exactly.
+        item_scales (np.array, optional): Per-row scales of int8 item_factors (see quantize.py).
     
     Returns:
         List of (item_id, predicted_rating) tuples.
     """
-    # Compute predicted scores for all items using vectorized operations.
-    user_factor_scores = item_factors.dot(u)
-    baseline_scores = global_mean + b_u + item_biases
+    item_ids = np.asarray(item_ids_list)
+    if index is None:
+        rows = np.arange(len(item_ids))
+        user_factor_scores = factor_scores(np.asarray(u)[None, :], item_factors, item_scales)[0]
+    else:
+        rows = np.sort(index.candidates(u))
+        user_factor_scores = dequantize_rows(item_factors, item_scales, rows).dot(u)
+
+    # Compute predicted scores for the candidate items using vectorized operations.
+    baseline_scores = global_mean + b_u + item_biases[rows]
     predictions = baseline_scores + user_factor_scores
 
     # Filter out items that have already been rated.
-    predictions_filtered = []
-    for idx, pred in enumerate(predictions):
-        item_id = item_ids_list[idx]
-        if item_id in rated_item_ids:
-            continue
-        predictions_filtered.append((item_id, pred))
+    keep = ~np.isin(item_ids[rows], list(rated_item_ids))
+    rows, predictions = rows[keep], predictions[keep]
 
     # Sort the remaining items by predicted rating (descending order) and select top-N.
-    predictions_filtered.sort(key=lambda x: x[1], reverse=True)
-    top_recs = predictions_filtered[:N]
-    return top_recs
+    top = np.argsort(-predictions, kind="stable")[:N]
+    return [(item_ids_list[rows[i]], predictions[i]) for i in top]
@@ -0,0 +1,31 @@
+# recommender_service/gunicorn.conf.py
+# Production server settings; every value can be overridden from the environment.
+import multiprocessing
+import os
+
+# One BLAS thread per worker: the per-request GEMMs are small and N workers
+# x M BLAS threads would oversubscribe the cores. Set before the app (and
+# NumPy) is preloaded below.
+for _var in ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS"):
+    os.environ.setdefault(_var, os.getenv("BLAS_THREADS", "1"))
+
+bind = os.getenv("BIND", f"0.0.0.0:{os.getenv('PORT', 5000)}")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+threads = int(os.getenv("GUNICORN_THREADS", 2))
+worker_class = "gthread"
+
+# Load the model once in the master, then fork: workers share its pages
+# instead of each holding a private copy.
+preload_app = True
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 60))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 5))
+accesslog = os.getenv("GUNICORN_ACCESS_LOG")   # unset = no access log
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    # Threads do not survive fork; each worker polls for new models itself.
+    from wsgi import app
+    app.extensions["recommender"].start_watching()
@@ -0,0 +1,143 @@
+# recommender_service/hybrid.py
+"""
+Hybrid CF + CB scoring for a batch of users.
+
+Everything here works on (num_users x num_items) matrices so /recommend
+(a batch of one) and /recommend/batch go through exactly the same code.
+"""
+import numpy as np
+
+from quantize import factor_scores
+
+
+def normalise(arr: np.ndarray) -> np.ndarray:
+    """Min‑max normalise to 0‑1 (no div‑by‑zero if all identical)."""
+    amin, amax = arr.min(), arr.max()
+    return (arr - amin) / (amax - amin) if amax > amin else np.zeros_like(arr)
+
+def normalise_rows(mat: np.ndarray) -> np.ndarray:
+    """Row-wise version of `normalise` for a (num_users x num_items) matrix."""
+    amin = mat.min(axis=1, keepdims=True)
+    span = mat.max(axis=1, keepdims=True) - amin
+    return np.divide(mat - amin, span, out=np.zeros_like(mat), where=span > 0)
+
+def dynamic_alpha(num_ratings: int,
+                  low: float = 0.3,
+                  high: float = 0.8,
+                  pivot: int = 10) -> float:
+    """
+    Less data -> rely more on CB; more data -> rely on CF.
+    • ≤0 ratings  → α = low
+    • ≥pivot      → α = high
+    • linear in‑between
+    """
+    if num_ratings >= pivot:
+        return high
+    return low + (high - low) * (num_ratings / pivot)
+
+def cf_score_matrix(b_u, U, item_factors, item_biases, global_mean, item_scales=None):
+    """
+    Predicted ratings for every user and item.
+
+    One GEMM for the whole batch: U @ item_factors.T is (item_factors @ U.T).T.
+    int8 factors (item_scales given) are dequantised block by block.
+
+    Returns:
+        np.array of shape (num_users, num_items).
+    """
+    scores = factor_scores(U, item_factors, item_scales)
+    scores += global_mean + item_biases
+    scores += np.asarray(b_u, dtype=scores.dtype)[:, None]
+    return scores
+
+def blend(cf_scores, cb_scores, num_ratings):
+    """
+    Per-user alpha blend of the normalised CF and CB matrices.
+
+    Returns:
+        hybrid (np.array): (num_users, num_items) blended scores.
+        alphas (np.array): CF weight used for each user.
+    """
+    alphas = np.array([dynamic_alpha(n) for n in num_ratings], dtype=np.float64)
+    weights = alphas.astype(np.result_type(cf_scores.dtype, cb_scores.dtype))
+    hybrid = weights[:, None] * normalise_rows(cf_scores)
+    hybrid += (1 - weights)[:, None] * normalise_rows(cb_scores)
+    return hybrid, alphas
+
+def blend_into(cf_scores, cb_scores, cb_of_user, num_ratings):
+    """
+    In-place version of `blend` for users that share CB rows.
+
+    cf_scores (num_users x num_items) is overwritten with the hybrid scores.
+    cb_scores holds one row per distinct checkbox selection (CF item order)
+    and cb_of_user[i] is user i's row, so the CB side is normalised once per
+    selection rather than once per user.
+
+    Returns:
+        hybrid (np.array): cf_scores, now holding the blended scores.
+        alphas (np.array): CF weight used for each user.
+    """
+    alphas = np.array([dynamic_alpha(n) for n in num_ratings], dtype=np.float64)
+    hybrid = cf_scores
+    weights = alphas.astype(hybrid.dtype)[:, None]
+    amin = hybrid.min(axis=1, keepdims=True)
+    span = hybrid.max(axis=1, keepdims=True) - amin
+    hybrid -= amin
+    # alpha / span folds the normalisation and the weight into one pass; flat rows are all 0 already.
+    hybrid *= np.divide(weights, span, out=np.zeros_like(span), where=span > 0)
+    cb_part = normalise_rows(cb_scores).astype(hybrid.dtype, copy=False)[cb_of_user]
+    cb_part *= 1 - weights
+    hybrid += cb_part
+    return hybrid, alphas
+
+def exclude_rated(hybrid, rated_rows):
+    """Set already rated items to -inf. rated_rows[i] holds user i's CF rows (-1 = unknown)."""
+    if len(rated_rows) == 0:
+        return hybrid
+    users = np.repeat(np.arange(len(rated_rows)), [len(idx) for idx in rated_rows])
+    items = np.concatenate([np.asarray(idx, dtype=np.int64) for idx in rated_rows])
+    known = items >= 0
+    hybrid[users[known], items[known]] = -np.inf
+    return hybrid
+
+def top_n_rows(scores, N):
+    """
+    Row-wise top-N via argpartition, each row sorted best first.
+
+    N is capped at the row length only, so excluded (-inf) items can come back
+    at the end of a row; callers drop non-finite scores.
+
+    Returns:
+        np.array of shape (num_users, N) with item indices.
+    """
+    N = min(int(N), scores.shape[1])
+    if N <= 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    top_idx = np.argpartition(scores, -N, axis=1)[:, -N:]
+    top_scores = np.take_along_axis(scores, top_idx, axis=1)
+    order = np.argsort(top_scores, axis=1)[:, ::-1]
+    return np.take_along_axis(top_idx, order, axis=1)
+
+def top_candidates(scores, M):
+    """Indices of the M best entries of a 1-D score vector (unordered)."""
+    M = min(int(M), len(scores))
+    if M <= 0:
+        return np.empty(0, dtype=np.int64)
+    return np.argpartition(scores, -M)[-M:]
+
+def blend_candidates(cand, cf_scores, cb_scores, alpha, rated_rows, N):
+    """
+    Hybrid top-N restricted to the candidate items `cand` (approximate retrieval).
+
+    cf_scores / cb_scores are aligned with `cand`; min-max normalisation runs
+    over the candidates only.
+
+    Returns:
+        rows (np.array): Item rows, best first.
+        scores (np.array): Their hybrid scores.
+    """
+    hybrid = alpha * normalise(cf_scores) + (1 - alpha) * normalise(cb_scores)
+    hybrid[np.isin(cand, rated_rows)] = -np.inf
+    top_idx = top_n_rows(hybrid[None, :], N)[0]
+    top_idx = top_idx[np.isfinite(hybrid[top_idx])]
+    return cand[top_idx], hybrid[top_idx]
@@ -0,0 +1,168 @@
+# recommender_service/metrics.py
+"""
+Request / stage latency histograms and a Prometheus text exposition.
+
+Kept dependency-free: a stage is timed with `with stage("fold_in"):` (one
+perf_counter pair and a short lock per observation) and /metrics renders the
+histograms plus whatever model / cache samples the app supplies at scrape time.
+"""
+import bisect
+import cProfile
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds in seconds; the +Inf bucket is implicit.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Histogram:
+    """Cumulative-bucket histogram of one labelled series."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """Histograms keyed by (metric name, label tuple), plus plain counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._help = {}
+
+    def describe(self, name, help_text):
+        self._help[name] = help_text
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def render(self, samples=()):
+        """
+        Prometheus text format (version 0.0.4).
+
+        Parameters:
+            samples (iterable): (name, kind, help, value, labels dict) tuples read
+                at scrape time; kind is "gauge" or "counter", None values are skipped.
+        """
+        lines = []
+        seen = set()
+
+        def header(name, kind, help_text):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            for (name, labels), h in sorted(self._histograms.items()):
+                header(name, "histogram", self._help.get(name, name))
+                cumulative = 0
+                for bound, count in zip(h.buckets + (float("inf"),), h.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(float(bound))
+                    lines.append(f"{name}_bucket{_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_labels(labels)} {h.total!r}")
+                lines.append(f"{name}_count{_labels(labels)} {h.count}")
+            for (name, labels), value in sorted(self._counters.items()):
+                header(name, "counter", self._help.get(name, name))
+                lines.append(f"{name}{_labels(labels)} {value}")
+        for name, kind, help_text, value, labels in samples:
+            if value is None:
+                continue
+            header(name, kind, help_text)
+            lines.append(f"{name}{_labels(tuple(sorted(labels.items())))} {float(value)!r}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(pairs):
+    if not pairs:
+        return ""
+    escaped = (k + '="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+               for k, v in pairs)
+    return "{" + ",".join(escaped) + "}"
+
+
+metrics = MetricsRegistry()
+metrics.describe("recommender_stage_seconds", "Time spent per scoring stage")
+metrics.describe("recommender_request_seconds", "End-to-end request latency by endpoint")
+metrics.describe("recommender_requests_total", "Requests by endpoint and HTTP status")
+metrics.describe("recommender_slow_profiles_total", "Slow requests whose profile was written")
+
+
+@contextmanager
+def stage(name):
+    """Time the enclosed block into recommender_stage_seconds{stage=name}."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.observe("recommender_stage_seconds", time.perf_counter() - start, stage=name)
+
+
+class SlowRequestProfiler:
+    """
+    Opt-in cProfile hook: profiles a random `sample_rate` share of requests and
+    writes the stats of those slower than `threshold_ms` to `output_dir`.
+    """
+
+    def __init__(self, sample_rate=0.0, threshold_ms=250.0, output_dir="./profiles", max_files=100):
+        self.sample_rate = sample_rate
+        self.threshold = threshold_ms / 1000.0
+        self.output_dir = output_dir
+        self.max_files = max_files
+        self._written = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0
+
+    def start(self):
+        """Return a running profiler for this request, or None if it is not sampled."""
+        if not self.enabled or random.random() >= self.sample_rate:
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:   # another profiler is already active on this thread
+            return None
+        return profiler
+
+    def finish(self, profiler, elapsed, endpoint):
+        """Stop the profiler; keep its stats if the request was slow."""
+        profiler.disable()
+        if elapsed < self.threshold:
+            return None
+        with self._lock:
+            if self._written >= self.max_files:
+                return None
+            self._written += 1
+        os.makedirs(self.output_dir, exist_ok=True)
+        path = os.path.join(self.output_dir, f"{endpoint.strip('/').replace('/', '_') or 'root'}-"
+                                             f"{time.strftime('%Y%m%dT%H%M%S')}-{int(elapsed * 1000)}ms-"
+                                             f"{os.getpid()}-{threading.get_ident()}.prof")
+        profiler.dump_stats(path)
+        metrics.inc("recommender_slow_profiles_total", endpoint=endpoint)
+        return path
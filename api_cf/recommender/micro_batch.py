@@ -0,0 +1,106 @@
+# recommender_service/micro_batch.py
+"""
+Request coalescing for the asyncio (ASGI) service.
+
+Concurrent callers `await batcher.submit(item)`; items are held for at most
+max_wait_ms (or until max_batch_size are waiting), then scored together by
+one blocking score_batch(items) call on a thread pool, and every caller's
+future is resolved with its own result. An idle batcher (nothing being
+scored) dispatches at once, so a lone request pays no wait; while scoring
+threads are busy new items keep queueing, so batches grow with the load.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import metrics
+
+metrics.describe("recommender_microbatch_batches_total", "Micro-batches scored")
+metrics.describe("recommender_microbatch_items_total", "Requests scored through micro-batches")
+
+
+class MicroBatcher:
+    """Coalesce concurrent submits into batches for a blocking batch function."""
+
+    def __init__(self, score_batch, max_batch_size=64, max_wait_ms=2.0, max_in_flight=2):
+        """
+        Parameters:
+            score_batch (callable): list of items -> list of results (same order); runs on a worker thread.
+                An Exception in the results fails only that item's caller.
+            max_batch_size (int): Items scored per call at most.
+            max_wait_ms (float): How long the first item of a batch waits for company.
+            max_in_flight (int): Batches scored at the same time (thread pool size).
+        """
+        self.score_batch = score_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.max_in_flight = max(1, max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix="micro-batch")
+        self._pending = []     # (item, future) waiting for the next batch
+        self._timer = None
+        self._in_flight = set()
+
+    async def submit(self, item):
+        """Queue one item and wait for its result (exceptions of score_batch, or its own, are re-raised)."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        if len(self._pending) >= self.max_batch_size or not self._in_flight:
+            # An idle batcher scores at once: a lone request pays no wait.
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # With every thread busy, leave the items queued; _done flushes them.
+        while self._pending and len(self._in_flight) < self.max_in_flight:
+            batch = self._pending[:self.max_batch_size]
+            del self._pending[:self.max_batch_size]
+            task = asyncio.get_running_loop().create_task(self._score(batch))
+            self._in_flight.add(task)
+            task.add_done_callback(self._done)
+
+    def _done(self, task):
+        self._in_flight.discard(task)
+        if self._pending:
+            self._flush()
+
+    async def _score(self, batch):
+        # Callers that went away (client disconnect) are dropped before scoring.
+        batch = [(item, future) for item, future in batch if not future.done()]
+        if not batch:
+            return
+        metrics.inc("recommender_microbatch_batches_total")
+        metrics.inc("recommender_microbatch_items_total", len(batch))
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self._executor, self.score_batch,
+                                                 [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    async def close(self):
+        """Finish the batches in flight, fail the queued items and stop the threads."""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        for _, future in pending:
+            if not future.done():
+                future.set_exception(RuntimeError("service is shutting down"))
+        if self._in_flight:
+            await asyncio.gather(*self._in_flight, return_exceptions=True)
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,104 @@
+# recommender_service/mips_index.py
+"""
+Approximate maximum-inner-product search over the CF item factors.
+
+The CF ranking score of item i for user (b_u, u) is
+    global_mean + b_u + b_i + v_i . u
+so, per user, items are ranked by the inner product [v_i, b_i] . [u, 1].
+Appending sqrt(M^2 - |x_i|^2) to every item vector (M = max norm) gives all
+items the same norm, which turns MIPS into plain nearest-neighbour search
+(Bachrach et al., 2014). The augmented items are clustered with k-means into
+an inverted file (IVF); a query scores the centroids, probes the n_probe
+best lists and scores only the items in them exactly.
+
+Results are approximate: items in lists that were not probed are missed.
+How many depends on n_probe and on how clustered the factors are, so check
+recall@k with benchmarks/ann_recall.py on the model being served.
+"""
+import numpy as np
+
+from quantize import dequantize_rows
+
+
+def _kmeans(X, n_clusters, n_iter, rng):
+    """Plain Lloyd's k-means. Returns (centroids, labels)."""
+    centroids = X[rng.choice(len(X), size=n_clusters, replace=False)].copy()
+    x_sq = np.einsum('ij,ij->i', X, X)
+    for _ in range(n_iter):
+        # |x - c|^2 = |x|^2 - 2 x.c + |c|^2
+        dist = x_sq[:, None] - 2 * X.dot(centroids.T) + np.einsum('ij,ij->i', centroids, centroids)
+        labels = dist.argmin(axis=1)
+        counts = np.bincount(labels, minlength=n_clusters)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, X)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # Re-seed empty clusters from random items.
+        if empty.any():
+            centroids[empty] = X[rng.choice(len(X), size=int(empty.sum()), replace=False)]
+    dist = x_sq[:, None] - 2 * X.dot(centroids.T) + np.einsum('ij,ij->i', centroids, centroids)
+    return centroids, dist.argmin(axis=1)
+
+
+class IVFIndex:
+    """
+    Inverted-file MIPS index over item_factors plus the item-bias column.
+
+    Parameters:
+        item_factors (np.array): Item latent vectors (num_items x n_factors).
+        item_biases (np.array): Item biases (num_items,).
+        n_lists (int): Number of k-means lists; 0 picks ~sqrt(num_items).
+        n_probe (int): Lists scanned per query.
+        n_iter (int): k-means iterations.
+        seed (int): Seed for the k-means initialisation.
+    """
+
+    def __init__(self, item_factors, item_biases, n_lists=0, n_probe=8, n_iter=10, seed=42):
+        item_factors = np.asarray(item_factors, dtype=np.float64)
+        n_items = item_factors.shape[0]
+        if n_lists <= 0:
+            n_lists = max(1, int(round(np.sqrt(n_items))))
+        n_lists = min(n_lists, n_items)
+
+        vectors = np.hstack([item_factors, np.asarray(item_biases, dtype=np.float64)[:, None]])
+        sq_norms = np.einsum('ij,ij->i', vectors, vectors)
+        extra = np.sqrt(np.maximum(sq_norms.max() - sq_norms, 0.0))
+        augmented = np.hstack([vectors, extra[:, None]])
+
+        centroids, labels = _kmeans(augmented, n_lists, n_iter, np.random.default_rng(seed))
+        # Query vectors are [u, 1, 0], so the last centroid column never contributes.
+        self.centroids = np.ascontiguousarray(centroids[:, :-1])
+        self.list_items = np.argsort(labels, kind="stable")
+        self.list_offsets = np.concatenate(([0], np.cumsum(np.bincount(labels, minlength=n_lists))))
+        self.n_lists = n_lists
+        self.n_probe = min(n_probe, n_lists)
+        self.n_items = n_items
+
+    def candidates(self, u, n_probe=None):
+        """
+        Item rows in the n_probe lists whose centroids best match the user vector.
+
+        Returns:
+            np.array of int64 item rows (unordered).
+        """
+        n_probe = min(n_probe or self.n_probe, self.n_lists)
+        query = np.append(np.asarray(u, dtype=np.float64), 1.0)
+        centroid_scores = self.centroids.dot(query)
+        probe = np.argpartition(centroid_scores, -n_probe)[-n_probe:]
+        return np.concatenate([self.list_items[self.list_offsets[c]:self.list_offsets[c + 1]]
+                               for c in probe])
+
+    def search(self, u, item_factors, item_biases, N, n_probe=None, item_scales=None):
+        """
+        Approximate top-N items by b_i + v_i . u (v_i dequantised with item_scales for int8 factors).
+
+        Returns:
+            rows (np.array): Item rows, best first.
+            scores (np.array): b_i + v_i . u for those rows.
+        """
+        rows = self.candidates(u, n_probe)
+        scores = item_biases[rows] + dequantize_rows(item_factors, item_scales, rows).dot(u)
+        N = min(N, len(rows))
+        top = np.argpartition(scores, -N)[-N:] if N > 0 else np.empty(0, dtype=np.int64)
+        top = top[np.argsort(scores[top])[::-1]]
+        return rows[top], scores[top]
@@ -0,0 +1,403 @@
+# recommender_service/model_store.py
+"""
+Loading of the CF model artifact and the hot-swappable serving bundle.
+
+New artifacts are a directory of .npy arrays plus manifest.json (written by
+offline-training/artifact.py); the arrays are memory-mapped read-only, so all
+workers on a host share one page-cache copy and nothing is unpickled. Legacy
+`item_factors.pkl` files are still readable. Factors may be stored (or
+converted at load) as float32 or int8 with per-row scales, see quantize.py.
+"""
+import dataclasses
+import itertools
+import json
+import os
+import pickle
+import threading
+import time
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from content_based import ContentBasedIndex
+from fold_in import ItemIdIndex
+from mips_index import IVFIndex
+from quantize import dequantize_rows, encode_factors
+
+FORMAT_NAME = "bgrec-cf-model"
+SUPPORTED_FORMAT_VERSIONS = (1, 2)   # 2 = int8 factors + item_factor_scales
+MANIFEST_FILE = "manifest.json"
+LATEST_FILE = "LATEST"
+LEGACY_PICKLE = "item_factors.pkl"
+
+
+@dataclass(frozen=True)
+class CFModel:
+    """Immutable CF model parameters plus the raw-id lookup."""
+    item_factors: np.ndarray      # (num_items, n_factors), float64 / float32 / int8
+    item_biases: np.ndarray       # (num_items,)
+    global_mean: float
+    item_ids: np.ndarray          # raw item id of each model row
+    item_lookup: ItemIdIndex      # raw item id -> model row
+    reg_coeff: float
+    version: str
+    path: str
+    manifest: dict = field(default_factory=dict)
+    item_scales: np.ndarray = None  # per-row scales of int8 item_factors, else None
+    neighbour_ids: np.ndarray = None     # (num_items, K) int32 "more like this" ids, if built
+    neighbour_scores: np.ndarray = None  # (num_items, K) float16 similarities
+
+    @property
+    def n_items(self):
+        return self.item_factors.shape[0]
+
+    @property
+    def n_factors(self):
+        return self.item_factors.shape[1]
+
+    @property
+    def factor_dtype(self):
+        return str(self.item_factors.dtype)
+
+    @property
+    def nbytes(self):
+        """Memory of the factor, bias and scale arrays."""
+        scales = self.item_scales.nbytes if self.item_scales is not None else 0
+        return self.item_factors.nbytes + self.item_biases.nbytes + scales
+
+    def factor_rows(self, rows=None):
+        """Float item vectors (dequantised if the factors are int8)."""
+        return dequantize_rows(self.item_factors, self.item_scales, rows)
+
+    def similar_items(self, item_id, n=None):
+        """
+        Precomputed neighbours of one item, best first.
+
+        Returns:
+            List of (item_id, similarity) tuples, or None if the item is not in the model.
+        """
+        row = self.item_lookup.lookup([item_id])[0]
+        if row < 0:
+            return None
+        ids = self.neighbour_ids[row, :n]
+        scores = self.neighbour_scores[row, :n]
+        return [(int(i), float(s)) for i, s in zip(ids, scores)]
+
+
+def default_cf_model_path(model_data_dir):
+    """Versioned artifact directory if present, else the legacy pickle."""
+    artifact_dir = os.path.join(model_data_dir, "cf_model")
+    if os.path.isdir(artifact_dir):
+        return artifact_dir
+    return os.path.join(model_data_dir, LEGACY_PICKLE)
+
+
+def resolve_version_dir(path):
+    """Follow the LATEST pointer of an artifact root; version directories pass through."""
+    latest = os.path.join(path, LATEST_FILE)
+    if os.path.isfile(latest):
+        with open(latest) as f:
+            return os.path.join(path, f.read().strip())
+    return path
+
+
+def load_cf_model(path, mmap_mode="r", factor_dtype=None):
+    """
+    Load a CF model from an artifact root, a version directory or a legacy pickle.
+
+    Parameters:
+        path (str): Artifact root (with LATEST), version directory or .pkl file.
+        mmap_mode (str or None): Passed to np.load; None reads arrays into memory.
+        factor_dtype (str, optional): "float64", "float32" or "int8" to convert
+            the factors on load; None serves them as stored (memory-mapped).
+
+    Returns:
+        CFModel
+    """
+    if os.path.isdir(path):
+        cf = _load_artifact_dir(resolve_version_dir(path), mmap_mode)
+    elif path.endswith(".pkl"):
+        cf = _load_legacy_pickle(path)
+    else:
+        raise FileNotFoundError(f"no CF model artifact at {path}")
+    if factor_dtype and factor_dtype != cf.factor_dtype:
+        cf = convert_factors(cf, factor_dtype)
+    return cf
+
+
+def convert_factors(cf, factor_dtype):
+    """
+    Re-encode a model's factors (see quantize.FACTOR_DTYPES).
+
+    The converted arrays are private to the process (not memory-mapped);
+    under gunicorn's preload_app they are still shared copy-on-write.
+    """
+    item_factors, item_biases, item_scales = encode_factors(cf.factor_rows(), cf.item_biases, factor_dtype)
+    return dataclasses.replace(cf, item_factors=item_factors, item_biases=item_biases, item_scales=item_scales)
+
+
+def _load_artifact_dir(version_dir, mmap_mode):
+    with open(os.path.join(version_dir, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != FORMAT_NAME:
+        raise ValueError(f"{version_dir}: not a {FORMAT_NAME} artifact")
+    if manifest.get("format_version") not in SUPPORTED_FORMAT_VERSIONS:
+        raise ValueError(f"{version_dir}: unsupported format_version {manifest.get('format_version')}")
+
+    arrays = {}
+    for name, spec in manifest["arrays"].items():
+        arr = np.load(os.path.join(version_dir, spec["file"]), mmap_mode=mmap_mode, allow_pickle=False)
+        if arr.dtype.str != spec["dtype"] or list(arr.shape) != spec["shape"]:
+            raise ValueError(f"{version_dir}: {name} does not match the manifest schema")
+        arrays[name] = arr
+
+    return CFModel(
+        item_factors=arrays["item_factors"],
+        item_biases=arrays["item_biases"],
+        global_mean=float(manifest["global_mean"]),
+        item_ids=arrays["item_ids"],
+        item_lookup=ItemIdIndex.from_sorted(arrays["item_ids_sorted"], arrays["item_ids_order"]),
+        reg_coeff=float(manifest["reg_coeff"]),
+        version=manifest["model_version"],
+        path=version_dir,
+        manifest=manifest,
+        item_scales=arrays.get("item_factor_scales"),
+        neighbour_ids=arrays.get("neighbour_ids"),
+        neighbour_scores=arrays.get("neighbour_scores"),
+    )
+
+
+def _load_legacy_pickle(path):
+    with open(path, "rb") as f:
+        model_data = pickle.load(f)
+    item_ids = np.asarray(model_data["item_ids_list"])
+    return CFModel(
+        item_factors=np.asarray(model_data["item_factors"]),
+        item_biases=np.asarray(model_data["item_biases"]),
+        global_mean=float(model_data["global_mean"]),
+        item_ids=item_ids,
+        item_lookup=ItemIdIndex(item_ids),
+        reg_coeff=float(model_data["reg_coeff"]),
+        version=f"legacy-{int(os.path.getmtime(path))}",
+        path=path,
+    )
+
+
+# ------------------------------------------------------------------
+# Serving bundle + hot reload
+# ------------------------------------------------------------------
+CB_FILES = ("themes.pkl", "games.pkl", "category_transform.pkl")
+
+# Numbers every bundle loaded by this process; see ModelBundle.load_id.
+_load_ids = itertools.count(1)
+
+
+@dataclass(frozen=True)
+class ModelBundle:
+    """
+    Everything a request handler reads, loaded and validated together.
+
+    Handlers take one reference to the current bundle per request, so a
+    reload can never mix old CF factors with new CB frames.
+    """
+    cf: CFModel
+    cb_index: ContentBasedIndex
+    cb_rows: np.ndarray           # CB rows of games the CF model knows ...
+    cf_rows: np.ndarray           # ... and their CF rows
+    cf_to_cb: np.ndarray          # CF row -> CB row, -1 if the game has no theme data
+    cb_cf_index: ContentBasedIndex  # cb_index re-ordered to CF rows (scored straight into CF space)
+    ann_index: object             # IVFIndex or None for exact retrieval
+    version: str
+    fingerprint: tuple
+    # Unique per load in this process. Caches key on it, not on version: a
+    # reload of only the CB frames keeps the CF version but changes the scores.
+    load_id: int
+    loaded_at: float
+    load_seconds: float
+
+    @property
+    def num_checkboxes(self):
+        return self.cb_index.num_checkboxes
+
+    @property
+    def cb_theme_bytes(self):
+        """Memory of the theme flags, in game order and in CF item order."""
+        return self.cb_index.nbytes + self.cb_cf_index.nbytes
+
+
+def model_fingerprint(model_data_dir, cf_model_path=None):
+    """Cheap identity of the on-disk model files; changes whenever a reload is due."""
+    cf_model_path = cf_model_path or default_cf_model_path(model_data_dir)
+    if os.path.isdir(cf_model_path):
+        cf_part = resolve_version_dir(cf_model_path)
+    else:
+        cf_part = (cf_model_path, os.path.getmtime(cf_model_path))
+    cb_part = tuple(os.path.getmtime(os.path.join(model_data_dir, name)) for name in CB_FILES)
+    return (cf_part,) + cb_part
+
+
+def load_bundle(model_data_dir, cf_model_path=None, retrieval_mode="exact", ivf_n_lists=0, ivf_n_probe=8,
+                factor_dtype=None, cb_theme_format="dense"):
+    """
+    Load the CF artifact and the CB frames, build the derived indexes and validate them.
+
+    factor_dtype converts the CF factors on load (None keeps the stored encoding);
+    cb_theme_format is "dense" or "csr" (see ContentBasedIndex).
+
+    Raises ValueError if the pieces do not fit together.
+    """
+    start = time.perf_counter()
+    cf_model_path = cf_model_path or default_cf_model_path(model_data_dir)
+    fingerprint = model_fingerprint(model_data_dir, cf_model_path)
+    cf = load_cf_model(cf_model_path, factor_dtype=factor_dtype)
+
+    df_themes = pd.read_pickle(os.path.join(model_data_dir, "themes.pkl"))
+    df_games = pd.read_pickle(os.path.join(model_data_dir, "games.pkl"))
+    df_transform = pd.read_pickle(os.path.join(model_data_dir, "category_transform.pkl"))
+    cb_index = ContentBasedIndex.from_frames(df_themes, df_games, df_transform, theme_format=cb_theme_format)
+
+    # ----------- Validation -----------
+    if cf.item_biases.shape != (cf.n_items,) or cf.item_ids.shape != (cf.n_items,):
+        raise ValueError("item_factors, item_biases and item_ids disagree on the number of items")
+    if len(cf.item_lookup) != cf.n_items or np.any(cf.item_lookup.sorted_ids[1:] == cf.item_lookup.sorted_ids[:-1]):
+        raise ValueError("item id lookup is inconsistent with the factor matrix")
+    if not (np.isfinite(cf.item_factors).all() and np.isfinite(cf.item_biases).all()):
+        raise ValueError("CF model contains non-finite parameters")
+    if (cf.item_scales is not None) != (cf.item_factors.dtype == np.int8) or \
+            (cf.item_scales is not None and cf.item_scales.shape != (cf.n_items,)):
+        raise ValueError("int8 item factors need exactly one scale per item")
+    if cf.neighbour_ids is not None and (cf.neighbour_ids.shape[0] != cf.n_items or
+                                         cf.neighbour_scores is None or
+                                         cf.neighbour_scores.shape != cf.neighbour_ids.shape):
+        raise ValueError("neighbour table does not match the item factors")
+    if len(df_games) != cb_index.num_games:
+        raise ValueError("games.pkl and themes.pkl disagree on the number of games")
+
+    # CB row -> CF row (-1 for games the CF model does not know), so the CB
+    # scores can be scattered into CF index space in one step per request.
+    cb_to_cf = cf.item_lookup.lookup(df_games["BGGId"].to_numpy())  # adapt column name if needed
+    cb_rows = np.flatnonzero(cb_to_cf >= 0)
+    if len(cb_rows) == 0:
+        raise ValueError("no game in games.pkl is known to the CF model")
+    cf_rows = cb_to_cf[cb_rows]
+    cf_to_cb = np.full(cf.n_items, -1, dtype=np.int64)
+    cf_to_cb[cf_rows] = cb_rows
+
+    if retrieval_mode == "ivf":
+        ann_index = IVFIndex(cf.factor_rows(), cf.item_biases, n_lists=ivf_n_lists, n_probe=ivf_n_probe)
+    elif retrieval_mode == "exact":
+        ann_index = None
+    else:
+        raise ValueError(f"RETRIEVAL_MODE must be 'exact' or 'ivf', got {retrieval_mode!r}")
+
+    return ModelBundle(
+        cf=cf, cb_index=cb_index, cb_rows=cb_rows, cf_rows=cf_rows, cf_to_cb=cf_to_cb,
+        cb_cf_index=cb_index.reindexed(cf_to_cb),
+        ann_index=ann_index, version=cf.version, fingerprint=fingerprint, load_id=next(_load_ids),
+        loaded_at=time.time(), load_seconds=time.perf_counter() - start,
+    )
+
+
+class ModelRegistry:
+    """
+    Holds the active ModelBundle and swaps in new ones without a restart.
+
+    A reload builds and validates a complete new bundle off to the side and
+    then replaces the reference in one assignment; in-flight requests keep
+    the bundle they started with. A failed reload leaves the old bundle live,
+    and the watcher does not retry those files until they change again.
+    """
+
+    def __init__(self, loader, fingerprint=None):
+        """
+        Parameters:
+            loader (callable): Returns a fresh ModelBundle.
+            fingerprint (callable, optional): Returns the current on-disk
+                fingerprint; used by the watcher to detect new models.
+        """
+        self._loader = loader
+        self._fingerprint = fingerprint
+        self._current = None
+        self._reload_lock = threading.Lock()
+        self._listeners = []
+        self._watcher = None
+        self._failed_fingerprint = None   # files whose last load failed; the watcher skips them
+        self.reload_count = 0
+        self.last_error = None
+
+    @property
+    def current(self):
+        return self._current
+
+    def add_listener(self, callback):
+        """Call callback(new_bundle) after every successful swap."""
+        self._listeners.append(callback)
+
+    def reload(self):
+        """
+        Load a new bundle and swap it in (blocking).
+
+        Returns the new bundle; re-raises the load error and keeps the old
+        bundle live if loading or validation fails.
+        """
+        with self._reload_lock:
+            try:
+                bundle = self._loader()
+            except Exception as e:
+                self.last_error = f"{type(e).__name__}: {e}"
+                raise
+            self._current = bundle
+            self.reload_count += 1
+            self.last_error = None
+        for callback in self._listeners:
+            callback(bundle)
+        return bundle
+
+    def reload_in_background(self):
+        """Start a reload on a daemon thread; returns False if one is already running."""
+        if self._reload_lock.locked():
+            return False
+        threading.Thread(target=self._reload_quietly, name="model-reload", daemon=True).start()
+        return True
+
+    def _reload_quietly(self):
+        """reload() that logs instead of raising; returns whether it succeeded."""
+        try:
+            self.reload()
+        except Exception as e:
+            print("Model reload failed, keeping the current model:", e)
+            return False
+        return True
+
+    def start_watching(self, interval):
+        """Poll the model files every `interval` seconds and reload when they change."""
+        if self._fingerprint is None or self._watcher is not None:
+            return
+        self._watcher = threading.Thread(target=self._watch, args=(interval,),
+                                         name="model-watcher", daemon=True)
+        self._watcher.start()
+
+    def _watch(self, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                fingerprint = self._fingerprint()
+            except OSError:
+                continue  # files are being replaced; look again next round
+            changed = self._current is None or fingerprint != self._current.fingerprint
+            if changed and fingerprint != self._failed_fingerprint and not self._reload_quietly():
+                # Retrying a broken version would log the same error every tick; wait for newer files.
+                self._failed_fingerprint = fingerprint
+
+    def status(self):
+        bundle = self._current
+        return {
+            "model_version": bundle.version if bundle else None,
+            "model_path": bundle.cf.path if bundle else None,
+            "loaded_at": bundle.loaded_at if bundle else None,
+            "load_seconds": bundle.load_seconds if bundle else None,
+            "reload_count": self.reload_count,
+            "reloading": self._reload_lock.locked(),
+            "last_error": self.last_error,
+        }
@@ -0,0 +1,86 @@
+# recommender_service/quantize.py
+"""
+Compact encodings of the CF item factors.
+
+  * float64: as trained (Surprise / SGD / ALS default)
+  * float32: half the memory; scores agree to ~1e-7 relative
+  * int8:    one signed byte per factor plus a float32 scale per item row
+             (symmetric, scale = max|row| / 127), 1/8 of float64
+
+int8 factors are never expanded as a whole: scoring dequantises the rows it
+gathers (fold-in, IVF candidates) or one block of items at a time (GEMM).
+"""
+import numpy as np
+
+FACTOR_DTYPES = ("float64", "float32", "int8")
+
+# Items dequantised per block when scoring every item against int8 factors.
+DEQUANT_BLOCK_ROWS = 4096
+
+
+def quantize_rows(factors):
+    """
+    Symmetric per-row int8 quantisation.
+
+    Returns:
+        q (np.array): int8 codes, same shape as factors.
+        scales (np.array): float32 scale per row; factors ~= q * scales[:, None].
+    """
+    factors = np.asarray(factors, dtype=np.float64)
+    max_abs = np.abs(factors).max(axis=1) if factors.size else np.zeros(len(factors))
+    scales = (max_abs / 127.0).astype(np.float32)
+    inv = np.divide(1.0, scales, out=np.zeros(len(scales), dtype=np.float64), where=scales > 0)
+    q = np.clip(np.rint(factors * inv[:, None]), -127, 127).astype(np.int8)
+    return q, scales
+
+
+def encode_factors(factors, item_biases, factor_dtype):
+    """
+    Convert float factors / biases to one of FACTOR_DTYPES.
+
+    Returns:
+        (factors, item_biases, scales); scales is None unless factor_dtype is int8.
+    """
+    if factor_dtype not in FACTOR_DTYPES:
+        raise ValueError(f"factor dtype must be one of {FACTOR_DTYPES}, got {factor_dtype!r}")
+    if factor_dtype == "float64":
+        return np.asarray(factors, dtype=np.float64), np.asarray(item_biases, dtype=np.float64), None
+    item_biases = np.asarray(item_biases, dtype=np.float32)
+    if factor_dtype == "float32":
+        return np.ascontiguousarray(factors, dtype=np.float32), item_biases, None
+    q, scales = quantize_rows(factors)
+    return q, item_biases, scales
+
+
+def dequantize_rows(factors, scales, rows=None):
+    """
+    Float rows of the factor matrix (all rows if rows is None).
+
+    Float factors are returned as stored (gathered if rows is given); int8
+    factors come back as float32 codes * scales.
+    """
+    if scales is None:
+        return factors if rows is None else factors[rows]
+    if rows is None:
+        return factors.astype(np.float32) * scales[:, None]
+    return factors[rows].astype(np.float32) * scales[rows][..., None]
+
+
+def factor_scores(U, factors, scales=None):
+    """
+    U @ factors.T for a (num_users x n_factors) user matrix.
+
+    int8 factors are dequantised DEQUANT_BLOCK_ROWS items at a time, so the
+    float copy never exceeds one block.
+    """
+    U = np.asarray(U)
+    if scales is None:
+        return U.dot(factors.T)
+    dtype = np.result_type(U.dtype, np.float32)
+    U = U.astype(dtype, copy=False)
+    out = np.empty((U.shape[0], factors.shape[0]), dtype=dtype)
+    for lo in range(0, factors.shape[0], DEQUANT_BLOCK_ROWS):
+        hi = min(lo + DEQUANT_BLOCK_ROWS, factors.shape[0])
+        out[:, lo:hi] = U.dot(factors[lo:hi].astype(dtype).T)
+    out *= scales
+    return out
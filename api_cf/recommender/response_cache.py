@@ -0,0 +1,149 @@
+# recommender_service/response_cache.py
+"""
+In-process caches for repeat recommendation requests.
+
+The front end re-posts the same user's ratings and preferences on every page
+visit, so finished recommendations are cached under a canonical hash of
+(loaded bundle, ratings, preferences, top_n). CB similarity vectors depend
+only on the preference checkboxes and are cached separately per bitmask,
+which also serves users whose ratings differ. Both caches are bounded (LRU)
+with a TTL, keyed by ModelBundle.load_id and cleared when a new model is swapped
+in; a request still finishing on the old bundle can only write entries that the
+new bundle never reads.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+class LRUCache:
+    """Thread-safe LRU cache with a per-entry TTL and hit/miss counters."""
+
+    def __init__(self, max_entries, ttl_seconds=0, clock=time.monotonic):
+        """
+        Parameters:
+            max_entries (int): Entries kept before the least recently used is evicted (0 disables the cache).
+            ttl_seconds (float): Entry lifetime; 0 = no expiry.
+            clock (callable): Monotonic time source.
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._entries = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at is not None and self._clock() >= expires_at:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if self.max_entries <= 0:
+            return
+        expires_at = self._clock() + self.ttl_seconds if self.ttl_seconds > 0 else None
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+def request_key(bundle_id, ratings, pref_booleans, top_n):
+    """
+    Canonical hash of one parsed /recommend request.
+
+    Ratings are order-insensitive (the fold-in sums over them), so they are
+    sorted. Ratings are normalised to float, as the fold-in reads them; ids
+    keep their JSON type, since "13" and 13 resolve differently. Returns None
+    for payloads that cannot be canonicalised; those are simply not cached.
+    """
+    try:
+        pairs = sorted(json.dumps([item_id, float(rating)]) for (item_id, rating) in ratings)
+        prefs = [bool(p) for p in pref_booleans]
+        canonical = json.dumps([bundle_id, pairs, prefs, int(top_n)], separators=(",", ":"))
+    except (TypeError, ValueError):
+        return None
+    return hashlib.blake2b(canonical.encode(), digest_size=16).hexdigest()
+
+
+def preference_mask(pref_booleans):
+    """Pack the checkbox booleans into one int (bit i = checkbox i)."""
+    return int.from_bytes(np.packbits(np.asarray(pref_booleans, dtype=bool), bitorder="little").tobytes(),
+                          "little")
+
+
+def cached_cb_scores(cache, bundle, prefs_batch):
+    """
+    CB similarities in CF item order, one row per distinct preference bitmask.
+
+    Users with the same checkboxes share a row. Rows for bitmasks already in
+    `cache` are reused; the rest are scored with one score_matrix call on
+    bundle.cb_cf_index and stored. The CB scores are exact in float32, so
+    cached and freshly computed rows are identical.
+
+    Returns:
+        rows (np.array): (num_distinct x num_cf_items) similarities.
+        inverse (np.array): Row of `rows` for each user of the batch.
+    """
+    slots, firsts = {}, []
+    inverse = np.empty(len(prefs_batch), dtype=np.int64)
+    for i, prefs in enumerate(prefs_batch):
+        mask = preference_mask(prefs)
+        if mask not in slots:
+            slots[mask] = len(firsts)
+            firsts.append(i)
+        inverse[i] = slots[mask]
+    if not firsts:
+        return bundle.cb_cf_index.score_matrix(prefs_batch), inverse
+    keys = [(bundle.load_id, mask) for mask in slots]
+    rows = [cache.get(key) for key in keys]
+    missing = [j for j, row in enumerate(rows) if row is None]
+    if missing:
+        fresh = bundle.cb_cf_index.score_matrix([prefs_batch[firsts[j]] for j in missing])
+        for j, row in zip(missing, fresh):
+            row = row.copy()            # don't pin the whole batch matrix
+            row.setflags(write=False)   # shared between requests
+            rows[j] = row
+            cache.put(keys[j], row)
+    return np.stack(rows), inverse
@@ -0,0 +1,268 @@
+# recommender_service/service.py
+"""
+Settings, payload parsing and the scoring service, free of any web framework.
+
+app.py (Flask), asgi.py (uvicorn) and the offline ranking evaluation all
+score through RecommenderService.recommend_users, so offline numbers
+describe exactly what the endpoints return.
+"""
+import os
+
+import numpy as np
+
+from fold_in import compute_user_profiles
+from hybrid import (blend_candidates, blend_into, cf_score_matrix, dynamic_alpha, exclude_rated,
+                    top_candidates, top_n_rows)
+from metrics import SlowRequestProfiler, stage
+from model_store import ModelRegistry, load_bundle, model_fingerprint
+from response_cache import LRUCache, cached_cb_scores, request_key
+
+# ------------------------------------------------------------------
+# Settings
+# ------------------------------------------------------------------
+def settings_from_env():
+    """Service settings from the environment (read when an app is created, not at import)."""
+    return {
+        "MODEL_DATA_DIR": os.getenv("MODEL_DATA_DIR", "../model_data"),
+        # Versioned artifact directory (arrays are memory-mapped) or a legacy item_factors.pkl;
+        # unset -> model_data/cf_model if it exists, else model_data/item_factors.pkl
+        "CF_MODEL_PATH": os.getenv("CF_MODEL_PATH"),
+        # Seconds between checks of the model files for a new version (0 disables the watcher)
+        "MODEL_WATCH_INTERVAL": float(os.getenv("MODEL_WATCH_INTERVAL", 30)),
+        # If set, /admin/* endpoints require this value in the X-Admin-Token header
+        "ADMIN_TOKEN": os.getenv("ADMIN_TOKEN"),
+
+        # Users scored per GEMM in /recommend/batch (bounds the score matrices in RAM)
+        "BATCH_CHUNK_SIZE": int(os.getenv("BATCH_CHUNK_SIZE", 256)),
+
+        # CF retrieval: "exact" scores every item, "ivf" only the probed IVF lists
+        "RETRIEVAL_MODE": os.getenv("RETRIEVAL_MODE", "exact"),
+        "IVF_N_LISTS": int(os.getenv("IVF_N_LISTS", 0)),        # 0 -> ~sqrt(num items)
+        # Lists probed per query. This is a recall/speed trade-off: on the synthetic 15k-item, 50-factor
+        # model (unclustered random factors, ~122 lists) benchmarks/ann_recall.py gives CF recall@20 of
+        # 0.39 / 0.55 / 0.74 / 0.92 at 8 / 16 / 32 / 64 probes, scanning 6 / 12 / 25 / 52% of the items.
+        # Measure on the real model before relying on the default.
+        "IVF_N_PROBE": int(os.getenv("IVF_N_PROBE", 8)),
+        "CB_CANDIDATES": int(os.getenv("CB_CANDIDATES", 200)),  # CB games added to the IVF candidates
+
+        # Serve the CF factors as float64, float32 or int8 (+ per-row scales); unset = as stored in the artifact
+        "FACTOR_DTYPE": os.getenv("FACTOR_DTYPE") or None,
+        # CB theme flags as a "dense" float32 matrix (fastest) or "csr" (~30x smaller)
+        "CB_THEME_FORMAT": os.getenv("CB_THEME_FORMAT", "dense"),
+
+        # Finished recommendations per (loaded model, ratings, preferences, top_n); 0 disables
+        "RESPONSE_CACHE_SIZE": int(os.getenv("RESPONSE_CACHE_SIZE", 10000)),
+        "RESPONSE_CACHE_TTL": float(os.getenv("RESPONSE_CACHE_TTL", 600)),  # seconds, 0 = no expiry
+        # CB similarity vectors per preference bitmask (~4 bytes x num games each)
+        "CB_CACHE_SIZE": int(os.getenv("CB_CACHE_SIZE", 256)),
+
+        # Opt-in profiling: cProfile this share of requests, keep the ones slower than PROFILE_SLOW_MS
+        "PROFILE_SAMPLE_RATE": float(os.getenv("PROFILE_SAMPLE_RATE", 0)),
+        "PROFILE_SLOW_MS": float(os.getenv("PROFILE_SLOW_MS", 250)),
+        "PROFILE_DIR": os.getenv("PROFILE_DIR", "./profiles"),
+    }
+
+# ------------------------------------------------------------------
+# Scoring
+# ------------------------------------------------------------------
+def parse_user(data, num_checkboxes):
+    """
+    Validate one user's payload.
+
+    Returns (ratings, pref_booleans, top_n); raises ValueError on bad input.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("payload must be a JSON object")
+    # Get the ratings list (each element is a (item_id, rating) tuple).
+    ratings = data.get("ratings", [])
+    if not isinstance(ratings, list):
+        raise ValueError("'ratings' must be a list of [game_id, rating] pairs")
+    for pair in ratings:
+        # Checked here, not in the scorer: under micro-batching a bad pair would fail the whole batch.
+        if (not isinstance(pair, (list, tuple)) or len(pair) != 2
+                or isinstance(pair[1], bool) or not isinstance(pair[1], (int, float))):
+            raise ValueError(f"'ratings' entries must be [game_id, rating] pairs with a numeric rating, got {pair!r}")
+    pref_booleans = data.get("preferences", [False] * num_checkboxes)
+    if not isinstance(pref_booleans, list):
+        raise ValueError("'preferences' must be a list of booleans")
+    if len(pref_booleans) != num_checkboxes:
+        raise ValueError(f"'preferences' must have {num_checkboxes} booleans")
+    try:
+        top_n = int(data.get("top_n", 20))
+    except (TypeError, ValueError):
+        raise ValueError("'top_n' must be an integer")
+    return ratings, pref_booleans, top_n
+
+class RecommenderService:
+    """
+    Model registry, caches and settings of one app instance.
+
+    The registry loads the CF artifact + CB frames once and swaps in a
+    complete new bundle whenever a new model is published.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.registry = ModelRegistry(
+            loader=lambda: load_bundle(settings["MODEL_DATA_DIR"], settings["CF_MODEL_PATH"],
+                                       settings["RETRIEVAL_MODE"], settings["IVF_N_LISTS"],
+                                       settings["IVF_N_PROBE"], settings["FACTOR_DTYPE"],
+                                       settings["CB_THEME_FORMAT"]),
+            fingerprint=lambda: model_fingerprint(settings["MODEL_DATA_DIR"], settings["CF_MODEL_PATH"]),
+        )
+        self.profiler = SlowRequestProfiler(settings["PROFILE_SAMPLE_RATE"], settings["PROFILE_SLOW_MS"],
+                                            settings["PROFILE_DIR"])
+        self.response_cache = LRUCache(settings["RESPONSE_CACHE_SIZE"], settings["RESPONSE_CACHE_TTL"])
+        self.cb_cache = LRUCache(settings["CB_CACHE_SIZE"], settings["RESPONSE_CACHE_TTL"])
+        self.registry.add_listener(self.clear_caches)
+
+    def clear_caches(self, bundle=None):
+        # Keys carry the bundle's load_id, so this only frees memory early.
+        self.response_cache.clear()
+        self.cb_cache.clear()
+
+    def load_model(self):
+        """Initial load; on failure the service starts unready and the watcher retries when the files change."""
+        try:
+            self.registry.reload()
+        except Exception:
+            print(f"Model load failed, answering 503 until a model loads: {self.registry.last_error}")
+            return False
+        return True
+
+    def start_watching(self):
+        """Poll for new models; call in every serving process (threads do not survive fork)."""
+        if self.settings["MODEL_WATCH_INTERVAL"] > 0:
+            self.registry.start_watching(self.settings["MODEL_WATCH_INTERVAL"])
+
+    def recommend_users(self, bundle, users):
+        """
+        Hybrid top-N for a batch of parsed users.
+
+        Parameters:
+            bundle (ModelBundle): Model snapshot to score against.
+            users (list): (ratings, pref_booleans, top_n) per user, as returned by parse_user.
+
+        Returns:
+            List of (alpha, recommendations) per user, where recommendations is a
+            list of (item_id, hybrid_score) tuples.
+        """
+        # ----------- 1.  Fold-in + CB similarities -----------
+        # Fold every user in with one stacked solve.
+        cf = bundle.cf
+        with stage("fold_in"):
+            b_u, U = compute_user_profiles([ratings for ratings, _, _ in users], cf.item_lookup, cf.item_factors,
+                                           cf.item_biases, cf.global_mean, cf.reg_coeff, cf.n_factors,
+                                           item_scales=cf.item_scales)
+            # Rated rows of every user from one lookup.
+            rated_rows = np.split(cf.item_lookup.lookup([item_id for ratings, _, _ in users
+                                                         for (item_id, rating) in ratings]),
+                                  np.cumsum([len(ratings) for ratings, _, _ in users])[:-1])
+        with stage("cb_score"):
+            # One CB row per distinct checkbox selection, already in CF item order.
+            cb_sims, cb_of_user = cached_cb_scores(self.cb_cache, bundle, [prefs for _, prefs, _ in users])
+        if bundle.ann_index is not None:
+            with stage("ivf_retrieve_blend"):
+                return self.recommend_users_approx(bundle, users, b_u, U, cb_sims, cb_of_user, rated_rows)
+
+        # ----------- 2.  CF score matrix -----------
+        # Score the whole catalogue with one GEMM.
+        with stage("cf_score"):
+            cf_scores = cf_score_matrix(b_u, U, cf.item_factors, cf.item_biases, cf.global_mean, cf.item_scales)
+
+        # ----------- 3.  Blend (in place, over cf_scores) -----------
+        with stage("blend"):
+            hybrid, alphas = blend_into(cf_scores, cb_sims, cb_of_user, [len(ratings) for ratings, _, _ in users])
+
+            # Exclude rated items!!
+            exclude_rated(hybrid, rated_rows)
+
+        # ----------- 4.  Top‑N (grouped so each user gets exactly its own N) -----------
+        with stage("top_k"):
+            results = [None] * len(users)
+            top_ns = np.array([top_n for _, _, top_n in users])
+            for N in np.unique(top_ns):
+                rows = np.flatnonzero(top_ns == N)
+                group = hybrid[rows]
+                top_idx = top_n_rows(group, N)
+                top_scores = np.take_along_axis(group, top_idx, axis=1)
+                for row, idx, scores in zip(rows, top_idx, top_scores):
+                    # Rated items sit at -inf; when N exceeds the unrated count they fill the tail.
+                    keep = np.isfinite(scores)
+                    recommendations = list(zip(cf.item_ids[idx[keep]].tolist(), scores[keep].tolist()))
+                    results[row] = (float(alphas[row]), recommendations)
+        return results
+
+    def recommend_users_cached(self, bundle, users):
+        """
+        recommend_users with the response cache in front: only users whose
+        (bundle, ratings, preferences, top_n) were not seen recently are scored.
+        """
+        keys = [request_key(bundle.load_id, ratings, prefs, top_n) for ratings, prefs, top_n in users]
+        results = [self.response_cache.get(key) if key is not None else None for key in keys]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if missing:
+            scored = self.recommend_users(bundle, [users[i] for i in missing])
+            for i, result in zip(missing, scored):
+                results[i] = result
+                if keys[i] is not None:
+                    self.response_cache.put(keys[i], result)
+        return results
+
+    def recommend_users_approx(self, bundle, users, b_u, U, cb_sims, cb_of_user, rated_rows):
+        """
+        RETRIEVAL_MODE=ivf variant of recommend_users.
+
+        Per user, only the items in the probed IVF lists plus the CB_CANDIDATES
+        best CB games are scored and blended; normalisation runs over that
+        candidate set, so scores are close to but not identical with exact mode.
+        cb_sims / cb_of_user are as returned by cached_cb_scores.
+        """
+        cf = bundle.cf
+        results = []
+        for i, (ratings, _, N) in enumerate(users):
+            # CB similarities of the games that have theme data, aligned with cf_rows
+            cb_row = cb_sims[cb_of_user[i]]
+            cb_known = cb_row[bundle.cf_rows]
+            cand = np.union1d(bundle.ann_index.candidates(U[i]),
+                              bundle.cf_rows[top_candidates(cb_known, self.settings["CB_CANDIDATES"])])
+
+            cf_cand = cf.global_mean + b_u[i] + cf.item_biases[cand] + cf.factor_rows(cand).dot(U[i])
+            cb_cand = cb_row[cand].astype(np.float64)   # 0 for items without theme data
+
+            alpha = dynamic_alpha(len(ratings))
+            rows, scores = blend_candidates(cand, cf_cand, cb_cand, alpha, rated_rows[i], N)
+            recommendations = [(int(cf.item_ids[r]), float(s)) for r, s in zip(rows, scores)]
+            results.append((float(alpha), recommendations))
+        return results
+
+    def model_samples(self):
+        """Model size / load time and cache counters, read at scrape time."""
+        bundle = self.registry.current
+        samples = [
+            ("recommender_model_reloads_total", "counter", "Successful model loads", self.registry.reload_count, {}),
+        ]
+        if bundle is not None:
+            cf = bundle.cf
+            samples += [
+                ("recommender_model_items", "gauge", "Items in the CF model", cf.n_items, {}),
+                ("recommender_model_factors", "gauge", "Latent factors of the CF model", cf.n_factors, {}),
+                ("recommender_model_bytes", "gauge", "Size of the CF factor, bias and scale arrays",
+                 cf.nbytes, {"factor_dtype": cf.factor_dtype}),
+                ("recommender_cb_theme_bytes", "gauge", "Size of the CB theme flags",
+                 bundle.cb_theme_bytes, {"format": bundle.cb_index.theme_format}),
+                ("recommender_model_load_seconds", "gauge", "Time the active model took to load",
+                 bundle.load_seconds, {}),
+                ("recommender_model_loaded_timestamp_seconds", "gauge", "When the active model was loaded",
+                 bundle.loaded_at, {}),
+                ("recommender_model_info", "gauge", "Active model version", 1, {"version": bundle.version}),
+            ]
+        for cache_name, cache in (("response", self.response_cache), ("cb", self.cb_cache)):
+            stats = cache.stats()
+            samples += [
+                ("recommender_cache_hits_total", "counter", "Cache hits", stats["hits"], {"cache": cache_name}),
+                ("recommender_cache_misses_total", "counter", "Cache misses", stats["misses"],
+                 {"cache": cache_name}),
+                ("recommender_cache_entries", "gauge", "Entries in the cache", stats["size"], {"cache": cache_name}),
+            ]
+        return samples
@@ -0,0 +1,75 @@
+"""
+Tests for the ASGI app, driven with raw ASGI messages (no server needed).
+
+    python -m pytest test_asgi.py
+"""
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+from synthetic import make_model_data  # noqa: E402
+
+from asgi import create_app  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def model_data(tmp_path_factory):
+    out_dir = str(tmp_path_factory.mktemp("model_data"))
+    make_model_data(out_dir, n_games=300, n_cf_items=200, n_factors=8, n_themes=20, n_checkboxes=6,
+                    neighbours_k=0, seed=3)
+    return out_dir
+
+
+async def call(app, method, path, payload=None):
+    """One HTTP request through the ASGI callable; returns (status, decoded JSON body)."""
+    body = json.dumps(payload).encode() if payload is not None else b""
+    received = [{"type": "http.request", "body": body, "more_body": False}]
+    sent = []
+
+    async def receive():
+        return received.pop(0)
+
+    async def send(message):
+        sent.append(message)
+
+    await app({"type": "http", "method": method, "path": path}, receive, send)
+    return sent[0]["status"], json.loads(sent[1]["body"])
+
+
+def make_app(model_data):
+    return create_app({"MODEL_DATA_DIR": model_data, "CF_MODEL_PATH": None, "MODEL_WATCH_INTERVAL": 0,
+                       "RESPONSE_CACHE_SIZE": 0})
+
+
+def test_recommend_without_lifespan_events(model_data):
+    # uvicorn --lifespan off: no startup message, the batcher is created on the first request.
+    app = make_app(model_data)
+    num_checkboxes = app.service.registry.current.num_checkboxes
+    payload = {"ratings": [[int(app.service.registry.current.cf.item_ids[0]), 8]],
+               "preferences": [True] + [False] * (num_checkboxes - 1), "top_n": 5}
+
+    async def burst():
+        return await asyncio.gather(*(call(app, "POST", "/recommend", payload) for _ in range(8)))
+
+    results = asyncio.run(burst())
+    assert [status for status, _ in results] == [200] * 8
+    assert all(len(body["recommendations"]) == 5 for _, body in results)
+    assert app.batcher is not None
+
+
+def test_bad_request_in_a_burst_fails_alone(model_data):
+    app = make_app(model_data)
+    num_checkboxes = app.service.registry.current.num_checkboxes
+    good = {"ratings": [], "preferences": [False] * num_checkboxes, "top_n": 3}
+
+    async def burst():
+        return await asyncio.gather(call(app, "POST", "/recommend", good),
+                                    call(app, "POST", "/recommend", {**good, "ratings": [["x"]]}),
+                                    call(app, "POST", "/recommend", good))
+
+    statuses = [status for status, _ in asyncio.run(burst())]
+    assert statuses == [200, 400, 200]
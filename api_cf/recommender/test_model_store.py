@@ -0,0 +1,108 @@
+"""
+Tests for hot reloading through ModelRegistry on a synthetic model_data directory.
+
+    python -m pytest test_model_store.py
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, "..", "benchmarks"))
+sys.path.insert(0, os.path.join(HERE, "..", "offline-training"))
+from artifact import load_model_artifact, save_model_artifact  # noqa: E402
+from synthetic import make_model_data  # noqa: E402
+
+from model_store import resolve_version_dir  # noqa: E402
+from service import RecommenderService, settings_from_env  # noqa: E402
+
+
+@pytest.fixture
+def model_data(tmp_path):
+    out_dir = str(tmp_path / "model_data")
+    make_model_data(out_dir, n_games=300, n_cf_items=200, n_factors=8, n_themes=20, n_checkboxes=6,
+                    neighbours_k=0, seed=5)
+    return out_dir
+
+
+def publish(model_data, version, transform=lambda factors: factors):
+    """Publish a copy of the synthetic model as `version`, with transform applied to its factors."""
+    root = os.path.join(model_data, "cf_model")
+    first = sorted(name for name in os.listdir(root) if name[0].isdigit())[0]
+    arrays, manifest = load_model_artifact(os.path.join(root, first))
+    return save_model_artifact(root, transform(arrays["item_factors"]), arrays["item_biases"],
+                               manifest["global_mean"], arrays["item_ids"], manifest["reg_coeff"],
+                               version=version)
+
+
+def make_service(model_data):
+    settings = {**settings_from_env(), "MODEL_DATA_DIR": model_data, "CF_MODEL_PATH": None,
+                "MODEL_WATCH_INTERVAL": 0}
+    service = RecommenderService(settings)
+    service.registry.reload()
+    return service
+
+
+def score_once(service):
+    bundle = service.registry.current
+    users = [([[int(bundle.cf.item_ids[0]), 9]], [True] + [False] * (bundle.num_checkboxes - 1), 5)]
+    return service.recommend_users_cached(bundle, users)[0]
+
+
+def test_reload_swaps_bundle_and_clears_caches(model_data):
+    service = make_service(model_data)
+    first = service.registry.current
+    score_once(service)
+    assert len(service.response_cache) == 1 and len(service.cb_cache) == 1
+
+    publish(model_data, "v2", lambda factors: factors * 2)
+    second = service.registry.reload()
+
+    assert second.version == "v2" and service.registry.current is second
+    assert second.load_id != first.load_id
+    assert len(service.response_cache) == 0 and len(service.cb_cache) == 0
+    assert service.registry.reload_count == 2
+
+
+def test_broken_version_keeps_old_model(model_data):
+    service = make_service(model_data)
+    publish(model_data, "v2")
+    good = service.registry.reload()
+    expected = score_once(service)
+
+    publish(model_data, "v3", lambda factors: np.full_like(factors, np.nan))
+    with pytest.raises(ValueError, match="non-finite"):
+        service.registry.reload()
+
+    assert service.registry.current is good
+    assert service.registry.status()["last_error"].startswith("ValueError")
+    service.clear_caches()
+    assert score_once(service) == expected
+
+
+def test_watcher_skips_a_failed_version_until_a_newer_one(model_data):
+    service = make_service(model_data)
+    registry = service.registry
+    calls = []
+    loader = registry._loader
+
+    def counting_loader():
+        calls.append(resolve_version_dir(os.path.join(model_data, "cf_model")))
+        return loader()
+    registry._loader = counting_loader
+
+    publish(model_data, "v3", lambda factors: np.full_like(factors, np.nan))
+    registry.start_watching(0.01)
+    time.sleep(0.3)
+    assert len(calls) == 1                     # tried once, not on every tick
+    assert registry.current.version != "v3"
+
+    publish(model_data, "v4")
+    deadline = time.time() + 5
+    while registry.current.version != "v4" and time.time() < deadline:
+        time.sleep(0.01)
+    assert registry.current.version == "v4"
+    assert len(calls) == 2
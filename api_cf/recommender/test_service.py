@@ -0,0 +1,147 @@
+"""
+Tests for the scoring service on a small synthetic model (benchmarks/synthetic.py).
+
+    python -m pytest test_service.py
+"""
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "benchmarks"))
+from synthetic import make_model_data, make_payloads  # noqa: E402
+
+from app import create_app  # noqa: E402
+from hybrid import dynamic_alpha, normalise  # noqa: E402
+from service import RecommenderService, parse_user, settings_from_env  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def model_data(tmp_path_factory):
+    out_dir = str(tmp_path_factory.mktemp("model_data"))
+    make_model_data(out_dir, n_games=600, n_cf_items=400, n_factors=8, n_themes=30, n_checkboxes=10,
+                    neighbours_k=5, seed=7)
+    return out_dir
+
+
+def make_service(model_data, **overrides):
+    settings = {**settings_from_env(), "MODEL_DATA_DIR": model_data, "CF_MODEL_PATH": None,
+                "MODEL_WATCH_INTERVAL": 0, "RESPONSE_CACHE_SIZE": 0, "CB_CACHE_SIZE": 0, **overrides}
+    service = RecommenderService(settings)
+    service.registry.reload()
+    return service
+
+
+def per_user_reference(model_data, bundle, ratings, prefs, top_n):
+    """The original one-user /recommend: solve, score, map CB by BGGId, blend, exclude, sort."""
+    cf = bundle.cf
+    row_of = {int(item_id): row for row, item_id in enumerate(cf.item_ids)}
+    item_factors = np.asarray(cf.item_factors, dtype=np.float64)
+    known = [(row_of[item_id], rating) for item_id, rating in ratings if item_id in row_of]
+    if known:
+        rows = np.array([row for row, _ in known])
+        X = np.hstack((np.ones((len(rows), 1)), item_factors[rows]))
+        y = np.array([rating for _, rating in known]) - (cf.global_mean + cf.item_biases[rows])
+        reg = np.eye(X.shape[1])
+        reg[0, 0] = 0
+        theta = np.linalg.solve(X.T.dot(X) + cf.reg_coeff * reg, X.T.dot(y))
+        b_u, u = theta[0], theta[1:]
+    else:
+        b_u, u = 0.0, np.zeros(cf.n_factors)
+    cf_scores = cf.global_mean + b_u + cf.item_biases + item_factors.dot(u)
+
+    game_ids = pd.read_pickle(os.path.join(model_data, "games.pkl"))["BGGId"].to_numpy()
+    sims = bundle.cb_index.scores(prefs)
+    cb_scores = np.zeros(cf.n_items)
+    for game_row, game_id in enumerate(game_ids):
+        if int(game_id) in row_of:
+            cb_scores[row_of[int(game_id)]] = sims[game_row]
+
+    alpha = dynamic_alpha(len(ratings))
+    hybrid = alpha * normalise(cf_scores) + (1 - alpha) * normalise(cb_scores)
+    for item_id, _ in ratings:
+        if item_id in row_of:
+            hybrid[row_of[item_id]] = -np.inf
+    top_idx = np.argsort(-hybrid, kind="stable")[:top_n]
+    return alpha, [(int(cf.item_ids[i]), float(hybrid[i])) for i in top_idx]
+
+
+def test_batch_matches_per_user_path(model_data):
+    service = make_service(model_data, FACTOR_DTYPE="float64")
+    bundle = service.registry.current
+    payloads = make_payloads(60, bundle.cf.item_ids, bundle.num_checkboxes, median_ratings=8, seed=3)
+    users = [parse_user(p, bundle.num_checkboxes) for p in payloads]
+
+    batched = service.recommend_users(bundle, users)
+    singles = [service.recommend_users(bundle, [user])[0] for user in users]
+    for (ratings, prefs, top_n), batch_result, single_result in zip(users, batched, singles):
+        alpha, expected = per_user_reference(model_data, bundle, ratings, prefs, top_n)
+        for got_alpha, got in (batch_result, single_result):
+            assert got_alpha == pytest.approx(alpha)
+            assert [item_id for item_id, _ in got] == [item_id for item_id, _ in expected]
+            np.testing.assert_allclose([s for _, s in got], [s for _, s in expected], rtol=1e-6, atol=1e-9)
+
+
+@pytest.mark.parametrize("retrieval_mode", ["exact", "ivf"])
+def test_top_n_beyond_unrated_items(model_data, retrieval_mode):
+    service = make_service(model_data, RETRIEVAL_MODE=retrieval_mode, IVF_N_PROBE=1000)
+    bundle = service.registry.current
+    rated = bundle.cf.item_ids[:50].tolist()
+    users = [([[int(item_id), 7.0] for item_id in rated], [True] + [False] * (bundle.num_checkboxes - 1), 5000),
+             ([], [False] * bundle.num_checkboxes, 5000)]
+
+    (_, warm), (_, cold) = service.recommend_users(bundle, users)
+
+    assert len(warm) == bundle.cf.n_items - len(rated)
+    assert not set(rated) & {item_id for item_id, _ in warm}
+    assert len(cold) == bundle.cf.n_items
+    assert all(np.isfinite(score) for _, score in warm + cold)
+
+
+def test_recommend_endpoint_returns_valid_json_for_large_top_n(model_data):
+    app = create_app({"MODEL_DATA_DIR": model_data, "CF_MODEL_PATH": None, "MODEL_WATCH_INTERVAL": 0},
+                     start_watcher=False)
+    bundle = app.extensions["recommender"].registry.current
+    rated = bundle.cf.item_ids[:3].tolist()
+    response = app.test_client().post("/recommend", json={
+        "ratings": [[int(item_id), 8] for item_id in rated],
+        "preferences": [False] * bundle.num_checkboxes,
+        "top_n": 5000,
+    })
+
+    assert response.status_code == 200
+    body = json.loads(response.get_data(as_text=True), parse_constant=lambda c: pytest.fail(f"{c} in response"))
+    assert len(body["recommendations"]) == bundle.cf.n_items - len(rated)
+
+
+def test_recommend_top_n_dequantises_int8_factors(model_data):
+    from fold_in import recommend_top_n
+    from mips_index import IVFIndex
+    from model_store import convert_factors
+
+    cf = convert_factors(make_service(model_data).registry.current.cf, "int8")
+    dense = cf.factor_rows()
+    u = np.random.default_rng(0).normal(size=cf.n_factors)
+    rated = set(cf.item_ids[:5].tolist())
+    index = IVFIndex(dense, cf.item_biases, n_probe=10 ** 6)   # every list: same result as exact
+
+    expected = recommend_top_n(0.1, u, rated, dense, cf.item_biases, cf.global_mean, cf.item_ids, N=20)
+    for ann in (None, index):
+        got = recommend_top_n(0.1, u, rated, cf.item_factors, cf.item_biases, cf.global_mean, cf.item_ids,
+                              N=20, index=ann, item_scales=cf.item_scales)
+        assert [item_id for item_id, _ in got] == [item_id for item_id, _ in expected]
+        np.testing.assert_allclose([s for _, s in got], [s for _, s in expected], rtol=1e-5)
+    rows, _ = index.search(u, cf.item_factors, cf.item_biases, 20, item_scales=cf.item_scales)
+    exact = np.argsort(-(cf.item_biases + dense.dot(u)), kind="stable")[:20]
+    assert rows.tolist() == exact.tolist()
+
+
+@pytest.mark.parametrize("body", ["null", "[]", '{"users": {"a": 1}}', '{"users": [null]}', "{"])
+def test_recommend_batch_rejects_malformed_bodies(model_data, body):
+    app = create_app({"MODEL_DATA_DIR": model_data, "CF_MODEL_PATH": None, "MODEL_WATCH_INTERVAL": 0},
+                     start_watcher=False)
+    response = app.test_client().post("/recommend/batch", data=body, content_type="application/json")
+    assert response.status_code == 400
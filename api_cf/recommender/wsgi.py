@@ -0,0 +1,13 @@
+# recommender_service/wsgi.py
+"""
+WSGI entrypoint: gunicorn -c gunicorn.conf.py wsgi:app
+
+With preload_app the model is loaded here once, in the gunicorn master; the
+workers are forked afterwards and share its arrays (the CF artifact is
+memory-mapped, the CB index pages stay copy-on-write). The model watcher is
+started per worker in gunicorn.conf.py's post_fork, since threads do not
+survive fork.
+"""
+from app import create_app
+
+app = create_app(start_watcher=False)